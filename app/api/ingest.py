@@ -0,0 +1,127 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field, field_validator
+
+from app.core.config import settings
+from app.db.ingest import BUFFERS, IngestBacklogFull, accepted_range, ingest_stats
+
+MAX_INGEST_BATCH = 10_000
+# column ranges (int / bigint); asyncpg can't encode values outside them for COPY
+INT4_MAX = 2**31 - 1
+INT8_MAX = 2**63 - 1
+
+
+def _postgres_backend() -> None:
+    # the snapshot backend opens no pools and starts no flush loops: nothing would write the rows
+    if settings.query_backend == "snapshot":
+        raise HTTPException(status_code=503, detail="Ingestion needs QUERY_BACKEND=postgres")
+
+
+router = APIRouter(prefix="/ingest", dependencies=[Depends(_postgres_backend)])
+
+
+def _checked_ts(ts: datetime) -> datetime:
+    # naive timestamps are taken as UTC
+    ts = ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+    low, high = accepted_range()
+    if not low <= ts < high:
+        raise ValueError(f"must be in [{low.isoformat()}, {high.isoformat()})")
+    return ts
+
+
+class WebEventIn(BaseModel):
+    event_ts: datetime
+    session_id: UUID
+    customer_id: int | None = Field(default=None, ge=-INT8_MAX - 1, le=INT8_MAX)
+    event_type: Literal["session_start", "product_view", "add_to_cart", "checkout_start", "purchase"]
+    product_id: int | None = Field(default=None, ge=-INT8_MAX - 1, le=INT8_MAX)
+    channel: Literal["web", "mobile"]
+    utm_source: str | None = None
+    utm_campaign: str | None = None
+
+    @field_validator("event_ts")
+    @classmethod
+    def _in_range(cls, ts: datetime) -> datetime:
+        return _checked_ts(ts)
+
+
+class OrderItemIn(BaseModel):
+    product_id: int = Field(ge=-INT8_MAX - 1, le=INT8_MAX)
+    quantity: int = Field(gt=0, le=INT4_MAX)
+    unit_price: Decimal = Field(max_digits=12, decimal_places=2)
+    discount: Decimal = Field(default=Decimal("0"), max_digits=12, decimal_places=2)
+
+
+class OrderIn(BaseModel):
+    customer_id: int = Field(ge=-INT8_MAX - 1, le=INT8_MAX)
+    order_ts: datetime
+    status: Literal["placed", "paid", "shipped", "delivered", "cancelled", "refunded"]
+    channel: Literal["web", "mobile", "marketplace"]
+    currency: str = "USD"
+    shipping_cost: Decimal = Field(default=Decimal("0"), max_digits=12, decimal_places=2)
+    items: list[OrderItemIn] = Field(min_length=1)
+
+    @field_validator("order_ts")
+    @classmethod
+    def _in_range(cls, ts: datetime) -> datetime:
+        return _checked_ts(ts)
+
+
+class WebEventBatch(BaseModel):
+    events: list[WebEventIn] = Field(min_length=1, max_length=MAX_INGEST_BATCH)
+
+
+class OrderBatch(BaseModel):
+    orders: list[OrderIn] = Field(min_length=1, max_length=MAX_INGEST_BATCH)
+
+
+async def _buffer(table: str, rows: list[tuple]) -> dict:
+    buf = BUFFERS[table]
+    try:
+        await buf.add(rows)
+    except IngestBacklogFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"accepted": len(rows), "pending": buf.pending}
+
+
+@router.post("/web_events", status_code=202)
+async def ingest_web_events(body: WebEventBatch):
+    """Buffer clickstream events; they are COPYed into web_events within INGEST_FLUSH_INTERVAL_S."""
+    rows = [
+        (
+            e.event_ts,
+            e.session_id,
+            e.customer_id,
+            e.event_type,
+            e.product_id,
+            e.channel,
+            e.utm_source,
+            e.utm_campaign,
+        )
+        for e in body.events
+    ]
+    return await _buffer("web_events", rows)
+
+
+@router.post("/orders", status_code=202)
+async def ingest_orders(body: OrderBatch):
+    """Buffer orders with their items; order ids are assigned when they are COPYed."""
+    rows = [
+        (
+            (o.customer_id, o.order_ts, o.status, o.channel, o.currency, o.shipping_cost),
+            [(i.product_id, i.quantity, i.unit_price, i.discount) for i in o.items],
+        )
+        for o in body.orders
+    ]
+    return await _buffer("orders", rows)
+
+
+@router.get("/stats")
+async def ingest_stats_route():
+    return ingest_stats()
@@ -1,15 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+import hashlib
+import logging
+from collections.abc import AsyncIterator, Awaitable
+from contextlib import AsyncExitStack
+from functools import partial
+from typing import Any, TypeVar
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
 import asyncpg
 
-from app.db.pool import get_pool
+from app.core import metrics
+from app.core.config import settings
+from app.db.admission import GATES, Overloaded, admission_stats, admitted_connection
+from app.db.pool import SYSTEM_POOL, get_pool, pool_stats
+from app.db.replicas import replica_stats
+from app.queries.approx import APPROX_QUERIES, EXACT
+from app.queries.batch import run_batch
+from app.queries.columnar import MEDIA_TYPE as COLUMNAR_MEDIA_TYPE, accepts_columnar, encode_columnar
+from app.queries.cache import result_cache
+from app.queries.encoding import dumps, encode_payload, json_result
 from app.queries.registry import QUERIES
-from app.queries.runner import run_curated_query
+from app.queries.runner import (
+    UNVERSIONED,
+    bind_params,
+    caught_up,
+    execute_curated_query,
+    in_flight,
+    page_curated_query,
+    run_snapshot_query,
+    stream_curated_query,
+)
+from app.queries.shared import column_types
+from app.queries.snapshot import get_snapshot
+from app.queries.store import result_store
+from app.queries.slowlog import slow_log
+from app.queries.warmer import cache_warmer
+
+log = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 10_000
+MAX_BATCH_SIZE = 20
+# Results with more rows than this are encoded on a worker thread, so one large result
+# doesn't hold up every other request on the event loop while it is serialized.
+ENCODE_IN_THREAD_ROWS = 5_000
+
+# Results: clients may keep them but must revalidate (cheap: ETag check, no SQL).
+# The query list only changes with a deploy.
+RESULT_CACHE_CONTROL = "no-cache"
+LIST_CACHE_CONTROL = f"public, max-age={settings.query_list_max_age_s}"
+
+# nginx's "client closed request": the status of queries cancelled because the client left
+CLIENT_CLOSED_REQUEST = 499
 
 router = APIRouter()
 
+T = TypeVar("T")
+
 
 async def db_conn() -> asyncpg.Connection:
-    pool = await get_pool()
+    pool = await get_pool(SYSTEM_POOL)
     async with pool.acquire() as conn:
         yield conn
 
@@ -20,32 +73,297 @@ async def health(conn: asyncpg.Connection = Depends(db_conn)):
     return {"ok": True, "db": v}
 
 
-@router.get("/queries")
-async def list_queries():
+@router.get("/stats")
+async def stats():
     return {
-        "queries": [
+        "cache": result_cache.stats(),
+        "store": await result_store.stats(),
+        "admission": admission_stats(),
+        "single_flight": in_flight.stats(),
+        "nodes": replica_stats(),
+        "warmer": cache_warmer.stats(),
+    }
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    for name, p in pool_stats().items():
+        metrics.POOL_CONNECTIONS.set((name, "in_use"), p["size"] - p["idle"])
+        metrics.POOL_CONNECTIONS.set((name, "idle"), p["idle"])
+    for name, gate in GATES.items():
+        metrics.ADMISSION_QUEUE_DEPTH.set((name,), gate.waiting)
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@router.get("/debug/slow")
+async def slow_queries(plans: bool = Query(default=False, description="include the full EXPLAIN plan trees")):
+    """Recent slow curated queries, newest first, with the plan captured for each param shape."""
+    return slow_log.snapshot(include_plans=plans)
+
+
+async def _result_response(
+    query_id: str, payload: dict, headers: dict[str, str] | None = None, *, columnar: bool = False
+) -> Response:
+    if payload.pop(UNVERSIONED, False) and headers:
+        # read on a replica behind the data version: the tag would vouch for rows it may not have
+        headers = {k: v for k, v in headers.items() if k != "ETag"}
+    # Encoded here rather than by FastAPI (no jsonable_encoder pass over every row) so encode
+    # time and size can be measured; the body goes out pre-encoded, as JSON or column-major.
+    if columnar:
+        encode, media_type = encode_columnar, COLUMNAR_MEDIA_TYPE
+    else:
+        types = column_types(query_id, payload.get("columns", []))
+        encode, media_type = partial(encode_payload, types=types), "application/json"
+    with metrics.timed(query_id, "encode"):
+        if payload.get("row_count", 0) > ENCODE_IN_THREAD_ROWS:
+            body = await asyncio.to_thread(encode, payload)
+        else:
+            body = encode(payload)
+    metrics.QUERY_RESPONSE_BYTES.observe((query_id,), len(body))
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def _etag(*parts: object) -> str:
+    # Weak: the same representation modulo transfer encoding (e.g. gzip in front of the app)
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+async def _data_version() -> str:
+    if settings.query_backend == "snapshot":
+        return get_snapshot().version
+    # Usually answered from the cache's last read (at most DATA_VERSION_REFRESH_S old),
+    # so a revalidation doesn't touch the database at all.
+    return await result_cache.data_version()
+
+
+def _deadline(deadline_ms: int | None) -> float | None:
+    # X-Deadline-Ms: the caller's budget for the whole request, as event loop time
+    return None if deadline_ms is None else asyncio.get_running_loop().time() + deadline_ms / 1000
+
+
+async def _client_gone(request: Request) -> None:
+    # Returns once the client disconnects; only start it once the request body has been read.
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _cancel_and_wait(task: asyncio.Future) -> None:
+    # Waits `task` out even if we are cancelled meanwhile: anyio cancel scopes (Starlette's
+    # disconnect listener) cancel every await until the scope exits, and a task still running
+    # would be using the generator or connection the caller is about to close.
+    task.cancel()
+    cancelled = False
+    while not task.done():
+        try:
+            await asyncio.wait((task,))
+        except asyncio.CancelledError:
+            cancelled = True
+    if cancelled:
+        raise asyncio.CancelledError()
+
+
+async def _cancel_unless_done(task: asyncio.Future, gone: asyncio.Task, deadline: float | None) -> str | None:
+    """None once `task` is done; if the client goes away or the deadline passes first, the
+    reason ("disconnect"/"deadline") after cancelling `task` and waiting for it.
+
+    A cancelled asyncpg fetch sends Postgres a cancel request, so the statement stops and its
+    connection goes back to the pool before this returns; a coalesced execution (SingleFlight)
+    only stops once no request is waiting for it.
+    """
+    timeout = None if deadline is None else max(0.0, deadline - asyncio.get_running_loop().time())
+    try:
+        await asyncio.wait((task, gone), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        await _cancel_and_wait(task)
+        raise
+    if task.done():
+        return None
+    await _cancel_and_wait(task)
+    return "disconnect" if gone.done() else "deadline"
+
+
+async def _guarded(request: Request, query_id: str, deadline: float | None, work: Awaitable[T]) -> T:
+    """work's result; ClientDisconnect or TimeoutError (deadline) if it was cancelled first."""
+    task = asyncio.ensure_future(work)
+    gone = asyncio.create_task(_client_gone(request))
+    try:
+        reason = await _cancel_unless_done(task, gone, deadline)
+    finally:
+        gone.cancel()
+    if reason is None:
+        return task.result()
+    metrics.QUERY_CANCELLED.inc((query_id, reason))
+    if reason == "disconnect":
+        raise ClientDisconnect()
+    raise TimeoutError()
+
+
+async def _guarded_stream(
+    request: Request, query_id: str | None, deadline: float | None, chunks: AsyncIterator[bytes]
+) -> AsyncIterator[bytes]:
+    # `chunks`, ended early (without its trailer) if the client goes away or the deadline
+    # passes; the chunk being produced is cancelled as in _guarded. Starlette alone only
+    # notices a disconnect when a write fails, i.e. not while a statement is still running.
+    # query_id None: `chunks` counts its own cancellations.
+    gone = asyncio.create_task(_client_gone(request))
+    try:
+        while True:
+            step = asyncio.ensure_future(anext(chunks))
+            reason = await _cancel_unless_done(step, gone, deadline)
+            if reason is not None:
+                if query_id is not None:
+                    metrics.QUERY_CANCELLED.inc((query_id, reason))
+                return
+            try:
+                chunk = step.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        gone.cancel()
+        await chunks.aclose()
+
+
+_query_list: tuple[bytes, str] | None = None
+
+
+def _query_list_body() -> tuple[bytes, str]:
+    global _query_list
+    if _query_list is None:
+        body = dumps(
             {
-                "id": q.id,
-                "title": q.title,
-                "description": q.description,
-                "params": q.params,
-                "chart": q.chart,
+                "queries": [
+                    {
+                        "id": q.id,
+                        "title": q.title,
+                        "description": q.description,
+                        "params": q.params,
+                        "chart": q.chart,
+                        "approx": q.id in APPROX_QUERIES,
+                        "base": q.base,
+                    }
+                    for q in QUERIES.values()
+                ]
             }
-            for q in QUERIES.values()
-        ]
-    }
+        ).encode()
+        _query_list = (body, _etag(hashlib.sha256(body).hexdigest()))
+    return _query_list
+
+
+@router.get("/queries")
+async def list_queries(if_none_match: str | None = Header(default=None)):
+    body, etag = _query_list_body()
+    headers = {"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL}
+    if _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class BatchItem(BaseModel):
+    query_id: str
+    params: dict[str, str] = {}
+
+
+class BatchRequest(BaseModel):
+    queries: list[BatchItem] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+async def _stream_batch(items: list[tuple[str, dict]], deadline: float | None):
+    async for outcome in run_batch(items, deadline=deadline):
+        if not outcome["ok"]:
+            # failed items may carry an unknown query_id; keep it out of metric labels
+            yield (dumps(outcome) + "\n").encode()
+            continue
+        try:
+            with metrics.timed(outcome["query_id"], "encode"):
+                types = column_types(outcome["query_id"], outcome["result"].get("columns", []))
+                line = encode_payload({**outcome, "result": json_result(outcome["result"], types)}) + b"\n"
+        except Exception as e:
+            log.exception("encoding batch item %s (%s) failed", outcome["index"], outcome["query_id"])
+            failed = {"index": outcome["index"], "query_id": outcome["query_id"], "ok": False, "status": 500}
+            yield (dumps({**failed, "error": f"{type(e).__name__}: {e}"}) + "\n").encode()
+            continue
+        metrics.QUERY_RESPONSE_BYTES.observe((outcome["query_id"],), len(line))
+        yield line
+
+
+@router.post("/query/batch")
+async def run_query_batch(
+    body: BatchRequest,
+    request: Request,
+    x_deadline_ms: int | None = Header(default=None, gt=0, description="ms until unfinished items get a 504"),
+):
+    """Run several curated queries concurrently.
+
+    Streams NDJSON, one line per query in completion order:
+    {"index", "query_id", "ok", "result"} or {"index", "query_id", "ok": false, "status", "error"}.
+    Queries still running when the client disconnects are cancelled.
+    """
+    items = [(item.query_id, item.params) for item in body.queries]
+    # no deadline on the stream itself: run_batch reports expired items as 504 lines
+    chunks = _guarded_stream(request, None, None, _stream_batch(items, _deadline(x_deadline_ms)))
+    return StreamingResponse(chunks, media_type="application/x-ndjson")
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """A stream over an admitted connection that gives the admission back however it ends.
+
+    The client may be gone before the first chunk: Starlette then never starts the body (a
+    send raising OSError, or the disconnect listener cancelling it), so neither the body's
+    own cleanup nor a background task would run.
+    """
+
+    def __init__(self, content: AsyncIterator[bytes], admission: AsyncExitStack, **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self.admission = admission
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # the body first, so a started stream ends its statement before the connection goes back
+            await self.body_iterator.aclose()
+            await self.admission.aclose()
+
+
+async def _stream_rows(admission: AsyncExitStack, conn: asyncpg.Connection, query_id: str, values: list):
+    # Admission happens before the response starts (so it can still be a 429); the connection
+    # goes back once the last row is sent, or when AdmittedStreamingResponse is done.
+    sent = 0
+    async with admission:
+        async for chunk in stream_curated_query(conn, query_id, values):
+            sent += len(chunk)
+            yield chunk
+    metrics.QUERY_RESPONSE_BYTES.observe((query_id,), sent)
 
 
 @router.get("/query/{query_id}")
 async def run_query(
     query_id: str,
-    conn: asyncpg.Connection = Depends(db_conn),
+    request: Request,
     # common params (others are validated in runner)
     start_date: str | None = Query(default=None, description="YYYY-MM-DD"),
     end_date: str | None = Query(default=None, description="YYYY-MM-DD"),
     start_month: str | None = Query(default=None, description="YYYY-MM-01"),
     end_month: str | None = Query(default=None, description="YYYY-MM-01"),
+    # result delivery
+    stream: bool = Query(default=False, description="NDJSON: header line, one line per row, row_count trailer"),
+    page_size: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE, description="keyset page size"),
+    cursor: str | None = Query(default=None, description="next_cursor from the previous page"),
+    approx: bool = Query(default=False, description="approximate answer where supported (error bound in 'approx')"),
+    if_none_match: str | None = Header(default=None),
+    accept: str | None = Header(default=None),
+    x_deadline_ms: int | None = Header(default=None, gt=0, description="ms the caller waits; then cancelled (504)"),
 ):
+    deadline = _deadline(x_deadline_ms)
     params = {
         k: v
         for k, v in {
@@ -58,8 +376,68 @@ async def run_query(
     }
 
     try:
-        return await run_curated_query(conn, query_id, params)
+        values = bind_params(query_id, params)
+        if cursor is not None and page_size is None:
+            raise ValueError("cursor requires page_size")
+        if approx and (stream or page_size is not None):
+            raise ValueError("approx can't be combined with stream or page_size")
+
+        # Column-major binary instead of JSON when asked for (streams are always NDJSON)
+        columnar = not stream and accepts_columnar(accept)
+
+        # Same query, normalized params, delivery mode and data version => same body,
+        # so a matching If-None-Match is answered before admission or any SQL.
+        etag = _etag(query_id, *values, stream, page_size, cursor, approx, columnar, await _data_version())
+        headers = {"ETag": etag, "Cache-Control": RESULT_CACHE_CONTROL, "Vary": "Accept"}
+        if _matches(if_none_match, etag):
+            metrics.QUERY_NOT_MODIFIED.inc((query_id,))
+            return Response(status_code=304, headers=headers)
+
+        if settings.query_backend == "snapshot":
+            if stream or page_size is not None:
+                raise ValueError("stream and page_size need QUERY_BACKEND=postgres")
+            payload = await _guarded(request, query_id, deadline, run_snapshot_query(query_id, params))
+            return await _result_response(
+                query_id, {**payload, "approx": EXACT} if approx else payload, headers, columnar=columnar
+            )
+
+        if stream:
+            admission = AsyncExitStack()
+            conn = await _guarded(
+                request, query_id, deadline, admission.enter_async_context(admitted_connection(query_id))
+            )
+            try:
+                if not await caught_up(conn):
+                    # a replica behind the data version: no tag vouching for its rows
+                    del headers["ETag"]
+            except BaseException:
+                await admission.aclose()
+                raise
+            chunks = _guarded_stream(request, query_id, deadline, _stream_rows(admission, conn, query_id, values))
+            return AdmittedStreamingResponse(chunks, admission, media_type="application/x-ndjson", headers=headers)
+
+        if page_size is not None:
+
+            async def page() -> dict:
+                async with admitted_connection(query_id) as conn:
+                    return await page_curated_query(conn, query_id, params, page_size, cursor)
+
+            payload = await _guarded(request, query_id, deadline, page())
+        else:
+            work = execute_curated_query(query_id, params, approx=approx)
+            payload = await _guarded(request, query_id, deadline, work)
+        return await _result_response(query_id, payload, headers, columnar=columnar)
+    except ClientDisconnect:
+        # nobody is left to read it
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except KeyError:
         raise HTTPException(status_code=404, detail="Unknown query")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Deadline exceeded (X-Deadline-Ms)")
+    except asyncpg.QueryCanceledError:
+        metrics.QUERY_CANCELLED.inc((query_id, "statement_timeout"))
+        raise HTTPException(status_code=504, detail="Query exceeded its statement_timeout")
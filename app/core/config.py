@@ -10,5 +10,89 @@ class Settings(BaseModel):
     app_env: str = os.getenv("APP_ENV", "local")
     app_port: int = int(os.getenv("APP_PORT", "8000"))
 
+    # Read replicas for the curated (read-only) queries, comma-separated DSNs. Each gets its
+    # own per-cost-class pools; queries go to the least busy healthy replica, or the primary
+    # (DATABASE_URL) when none is. Writes, watermarks and maintenance stay on the primary.
+    replica_database_urls: list[str] = [
+        dsn.strip() for dsn in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if dsn.strip()
+    ]
+    # Health checks eject unreachable replicas (or ones lagging more than REPLICA_MAX_LAG_S,
+    # 0 = no limit) and readmit them once they pass again
+    replica_health_interval_s: float = float(os.getenv("REPLICA_HEALTH_INTERVAL_S", "5"))
+    replica_health_timeout_s: float = float(os.getenv("REPLICA_HEALTH_TIMEOUT_S", "2"))
+    replica_max_lag_s: float = float(os.getenv("REPLICA_MAX_LAG_S", "30"))
+
+    # Result cache for curated queries (0 entries disables it)
+    result_cache_max_entries: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+    result_cache_ttl_s: float = float(os.getenv("RESULT_CACHE_TTL_S", "300"))
+    # On-disk result store under the cache, shared by all workers on the host and kept across
+    # restarts (SQLite; empty path disables), LRU-evicted beyond RESULT_STORE_MAX_MB. Entries
+    # expire with the data version; RESULT_STORE_TTL_S only caps their age
+    result_store_path: str = os.getenv("RESULT_STORE_PATH", "data/result_store.sqlite")
+    result_store_max_mb: float = float(os.getenv("RESULT_STORE_MAX_MB", "256"))
+    result_store_ttl_s: float = float(os.getenv("RESULT_STORE_TTL_S", "86400"))
+    # How often the data watermark is re-read from Postgres
+    data_version_refresh_s: float = float(os.getenv("DATA_VERSION_REFRESH_S", "5"))
+    # Cache warming: every query over the dashboard's default windows plus CACHE_WARM_WINDOWS
+    # (e.g. "cohort_retention:12m,aov_trend:30d"), at startup, every CACHE_WARM_INTERVAL_S
+    # (0 disables warming) and when the data version moves; at most CACHE_WARM_MAX_SHARE of
+    # each cost class's pool at once (where that rounds to none, only while the class is idle)
+    cache_warm_interval_s: float = float(os.getenv("CACHE_WARM_INTERVAL_S", "240"))
+    cache_warm_windows: str = os.getenv("CACHE_WARM_WINDOWS", "cohort_retention:12m,ltv_by_cohort:12m")
+    cache_warm_max_share: float = float(os.getenv("CACHE_WARM_MAX_SHARE", "0.25"))
+    # Identical curated queries in flight at once share one execution (0 disables)
+    single_flight: bool = os.getenv("SINGLE_FLIGHT", "1") != "0"
+    # Cache-Control max-age for /api/queries (results themselves are always revalidated via ETag)
+    query_list_max_age_s: int = int(os.getenv("QUERY_LIST_MAX_AGE_S", "300"))
+
+    # Where curated queries run: "postgres", or "snapshot" for the NumPy engine over the
+    # columnar snapshot in SNAPSHOT_DIR (python -m scripts.export_snapshot); no database needed
+    query_backend: str = os.getenv("QUERY_BACKEND", "postgres")
+    snapshot_dir: str = os.getenv("SNAPSHOT_DIR", "data/snapshot")
+
+    # Incremental rollup refresh from the order change log (0 disables the background loop)
+    rollup_refresh_interval_s: float = float(os.getenv("ROLLUP_REFRESH_INTERVAL_S", "30"))
+
+    # Monthly partitions of orders/web_events: created this many months ahead, and (if > 0)
+    # partitions older than PARTITION_RETAIN_MONTHS are detached. Keep retention longer than
+    # any window the curated queries read; detached months drop out of them.
+    partition_maintenance_interval_s: float = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_S", "3600"))
+    partition_months_ahead: int = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+    partition_retain_months: int = int(os.getenv("PARTITION_RETAIN_MONTHS", "0"))
+
+    # /api/query/batch: queries allowed to run at once across all batches (keep below pool max_size)
+    batch_max_concurrency: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+    # Ingestion (POST /api/ingest/*): per table, an in-memory buffer flushed with COPY once it
+    # holds INGEST_FLUSH_ROWS rows or its oldest row is INGEST_FLUSH_INTERVAL_S old, on its own
+    # pool (never the curated or system pools). Posts wait up to INGEST_WAIT_S while
+    # INGEST_BUFFER_MAX_ROWS rows are pending, then get 429.
+    ingest_pool_size: int = int(os.getenv("INGEST_POOL_SIZE", "2"))
+    ingest_buffer_max_rows: int = int(os.getenv("INGEST_BUFFER_MAX_ROWS", "200000"))
+    ingest_flush_rows: int = int(os.getenv("INGEST_FLUSH_ROWS", "20000"))
+    ingest_flush_interval_s: float = float(os.getenv("INGEST_FLUSH_INTERVAL_S", "1"))
+    ingest_wait_s: float = float(os.getenv("INGEST_WAIT_S", "2"))
+    # event_ts/order_ts may be at most this old (and not in a detached month), and no later than
+    # the end of next month; other rows get 422, or are rejected if they age out while buffered
+    ingest_max_age_days: int = int(os.getenv("INGEST_MAX_AGE_DAYS", "35"))
+
+    # Pool isolation / admission control per query cost class (QueryDef.cost_class).
+    # Each class gets its own pool (= concurrency budget), a bounded wait queue and a
+    # statement_timeout; the system pool serves health checks and maintenance.
+    light_pool_size: int = int(os.getenv("LIGHT_POOL_SIZE", "6"))
+    light_queue_max: int = int(os.getenv("LIGHT_QUEUE_MAX", "32"))
+    light_statement_timeout_ms: int = int(os.getenv("LIGHT_STATEMENT_TIMEOUT_MS", "10000"))
+    heavy_pool_size: int = int(os.getenv("HEAVY_POOL_SIZE", "2"))
+    heavy_queue_max: int = int(os.getenv("HEAVY_QUEUE_MAX", "8"))
+    heavy_statement_timeout_ms: int = int(os.getenv("HEAVY_STATEMENT_TIMEOUT_MS", "60000"))
+    system_pool_size: int = int(os.getenv("SYSTEM_POOL_SIZE", "2"))
+    # longest a queued request waits for a connection before it is shed with 429
+    admission_wait_timeout_s: float = float(os.getenv("ADMISSION_WAIT_TIMEOUT_S", "10"))
+
+    # Curated queries whose execution exceeds this get one EXPLAIN (ANALYZE, BUFFERS) per
+    # (query, param shape), kept in a ring buffer at /api/debug/slow (0 disables)
+    slow_query_ms: float = float(os.getenv("SLOW_QUERY_MS", "1000"))
+    slow_query_log_size: int = int(os.getenv("SLOW_QUERY_LOG_SIZE", "50"))
+
 
 settings = Settings()
@@ -0,0 +1,174 @@
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator
+
+# Prometheus text exposition (format 0.0.4), hand-rolled: a histogram observation is a
+# bisect plus three increments, cheap enough to stay on for every request.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...], buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # per label set: [per-bucket counts (last = +Inf), sum, count]
+        self._series: dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        s = self._series.get(labels)
+        if s is None:
+            s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        s[0][bisect_left(self.buckets, value)] += 1
+        s[1] += value
+        s[2] += 1
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, n) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, c in zip((*self.buckets, math.inf), counts):
+                cumulative += c
+                le = 'le="' + _num(bound) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, v in sorted(self._values.items()):
+            out.append(f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}")
+        return out
+
+
+class Gauge(Counter):
+    """Point-in-time values, set at scrape time."""
+
+    def set(self, labels: Labels, value: float) -> None:
+        self._values[labels] = value
+
+    def render(self) -> list[str]:
+        out = super().render()
+        out[1] = f"# TYPE {self.name} gauge"
+        return out
+
+
+QUERY_PHASE_SECONDS = Histogram(
+    "warehouse_query_phase_seconds",
+    "Time per request phase: acquire (admission queue + pool), execute (conn.fetch), "
+    "encode (JSON), stream (whole NDJSON cursor read).",
+    ("query_id", "phase"),
+    LATENCY_BUCKETS_S,
+)
+QUERY_ROWS = Histogram("warehouse_query_rows", "Rows returned per curated query result.", ("query_id",), ROW_BUCKETS)
+QUERY_RESPONSE_BYTES = Histogram(
+    "warehouse_query_response_bytes", "Serialized response size per curated query result.", ("query_id",), BYTE_BUCKETS
+)
+QUERY_CACHE = Counter(
+    "warehouse_query_cache_total", "Result cache lookups by outcome (hit/store_hit/miss/replica_behind).", ("query_id", "result")
+)
+QUERY_NOT_MODIFIED = Counter(
+    "warehouse_query_not_modified_total", "Requests answered 304 from If-None-Match, no SQL run.", ("query_id",)
+)
+QUERY_COALESCED = Counter(
+    "warehouse_query_coalesced_total", "Requests that shared an identical in-flight query's execution.", ("query_id",)
+)
+QUERY_SHARED = Counter(
+    "warehouse_query_shared_total", "Curated results computed in a group that read its base relation once.", ("query_id",)
+)
+QUERY_CANCELLED = Counter(
+    "warehouse_query_cancelled_total",
+    "Curated query requests that ended before their result, by reason (disconnect/deadline/statement_timeout).",
+    ("query_id", "reason"),
+)
+POOL_CONNECTIONS = Gauge(
+    "warehouse_pool_connections", "Open pool connections by state (in_use/idle).", ("pool", "state")
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "warehouse_admission_queue_depth", "Requests waiting for a connection, per cost class.", ("cost_class",)
+)
+INGEST_ROWS = Counter(
+    "warehouse_ingest_rows_total", "Ingested rows by table and outcome (ingested/rejected).", ("table", "outcome")
+)
+INGEST_FLUSH_SECONDS = Histogram(
+    "warehouse_ingest_flush_seconds", "Time per ingest flush (COPY, one transaction).", ("table",), LATENCY_BUCKETS_S
+)
+INGEST_BUFFER_ROWS = Gauge("warehouse_ingest_buffer_rows", "Rows accepted but not yet committed.", ("table",))
+REPLICA_HEALTHY = Gauge("warehouse_replica_healthy", "1 while a replica is in rotation, 0 once ejected.", ("node",))
+REPLICA_ROUTED = Counter(
+    "warehouse_replica_routed_total", "Curated queries routed per node and cost class.", ("node", "cost_class")
+)
+ADMISSION_SHED = Counter("warehouse_admission_shed_total", "Requests shed with 429, per cost class.", ("cost_class",))
+
+REGISTRY = [
+    QUERY_PHASE_SECONDS,
+    QUERY_ROWS,
+    QUERY_RESPONSE_BYTES,
+    QUERY_CACHE,
+    QUERY_NOT_MODIFIED,
+    QUERY_COALESCED,
+    QUERY_SHARED,
+    QUERY_CANCELLED,
+    POOL_CONNECTIONS,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_SHED,
+    REPLICA_HEALTHY,
+    REPLICA_ROUTED,
+    INGEST_ROWS,
+    INGEST_FLUSH_SECONDS,
+    INGEST_BUFFER_ROWS,
+]
+
+
+@contextmanager
+def timed(query_id: str, phase: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        QUERY_PHASE_SECONDS.observe((query_id, phase), time.perf_counter() - t0)
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
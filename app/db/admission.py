@@ -0,0 +1,125 @@
+import asyncio
+import math
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.metrics import ADMISSION_SHED, QUERY_PHASE_SECONDS, REPLICA_ROUTED
+from app.db.pool import COST_CLASSES, CostClass, get_pool
+from app.db.replicas import PRIMARY, Node, fall_back, route
+from app.queries.registry import QUERIES
+
+
+class Overloaded(Exception):
+    """Raised when a cost class's wait queue is full or the wait timed out (HTTP 429)."""
+
+    def __init__(self, cost_class: str, retry_after_s: int) -> None:
+        super().__init__(f"'{cost_class}' queries are over capacity; retry in {retry_after_s}s")
+        self.cost_class = cost_class
+        self.retry_after_s = retry_after_s
+
+
+class ClassGate:
+    """Admission for one cost class: bounded wait queue in front of the class's pool."""
+
+    def __init__(self, cost_class: CostClass) -> None:
+        self.cost_class = cost_class
+        self.waiting = 0
+        self.running = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_s_total = 0.0
+        self.wait_s_max = 0.0
+        # smoothed time a connection is held; drives Retry-After
+        self.hold_s_ewma = 0.0
+
+    def _retry_after(self) -> int:
+        backlog = (self.waiting + 1) / max(self.cost_class.pool_size, 1)
+        return max(1, math.ceil(self.hold_s_ewma * backlog))
+
+    def _shed(self) -> Overloaded:
+        self.shed += 1
+        ADMISSION_SHED.inc((self.cost_class.name,))
+        return Overloaded(self.cost_class.name, self._retry_after())
+
+    async def _acquire(self) -> tuple[Node, asyncpg.Pool, asyncpg.Connection]:
+        # Curated queries are read-only: least busy healthy replica, else the primary.
+        # A replica that can't be connected to is ejected and the query runs on the primary.
+        node = route(self.cost_class.name)
+        if node.name != PRIMARY:
+            try:
+                pool = await get_pool(self.cost_class.name, node.name)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError) as e:
+                node = fall_back(node, f"{type(e).__name__}: {e}")
+            else:
+                try:
+                    return node, pool, await pool.acquire(timeout=settings.admission_wait_timeout_s)
+                except (OSError, asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError) as e:
+                    node = fall_back(node, f"{type(e).__name__}: {e}")
+        pool = await get_pool(self.cost_class.name)
+        return node, pool, await pool.acquire(timeout=settings.admission_wait_timeout_s)
+
+    @asynccontextmanager
+    async def connection(self, query_id: str | None = None) -> AsyncIterator[asyncpg.Connection]:
+        if self.waiting >= self.cost_class.queue_max:
+            raise self._shed()
+
+        self.waiting += 1
+        t0 = time.monotonic()
+        try:
+            node, pool, conn = await self._acquire()
+        except asyncio.TimeoutError:
+            raise self._shed()
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - t0
+        self.admitted += 1
+        self.wait_s_total += waited
+        self.wait_s_max = max(self.wait_s_max, waited)
+        if query_id is not None:
+            QUERY_PHASE_SECONDS.observe((query_id, "acquire"), waited)
+
+        name = self.cost_class.name
+        REPLICA_ROUTED.inc((node.name, name))
+        self.running += 1
+        node.busy[name] = node.busy.get(name, 0) + 1
+        t1 = time.monotonic()
+        try:
+            yield conn
+        finally:
+            self.running -= 1
+            node.busy[name] -= 1
+            self.hold_s_ewma = 0.8 * self.hold_s_ewma + 0.2 * (time.monotonic() - t1)
+            await pool.release(conn)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pool_size": self.cost_class.pool_size,
+            "statement_timeout_ms": self.cost_class.statement_timeout_ms,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "queue_max": self.cost_class.queue_max,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_ms_avg": round(1000 * self.wait_s_total / self.admitted, 2) if self.admitted else None,
+            "wait_ms_max": round(1000 * self.wait_s_max, 2),
+        }
+
+
+GATES: dict[str, ClassGate] = {name: ClassGate(c) for name, c in COST_CLASSES.items()}
+
+
+def admitted_connection(query_id: str, cost_class: str | None = None):
+    """Connection from the pool of the query's cost class (or `cost_class`), after admission."""
+    if query_id not in QUERIES:
+        raise KeyError(f"Unknown query_id: {query_id}")
+    return GATES[cost_class or QUERIES[query_id].cost_class].connection(query_id)
+
+
+def admission_stats() -> dict[str, Any]:
+    return {name: gate.stats() for name, gate in GATES.items()}
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import date, datetime, timezone
+from typing import Any
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.metrics import INGEST_BUFFER_ROWS, INGEST_FLUSH_SECONDS, INGEST_ROWS
+from app.db.partitions import ensure_partitions, writable_range
+from app.db.pool import INGEST_POOL, get_pool
+
+log = logging.getLogger(__name__)
+
+COLUMNS = {
+    "web_events": [
+        "event_ts", "session_id", "customer_id", "event_type", "product_id", "channel", "utm_source", "utm_campaign",
+    ],
+    "orders": ["order_id", "customer_id", "order_ts", "status", "channel", "currency", "shipping_cost"],
+    "order_items": ["order_id", "product_id", "quantity", "unit_price", "discount"],
+}
+
+# Rows that can't be loaded (unknown customer/product, bad values) fail the whole COPY; the
+# flush is then split in halves until the offending rows are isolated and dropped. Besides
+# the server's errors, that covers values asyncpg can't encode for their column (e.g. out of
+# int4 range), which fail the COPY client-side; retrying those would stall the table for good.
+REJECTABLE = (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError, OverflowError, ValueError, TypeError)
+
+# rows/s is reported over this trailing window
+RATE_WINDOW_S = 60.0
+
+
+class IngestBacklogFull(Exception):
+    """Raised when a buffer stays full for the whole wait (HTTP 429)."""
+
+    def __init__(self, table: str, retry_after_s: int) -> None:
+        super().__init__(f"'{table}' ingest buffer is full; retry in {retry_after_s}s")
+        self.table = table
+        self.retry_after_s = retry_after_s
+
+
+def _ts(row: tuple) -> datetime:
+    # event_ts / order_ts; orders are buffered as (order row without id, items)
+    return row[0] if isinstance(row[0], datetime) else row[0][1]
+
+
+def _month(row: tuple) -> date:
+    # partitions are UTC months
+    return _ts(row).astimezone(timezone.utc).date().replace(day=1)
+
+
+def accepted_range() -> tuple[datetime, datetime]:
+    """[low, high) of event_ts/order_ts that ingest takes (INGEST_MAX_AGE_DAYS, retention)."""
+    return writable_range(datetime.now(timezone.utc), settings.ingest_max_age_days, settings.partition_retain_months)
+
+
+async def _copy_web_events(conn: asyncpg.Connection, rows: list[tuple]) -> int:
+    await conn.copy_records_to_table("web_events", records=rows, columns=COLUMNS["web_events"])
+    return len(rows)
+
+
+async def _copy_orders(conn: asyncpg.Connection, rows: list[tuple]) -> int:
+    ids = await conn.fetch(
+        "select nextval(pg_get_serial_sequence('orders', 'order_id')) from generate_series(1, $1)", len(rows)
+    )
+    orders, items = [], []
+    for (order, order_items), r in zip(rows, ids):
+        order_id = r[0]
+        orders.append((order_id, *order))
+        items.extend((order_id, *item) for item in order_items)
+    await conn.copy_records_to_table("orders", records=orders, columns=COLUMNS["orders"])
+    await conn.copy_records_to_table("order_items", records=items, columns=COLUMNS["order_items"])
+    return len(orders)
+
+
+class IngestBuffer:
+    """In-memory buffer for one table, flushed with COPY on the ingest pool.
+
+    A flush starts once `flush_rows` rows are buffered or the oldest buffered row is
+    `flush_interval_s` old. Adding waits up to `wait_s` while the buffer holds `max_rows`,
+    then raises IngestBacklogFull. Buffered rows are not durable until flushed.
+    """
+
+    def __init__(self, table: str, max_rows: int, flush_rows: int, flush_interval_s: float, wait_s: float) -> None:
+        self.table = table
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.wait_s = wait_s
+        self._copy = _copy_orders if table == "orders" else _copy_web_events
+        self._rows: list[tuple] = []
+        self._oldest: float | None = None
+        self._flushing = 0
+        # months known to have partitions (checked once per process)
+        self._months: set[date] = set()
+        self._changed = asyncio.Condition()
+        self.accepted = 0
+        self.ingested = 0
+        self.rejected = 0
+        self.rejected_full = 0
+        self.flushes = 0
+        self.last_error: str | None = None
+        # (seconds, rows) of the last flushes
+        self._flushes: deque[tuple[float, int]] = deque(maxlen=100)
+        self._recent: deque[tuple[float, int]] = deque()
+
+    @property
+    def pending(self) -> int:
+        """Rows accepted but not yet committed (buffered or in a running flush)."""
+        return len(self._rows) + self._flushing
+
+    def _retry_after(self) -> int:
+        flush_s = sum(s for s, _ in self._flushes) / len(self._flushes) if self._flushes else 1.0
+        return max(1, math.ceil(flush_s * self.pending / max(self.flush_rows, 1)))
+
+    async def add(self, rows: list[tuple]) -> None:
+        async with self._changed:
+            if len(rows) > self.max_rows:
+                raise ValueError(f"batch of {len(rows)} rows exceeds the {self.table} buffer ({self.max_rows})")
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.pending + len(rows) <= self.max_rows), self.wait_s
+                )
+            except asyncio.TimeoutError:
+                self.rejected_full += len(rows)
+                raise IngestBacklogFull(self.table, self._retry_after())
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            self.accepted += len(rows)
+            INGEST_BUFFER_ROWS.set((self.table,), self.pending)
+            self._changed.notify_all()
+
+    def _due(self) -> bool:
+        if not self._rows:
+            return False
+        return len(self._rows) >= self.flush_rows or time.monotonic() - self._oldest >= self.flush_interval_s
+
+    def _reject(self, n: int, error: str) -> None:
+        self.last_error = error
+        self.rejected += n
+        INGEST_ROWS.inc((self.table, "rejected"), n)
+
+    async def _ensure_partitions(self, conn: asyncpg.Connection, rows: list[tuple]) -> list[tuple]:
+        """Create partitions for the rows' months; returns the rows that can be loaded.
+
+        Rows outside accepted_range() (they aged out while buffered, or were added directly) and
+        rows in a month whose partition was detached are rejected here: creating their months
+        would fail, or fill years of empty partitions, on every retry of the flush.
+        """
+        low, high = accepted_range()
+        keep = [r for r in rows if low <= _ts(r) < high]
+        if len(keep) < len(rows):
+            self._reject(len(rows) - len(keep), f"timestamp outside [{low.isoformat()}, {high.isoformat()})")
+        detached = set()
+        for month in sorted({_month(r) for r in keep} - self._months):
+            try:
+                async with conn.transaction():
+                    await ensure_partitions(conn, month, month)
+            except asyncpg.RaiseError as e:
+                # create_month_partitions refuses months whose (detached) table still exists
+                detached.add(month)
+                self.last_error = f"{type(e).__name__}: {e}"
+                continue
+            self._months.add(month)
+        if detached:
+            rows, keep = keep, [r for r in keep if _month(r) not in detached]
+            self._reject(len(rows) - len(keep), self.last_error)
+        return keep
+
+    async def _load(self, conn: asyncpg.Connection, rows: list[tuple]) -> int:
+        if not rows:
+            return 0
+        try:
+            async with conn.transaction():
+                return await self._copy(conn, rows)
+        except REJECTABLE as e:
+            if len(rows) == 1:
+                self._reject(1, f"{type(e).__name__}: {e}")
+                return 0
+            self.last_error = f"{type(e).__name__}: {e}"
+            mid = len(rows) // 2
+            return await self._load(conn, rows[:mid]) + await self._load(conn, rows[mid:])
+
+    async def flush(self) -> int:
+        async with self._changed:
+            rows, self._rows = self._rows[: self.flush_rows], self._rows[self.flush_rows :]
+            self._oldest = time.monotonic() if self._rows else None
+            self._flushing += len(rows)
+        if not rows:
+            return 0
+        t0 = time.monotonic()
+        try:
+            pool = await get_pool(INGEST_POOL)
+            async with pool.acquire() as conn:
+                n = await self._load(conn, await self._ensure_partitions(conn, rows))
+        except BaseException:
+            # connection trouble or shutdown: put the rows back in front for the next flush
+            async with self._changed:
+                self._rows[:0] = rows
+                self._oldest = self._oldest or time.monotonic()
+                self._flushing -= len(rows)
+            raise
+        elapsed = time.monotonic() - t0
+        async with self._changed:
+            self._flushing -= len(rows)
+            INGEST_BUFFER_ROWS.set((self.table,), self.pending)
+            self._changed.notify_all()
+        self.flushes += 1
+        self.ingested += n
+        self._flushes.append((elapsed, n))
+        self._recent.append((time.monotonic(), n))
+        INGEST_ROWS.inc((self.table, "ingested"), n)
+        INGEST_FLUSH_SECONDS.observe((self.table,), elapsed)
+        return n
+
+    async def flush_loop(self) -> None:
+        while True:
+            async with self._changed:
+                if not self._due():
+                    timeout = self.flush_interval_s
+                    if self._oldest is not None:
+                        timeout = max(0.0, self._oldest + self.flush_interval_s - time.monotonic())
+                    try:
+                        await asyncio.wait_for(self._changed.wait_for(self._due), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            if not self._due():
+                continue
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                log.exception("%s ingest flush failed", self.table)
+                await asyncio.sleep(1.0)
+
+    async def drain(self) -> None:
+        """Flush everything buffered (shutdown)."""
+        while self._rows:
+            await self.flush()
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        while self._recent and now - self._recent[0][0] > RATE_WINDOW_S:
+            self._recent.popleft()
+        flush_ms = sorted(1000 * s for s, _ in self._flushes)
+        flush_s = sum(s for s, _ in self._flushes)
+        return {
+            "buffered": len(self._rows),
+            "flushing": self._flushing,
+            "max_rows": self.max_rows,
+            "accepted": self.accepted,
+            "ingested": self.ingested,
+            "rejected": self.rejected,
+            "rejected_buffer_full": self.rejected_full,
+            "flushes": self.flushes,
+            # arrival-limited rate over the last minute, and what the COPYs themselves sustain
+            "rows_per_s": round(sum(n for _, n in self._recent) / RATE_WINDOW_S, 1),
+            "copy_rows_per_s": round(sum(n for _, n in self._flushes) / flush_s, 1) if flush_s else None,
+            "flush_ms_p50": round(flush_ms[len(flush_ms) // 2], 2) if flush_ms else None,
+            "flush_ms_max": round(flush_ms[-1], 2) if flush_ms else None,
+            "last_error": self.last_error,
+        }
+
+
+BUFFERS: dict[str, IngestBuffer] = {
+    table: IngestBuffer(
+        table,
+        max_rows=settings.ingest_buffer_max_rows,
+        flush_rows=settings.ingest_flush_rows,
+        flush_interval_s=settings.ingest_flush_interval_s,
+        wait_s=settings.ingest_wait_s,
+    )
+    for table in ("web_events", "orders")
+}
+
+
+def ingest_stats() -> dict[str, Any]:
+    return {table: buf.stats() for table, buf in BUFFERS.items()}
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+
+import asyncpg
+
+from app.db.pool import SYSTEM_POOL, get_pool
+
+log = logging.getLogger(__name__)
+
+# Monthly range-partitioned tables (sql/schema/003_partitions.sql)
+PARTITIONED_TABLES = ("orders", "web_events")
+
+
+def _add_months(d: date, months: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 + months, 12)
+    return date(y, m + 1, 1)
+
+
+def _utc_midnight(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+
+
+def writable_range(now: datetime, max_age_days: int, retain_months: int) -> tuple[datetime, datetime]:
+    """[low, high) of timestamps live rows may carry: at most max_age_days old and not in a month
+    retention detaches, and before the end of next month (UTC)."""
+    this_month = now.astimezone(timezone.utc).date().replace(day=1)
+    low = now - timedelta(days=max_age_days)
+    if retain_months > 0:
+        low = max(low, _utc_midnight(_add_months(this_month, -retain_months)))
+    return low, _utc_midnight(_add_months(this_month, 2))
+
+
+async def ensure_partitions(conn: asyncpg.Connection, from_month: date, to_month: date) -> int:
+    """Create any missing monthly partitions covering from_month..to_month; returns how many."""
+    created = 0
+    for table in PARTITIONED_TABLES:
+        created += await conn.fetchval("select create_month_partitions($1, $2, $3)", table, from_month, to_month)
+    return created
+
+
+async def detach_old_partitions(conn: asyncpg.Connection, before_month: date) -> list[str]:
+    """Detach (not drop) partitions for months before `before_month`; they stay as plain tables."""
+    detached = []
+    for table in PARTITIONED_TABLES:
+        rows = await conn.fetch("select partition_name from month_partitions($1) where month < $2", table, before_month)
+        for r in rows:
+            # CONCURRENTLY only takes SHARE UPDATE EXCLUSIVE on the parent, so readers keep going;
+            # it can't run inside a transaction, which is why this isn't in the SQL function.
+            await conn.execute(f'alter table {table} detach partition "{r["partition_name"]}" concurrently')
+            detached.append(r["partition_name"])
+    if detached:
+        await purge_rollups(conn, before_month)
+    return detached
+
+
+async def purge_rollups(conn: asyncpg.Connection, before_month: date) -> None:
+    """Drop months before `before_month` from the rollups, so they summarize what is still attached."""
+    async with conn.transaction():
+        # the refresh functions' own row locks: none of them runs half before, half after
+        await conn.execute("select 1 from rollup_state order by rollup for update")
+        await conn.execute("delete from rollup_order_revenue where day < $1", before_month)
+        await conn.execute("delete from rollup_revenue_daily where day < $1", before_month)
+        await conn.execute("select purge_cohort_rollups($1)", before_month)
+        # keep approx=true funnel counts over the same months as the exact ones
+        await conn.execute("delete from rollup_funnel_sketch where day < $1", before_month)
+        await conn.execute("delete from funnel_changes where day < $1", before_month)
+
+
+async def maintain_partitions(conn: asyncpg.Connection, months_ahead: int, retain_months: int) -> None:
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    created = await ensure_partitions(conn, this_month, _add_months(this_month, months_ahead))
+    if created:
+        log.info("created %d monthly partitions", created)
+    if retain_months > 0:
+        detached = await detach_old_partitions(conn, _add_months(this_month, -retain_months))
+        if detached:
+            log.info("detached partitions: %s", ", ".join(detached))
+
+
+async def partition_maintenance_loop(interval_s: float, months_ahead: int, retain_months: int) -> None:
+    while True:
+        try:
+            pool = await get_pool(SYSTEM_POOL)
+            async with pool.acquire() as conn:
+                await maintain_partitions(conn, months_ahead, retain_months)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("partition maintenance failed")
+        await asyncio.sleep(interval_s)
@@ -1,18 +1,131 @@
+import asyncio
+from dataclasses import dataclass
+from functools import partial
+from datetime import date
+
 import asyncpg
+
 from app.core.config import settings
+from app.db.replicas import NODES, PRIMARY
+from app.queries.registry import QUERIES, preload_sql
+from app.queries.shared import result_columns
+
+# Health checks, watermarks and rollup maintenance; never shared with curated queries.
+SYSTEM_POOL = "system"
+# COPY flushes of the ingestion buffers (app.db.ingest), kept apart from both.
+INGEST_POOL = "ingest"
+
+
+@dataclass(frozen=True)
+class CostClass:
+    name: str
+    # concurrency budget: connections in this class's pool
+    pool_size: int
+    # callers allowed to wait for a connection before new ones are shed
+    queue_max: int
+    statement_timeout_ms: int
+
+
+COST_CLASSES: dict[str, CostClass] = {
+    "light": CostClass(
+        name="light",
+        pool_size=settings.light_pool_size,
+        queue_max=settings.light_queue_max,
+        statement_timeout_ms=settings.light_statement_timeout_ms,
+    ),
+    "heavy": CostClass(
+        name="heavy",
+        pool_size=settings.heavy_pool_size,
+        queue_max=settings.heavy_queue_max,
+        statement_timeout_ms=settings.heavy_statement_timeout_ms,
+    ),
+}
+
+_pools: dict[str, asyncpg.Pool] = {}
+_pools_lock = asyncio.Lock()
+
+
+# Bound to every curated statement as a connection opens: start after end, an empty window,
+# so running it costs little more than planning it.
+EMPTY_WINDOW = {
+    "start_date": date(1970, 1, 2),
+    "end_date": date(1970, 1, 1),
+    "start_month": date(1970, 2, 1),
+    "end_month": date(1970, 1, 1),
+}
+
+
+class CuratedConnection(asyncpg.Connection):
+    """Connection that prepares every curated statement as soon as it is opened."""
+
+    # app.db.replicas node the connection's pool points at
+    node: str = PRIMARY
+
+    async def prepare_curated(self) -> None:
+        # Running each statement once leaves it prepared in the connection's statement cache,
+        # which conn.fetch and conn.cursor consult; max_cached_statement_lifetime=0 keeps it
+        # there for the connection's lifetime, across pool release/acquire cycles. fetch ends
+        # with Sync, so no table locks outlive the loop.
+        for query_id, sql in preload_sql().items():
+            # the result's declared column types, once per process (app.queries.encoding uses them)
+            await result_columns(self, query_id)
+            await self.fetch(sql, *(EMPTY_WINDOW[p] for p in QUERIES[query_id].params))
+
+
+async def _prepare_curated(conn: CuratedConnection, node: str) -> None:
+    # Runs once per physical connection as the pool opens it.
+    conn.node = node
+    await conn.prepare_curated()
+
+
+def _pool_key(name: str, node: str) -> str:
+    return name if node == PRIMARY else f"{name}@{node}"
+
+
+async def _create_pool(name: str, node: str) -> asyncpg.Pool:
+    if name == SYSTEM_POOL:
+        return await asyncpg.create_pool(settings.database_url, min_size=1, max_size=settings.system_pool_size)
+    if name == INGEST_POOL:
+        return await asyncpg.create_pool(settings.database_url, min_size=1, max_size=settings.ingest_pool_size)
+
+    cost_class = COST_CLASSES[name]
+    return await asyncpg.create_pool(
+        NODES[node].dsn,
+        # a replica that can't be reached should fail over quickly, not hang the request
+        timeout=settings.replica_health_timeout_s if node != PRIMARY else 60,
+        min_size=1,
+        max_size=cost_class.pool_size,
+        connection_class=CuratedConnection,
+        init=partial(_prepare_curated, node=node),
+        # keep curated statements prepared for the connection's lifetime
+        max_cached_statement_lifetime=0,
+        server_settings={"statement_timeout": str(cost_class.statement_timeout_ms)},
+    )
+
+
+async def get_pool(name: str = SYSTEM_POOL, node: str = PRIMARY) -> asyncpg.Pool:
+    """Pool `name` on `node`; the system and ingest pools only exist on the primary (writes)."""
+    key = _pool_key(name, node)
+    pool = _pools.get(key)
+    if pool is None:
+        async with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = await _create_pool(name, node)
+    return pool
+
 
-_pool: asyncpg.Pool | None = None
+async def open_pools() -> None:
+    # Replica pools open on first use: an unreachable replica mustn't block startup.
+    for name in [SYSTEM_POOL, INGEST_POOL, *COST_CLASSES]:
+        await get_pool(name)
 
 
-async def get_pool() -> asyncpg.Pool:
-    global _pool
-    if _pool is None:
-        _pool = await asyncpg.create_pool(settings.database_url, min_size=1, max_size=10)
-    return _pool
+def pool_stats() -> dict[str, dict[str, int]]:
+    return {name: {"size": p.get_size(), "idle": p.get_idle_size()} for name, p in _pools.items()}
 
 
-async def close_pool() -> None:
-    global _pool
-    if _pool is not None:
-        await _pool.close()
-        _pool = None
+async def close_pools() -> None:
+    while _pools:
+        _name, pool = _pools.popitem()
+        await pool.close()
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.metrics import REPLICA_HEALTHY
+
+log = logging.getLogger(__name__)
+
+PRIMARY = "primary"
+
+# Replay lag in seconds (0 on a server that isn't in recovery, e.g. a plain second instance).
+# An idle primary makes pg_last_xact_replay_timestamp() look old, so a replica whose WAL is
+# fully replayed reports 0 regardless of the timestamp.
+HEALTH_SQL = """
+select case
+         when not pg_is_in_recovery() then 0
+         when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0
+         else coalesce(extract(epoch from now() - pg_last_xact_replay_timestamp()), 0)
+       end::float8 as lag_s
+"""
+
+
+@dataclass
+class Node:
+    name: str
+    dsn: str
+    healthy: bool = True
+    lag_s: float | None = None
+    last_error: str | None = None
+    checked_at: float | None = None
+    ejections: int = 0
+    # cost class -> curated connections currently held on this node
+    busy: dict[str, int] = field(default_factory=dict)
+    # queries sent here; also breaks ties between equally busy replicas
+    routed: int = 0
+
+
+NODES: dict[str, Node] = {
+    PRIMARY: Node(PRIMARY, settings.database_url),
+    **{f"replica{i}": Node(f"replica{i}", dsn) for i, dsn in enumerate(settings.replica_database_urls, 1)},
+}
+
+
+def replicas() -> list[Node]:
+    return [n for n in NODES.values() if n.name != PRIMARY]
+
+
+def route(cost_class: str) -> Node:
+    """Node for a curated (read-only) query: the least busy healthy replica, else the primary."""
+    healthy = [n for n in replicas() if n.healthy]
+    node = min(healthy, key=lambda n: (n.busy.get(cost_class, 0), n.routed)) if healthy else NODES[PRIMARY]
+    node.routed += 1
+    return node
+
+
+def fall_back(node: Node, reason: str) -> Node:
+    """Eject a replica that failed to connect; the query goes to the primary instead."""
+    eject(node, reason)
+    node.routed -= 1
+    primary = NODES[PRIMARY]
+    primary.routed += 1
+    return primary
+
+
+def eject(node: Node, reason: str) -> None:
+    """Stop routing to a replica until a health check readmits it."""
+    if node.name == PRIMARY:
+        return
+    node.last_error = reason
+    if not node.healthy:
+        return
+    node.healthy = False
+    node.ejections += 1
+    REPLICA_HEALTHY.set((node.name,), 0)
+    log.warning("replica %s ejected: %s", node.name, reason)
+
+
+async def check(node: Node) -> None:
+    try:
+        conn = await asyncpg.connect(node.dsn, timeout=settings.replica_health_timeout_s)
+        try:
+            lag_s = await conn.fetchval(HEALTH_SQL, timeout=settings.replica_health_timeout_s)
+        finally:
+            await conn.close()
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+        node.checked_at = time.time()
+        eject(node, f"{type(e).__name__}: {e}")
+        return
+
+    node.checked_at = time.time()
+    node.lag_s = lag_s
+    max_lag_s = settings.replica_max_lag_s
+    if max_lag_s > 0 and lag_s > max_lag_s:
+        eject(node, f"replication lag {lag_s:.1f}s > {max_lag_s}s")
+    elif not node.healthy:
+        node.healthy = True
+        node.last_error = None
+        REPLICA_HEALTHY.set((node.name,), 1)
+        log.info("replica %s readmitted (lag %.1fs)", node.name, lag_s)
+
+
+async def replica_health_loop(interval_s: float) -> None:
+    for node in replicas():
+        REPLICA_HEALTHY.set((node.name,), int(node.healthy))
+    while True:
+        try:
+            await asyncio.gather(*(check(node) for node in replicas()))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("replica health check failed")
+        await asyncio.sleep(interval_s)
+
+
+def replica_stats() -> dict[str, dict[str, Any]]:
+    return {
+        n.name: {
+            "healthy": n.healthy,
+            "lag_s": n.lag_s,
+            "last_error": n.last_error,
+            "ejections": n.ejections,
+            "routed": n.routed,
+            "busy": dict(n.busy),
+        }
+        for n in NODES.values()
+    }
@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+import asyncpg
+
+from app.db.pool import SYSTEM_POOL, get_pool
+
+log = logging.getLogger(__name__)
+
+
+async def refresh_rollups(conn: asyncpg.Connection) -> dict[str, int]:
+    """Apply pending changes to the rollups; returns orders / customers / funnel days recomputed."""
+    return {
+        "orders": await conn.fetchval("select refresh_revenue_rollups()"),
+        "customers": await conn.fetchval("select refresh_cohort_rollups()"),
+        "funnel_days": await conn.fetchval("select refresh_funnel_sketches()"),
+    }
+
+
+async def rollup_refresh_loop(interval_s: float) -> None:
+    while True:
+        try:
+            pool = await get_pool(SYSTEM_POOL)
+            async with pool.acquire() as conn:
+                n = await refresh_rollups(conn)
+            if any(n.values()):
+                log.info(
+                    "rollups refreshed: %d orders, %d customers, %d funnel days",
+                    n["orders"],
+                    n["customers"],
+                    n["funnel_days"],
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("rollup refresh failed")
+        await asyncio.sleep(interval_s)
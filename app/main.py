@@ -1,16 +1,74 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pathlib import Path
 
+from app.api.ingest import router as ingest_router
 from app.api.routes import router
+from app.core.config import settings
+from app.db.ingest import BUFFERS
+from app.db.pool import close_pools, open_pools
+from app.db.partitions import partition_maintenance_loop
+from app.db.replicas import replica_health_loop, replicas
+from app.db.rollups import rollup_refresh_loop
+from app.queries.cache import result_cache
+from app.queries.registry import preload_sql
+from app.queries.slowlog import slow_log
+from app.queries.snapshot import get_snapshot
+from app.queries.warmer import cache_warmer
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 FRONTEND_DIR = BASE_DIR / "frontend" / "public"
 
-app = FastAPI(title="E-Commerce Ops Warehouse Query Showcase", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    tasks = []
+    if settings.query_backend == "snapshot":
+        # NumPy engine over a columnar snapshot: no pools, nothing to maintain
+        get_snapshot()
+        yield
+        return
+
+    # Load curated SQL once and open the pools (curated pools prepare it on every connection).
+    preload_sql()
+    await open_pools()
+    if replicas():
+        tasks.append(asyncio.create_task(replica_health_loop(settings.replica_health_interval_s)))
+    tasks.extend(asyncio.create_task(buf.flush_loop()) for buf in BUFFERS.values())
+    if settings.cache_warm_interval_s > 0 and result_cache.enabled:
+        tasks.append(asyncio.create_task(cache_warmer.loop(settings.data_version_refresh_s)))
+    if settings.rollup_refresh_interval_s > 0:
+        tasks.append(asyncio.create_task(rollup_refresh_loop(settings.rollup_refresh_interval_s)))
+    if settings.partition_maintenance_interval_s > 0:
+        tasks.append(
+            asyncio.create_task(
+                partition_maintenance_loop(
+                    settings.partition_maintenance_interval_s,
+                    settings.partition_months_ahead,
+                    settings.partition_retain_months,
+                )
+            )
+        )
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # whatever was accepted for ingestion is written before the pools go away
+    for buf in BUFFERS.values():
+        await buf.drain()
+    await slow_log.close()
+    await close_pools()
+
+
+app = FastAPI(title="E-Commerce Ops Warehouse Query Showcase", version="0.1.0", lifespan=lifespan)
 
 app.include_router(router, prefix="/api")
+app.include_router(ingest_router, prefix="/api")
 
 # Serve the simple frontend (local demo)
 if FRONTEND_DIR.exists():
@@ -0,0 +1,84 @@
+import math
+from collections.abc import Awaitable, Callable
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any
+
+import asyncpg
+import numpy as np
+
+# HyperLogLog over the per-day sketches in rollup_funnel_sketch (sql/schema/005_funnel_sketches.sql).
+PRECISION = 14
+REGISTERS = 1 << PRECISION
+# sparse encoding: big-endian register index, rank
+SPARSE = np.dtype([("register", ">u2"), ("rank", "u1")])
+ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+# reported bound: two standard errors (~95%)
+BOUND_SIGMAS = 2
+
+Result = tuple[list[str], list[list[Any]], dict[str, Any]]
+
+SKETCH_SQL = """
+select event_type, sessions_hll
+from rollup_funnel_sketch
+where day >= $1::date
+  and day <= $2::date
+"""
+
+FUNNEL_STAGES = [
+    ("sessions", "session_start"),
+    ("product_view", "product_view"),
+    ("add_to_cart", "add_to_cart"),
+    ("checkout_start", "checkout_start"),
+    ("purchase", "purchase"),
+]
+
+
+def merge(sketches: list[bytes]) -> np.ndarray:
+    """Union of sparse sketches as dense registers (register-wise max rank)."""
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    if sketches:
+        sparse = np.frombuffer(b"".join(sketches), dtype=SPARSE)
+        np.maximum.at(registers, sparse["register"], sparse["rank"])
+    return registers
+
+
+def estimate(registers: np.ndarray) -> tuple[float, float]:
+    """Distinct count and its relative standard error."""
+    zeros = int(np.count_nonzero(registers == 0))
+    raw = ALPHA * REGISTERS * REGISTERS / float(np.ldexp(1.0, -registers.astype(np.int32)).sum())
+    if raw <= 2.5 * REGISTERS and zeros:
+        # small range: linear counting over the empty registers
+        n = REGISTERS * math.log(REGISTERS / zeros)
+        if n == 0:
+            return 0.0, 0.0
+        t = n / REGISTERS
+        return n, math.sqrt(REGISTERS * (math.exp(t) - t - 1)) / n
+    return raw, 1.04 / math.sqrt(REGISTERS)
+
+
+async def approx_conversion_funnel(conn: asyncpg.Connection, start_date: date, end_date: date) -> Result:
+    by_type: dict[str, list[bytes]] = {}
+    for r in await conn.fetch(SKETCH_SQL, start_date, end_date):
+        by_type.setdefault(r["event_type"], []).append(r["sessions_hll"])
+
+    estimates = [estimate(merge(by_type.get(event_type, []))) for _, event_type in FUNNEL_STAGES]
+    sessions = round(estimates[0][0])
+    rows = []
+    for (stage, _), (n, rel_error) in zip(FUNNEL_STAGES, estimates):
+        pct = (Decimal(round(n)) / sessions).quantize(Decimal("0.0001"), ROUND_HALF_UP) if sessions else None
+        rows.append([stage, round(n), round(BOUND_SIGMAS * rel_error * n), pct])
+    meta = {
+        "method": "hyperloglog",
+        "registers": REGISTERS,
+        "rel_std_error": round(max(e for _, e in estimates), 5),
+        "bound": f"n_error is {BOUND_SIGMAS} standard errors (~95%)",
+    }
+    return ["stage", "n", "n_error", "pct_of_sessions"], rows, meta
+
+
+# query_id -> approximate implementation; other queries answer approx=true exactly
+APPROX_QUERIES: dict[str, Callable[..., Awaitable[Result]]] = {
+    "conversion_funnel": approx_conversion_funnel,
+}
+EXACT = {"method": "exact", "rel_std_error": 0}
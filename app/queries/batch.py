@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator
+from typing import Any
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.metrics import QUERY_CANCELLED
+from app.db.admission import Overloaded
+from app.queries.registry import QUERIES
+from app.queries.runner import (
+    UNVERSIONED,
+    bind_params,
+    execute_curated_query,
+    execute_shared_queries,
+    run_snapshot_query,
+)
+from app.queries.shared import shared_groups
+
+log = logging.getLogger(__name__)
+
+# Shared by every batch request, so concurrent batches can't drain the pool between them.
+_batch_slots = asyncio.Semaphore(settings.batch_max_concurrency)
+
+# Reported per item with their HTTP-like status (TimeoutError: the batch's deadline passed).
+# Anything else (a dropped connection, a bug) is logged and reported as a 500 for its items
+# only; the other items and the stream carry on.
+FAILURES = (KeyError, ValueError, Overloaded, TimeoutError, asyncpg.PostgresError)
+
+
+def _failure(out: dict[str, Any], e: Exception) -> dict[str, Any]:
+    if not isinstance(e, FAILURES):
+        log.error("batch item %s (%s) failed", out["index"], out["query_id"], exc_info=e)
+    if isinstance(e, KeyError):
+        out.update(ok=False, status=404, error="Unknown query")
+    elif isinstance(e, ValueError):
+        out.update(ok=False, status=400, error=str(e))
+    elif isinstance(e, Overloaded):
+        out.update(ok=False, status=429, error=str(e), retry_after_s=e.retry_after_s)
+    elif isinstance(e, TimeoutError):
+        QUERY_CANCELLED.inc((out["query_id"], "deadline"))
+        out.update(ok=False, status=504, error="Deadline exceeded (X-Deadline-Ms)")
+    elif isinstance(e, asyncpg.QueryCanceledError):
+        QUERY_CANCELLED.inc((out["query_id"], "statement_timeout"))
+        out.update(ok=False, status=504, error="Query exceeded its statement_timeout")
+    else:
+        out.update(ok=False, status=500, error=f"{type(e).__name__}: {e}")
+    return out
+
+
+async def _run_one(index: int, query_id: str, params: dict[str, Any], deadline: float | None) -> list[dict[str, Any]]:
+    out: dict[str, Any] = {"index": index, "query_id": query_id}
+    try:
+        # validate before taking a slot/connection
+        bind_params(query_id, params)
+        async with asyncio.timeout_at(deadline), _batch_slots:
+            if settings.query_backend == "snapshot":
+                out["result"] = await run_snapshot_query(query_id, params)
+            else:
+                out["result"] = await execute_curated_query(query_id, params)
+                out["result"].pop(UNVERSIONED, None)
+        out["ok"] = True
+    except Exception as e:
+        _failure(out, e)
+    return [out]
+
+
+async def _run_shared(items: list[tuple[int, str, dict[str, Any]]], deadline: float | None) -> list[dict[str, Any]]:
+    # one slot and connection for the whole group; its outcome is every member's
+    outs = [{"index": i, "query_id": qid} for i, qid, _ in items]
+    try:
+        async with asyncio.timeout_at(deadline), _batch_slots:
+            results = await execute_shared_queries([qid for _, qid, _ in items], items[0][2])
+        for out in outs:
+            results[out["query_id"]].pop(UNVERSIONED, None)
+            out.update(result=results[out["query_id"]], ok=True)
+    except Exception as e:
+        for out in outs:
+            _failure(out, e)
+    return outs
+
+
+def _bound(query_id: str, params: dict[str, Any]) -> list[Any] | None:
+    try:
+        return bind_params(query_id, params)
+    except (KeyError, ValueError):
+        return None
+
+
+async def run_batch(
+    items: list[tuple[str, dict[str, Any]]], *, deadline: float | None = None
+) -> AsyncIterator[dict[str, Any]]:
+    """Run curated queries concurrently, yielding each outcome as soon as it finishes.
+
+    Each query gets its own pooled connection, except that queries deriving from the same
+    base relation over the same window run together, reading the base once
+    (app/queries/shared.py). At most settings.batch_max_concurrency run at once across all
+    batches. Failures are reported per item and never abort the batch; items still waiting
+    or running at `deadline` (event loop time) are cancelled and reported as 504s.
+    """
+    groups = []
+    if settings.query_backend != "snapshot":
+        groups = shared_groups([(qid, _bound(qid, params)) for qid, params in items])
+    grouped = {i for g in groups for i in g}
+    # task -> the query_ids it runs
+    tasks = {
+        asyncio.create_task(_run_shared([(i, *items[i]) for i in g], deadline)): [items[i][0] for i in g]
+        for g in groups
+    }
+    tasks.update(
+        (asyncio.create_task(_run_one(i, qid, params, deadline)), [qid])
+        for i, (qid, params) in enumerate(items)
+        if i not in grouped
+    )
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for outcome in await next_done:
+                yield outcome
+    finally:
+        # client went away mid-batch: don't keep running queries nobody will read
+        for task, query_ids in tasks.items():
+            if not task.done():
+                task.cancel()
+                for qid in query_ids:
+                    if qid in QUERIES:
+                        QUERY_CANCELLED.inc((qid, "disconnect"))
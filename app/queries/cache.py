@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any
+
+import asyncpg
+
+from app.core.config import settings
+from app.db.pool import SYSTEM_POOL, get_pool
+
+# Cheap watermark over what the curated queries read: newest order/event timestamps (indexed
+# max lookups), the tuple change counters Postgres keeps for the source tables they scan
+# directly (summed over partitions), and the rollups' high-water marks, which move when a
+# refresh applies changes. Writes elsewhere (order_changes, funnel_changes, the rollup tables
+# themselves, rollup_state bookkeeping) leave it alone.
+DATA_VERSION_SQL = """
+select (select max(order_ts) from orders) as orders_max_ts,
+       (select max(event_ts) from web_events) as events_max_ts,
+       (select coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0)
+          from pg_stat_user_tables
+         where schemaname = current_schema()
+           and coalesce(pg_partition_root(relid), relid)::regclass::text in
+               ('orders', 'order_items', 'products', 'customers', 'refunds', 'shipments', 'web_events')) as changes,
+       (select string_agg(rollup || ':' || last_change_id, ',' order by rollup) from rollup_state) as rollups
+"""
+
+CacheKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+async def fetch_data_version(conn: asyncpg.Connection) -> str:
+    r = await conn.fetchrow(DATA_VERSION_SQL)
+    return (
+        f"orders={r['orders_max_ts']}|web_events={r['events_max_ts']}|changes={r['changes']}|rollups={r['rollups']}"
+    )
+
+
+class ResultCache:
+    """LRU of curated query payloads, bounded by entry count and TTL.
+
+    Entries are tagged with the data version they were computed at; when the
+    version moves, the whole cache is dropped.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, version_refresh_s: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.version_refresh_s = version_refresh_s
+        self._entries: OrderedDict[CacheKey, tuple[float, str, dict[str, Any]]] = OrderedDict()
+        self._version: str | None = None
+        # primary's WAL position right after the version was read (pg_lsn as text)
+        self.version_lsn: str | None = None
+        self._version_checked_at = 0.0
+        self._version_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    async def data_version(self) -> str:
+        """The primary's data version, re-read on the system pool every version_refresh_s.
+
+        Never read on a query's connection: that may be a replica, whose change counters and
+        newest timestamps differ from the primary's, so the version would flip between the two.
+        `version_lsn` records where the primary's WAL was, for checking a replica caught up.
+        """
+        if self._version is not None and time.monotonic() - self._version_checked_at < self.version_refresh_s:
+            return self._version
+        async with self._version_lock:
+            # another request may have refreshed it while we waited
+            if self._version is None or time.monotonic() - self._version_checked_at >= self.version_refresh_s:
+                pool = await get_pool(SYSTEM_POOL)
+                async with pool.acquire() as conn:
+                    version = await fetch_data_version(conn)
+                    lsn = await conn.fetchval("select pg_current_wal_lsn()::text")
+                if self._version is not None and version != self._version:
+                    self.invalidations += len(self._entries)
+                    self._entries.clear()
+                self._version = version
+                self.version_lsn = lsn
+                self._version_checked_at = time.monotonic()
+        return self._version
+
+    def get(self, key: CacheKey, version: str) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, entry_version, payload = entry
+        if entry_version != version or time.monotonic() - stored_at > self.ttl_s:
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(payload)
+
+    def put(self, key: CacheKey, version: str, payload: dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        self._entries[key] = (time.monotonic(), version, dict(payload))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._version = None
+        self.version_lsn = None
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "data_version": self._version,
+        }
+
+
+result_cache = ResultCache(
+    max_entries=settings.result_cache_max_entries,
+    ttl_s=settings.result_cache_ttl_s,
+    version_refresh_s=settings.data_version_refresh_s,
+)
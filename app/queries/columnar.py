@@ -0,0 +1,149 @@
+import json
+import math
+import struct
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+import numpy as np
+
+from app.queries.encoding import dumps, json_default
+
+# Column-major binary result format, served instead of JSON when a request's Accept header
+# names MEDIA_TYPE (decoder: frontend/public/columnar.js). Little-endian:
+#
+#   "WHC1" | uint32 header length | header (UTF-8 JSON, space-padded) | column buffers
+#
+# The header is the JSON payload without "rows", plus "layout": one entry per column with
+# its type and buffer offsets (from the end of the header; every buffer starts 8-aligned so
+# the browser can view it as a typed array without copying):
+#   i32   int32 values                 f64   float64 (ints beyond int32, floats, other numerics)
+#   dec   int32 values * 10**"scale"   (numerics of one scale, e.g. round(x, 2))
+#   date  int32 days since 1970-01-01  bool  uint8
+#   dict  uint8/16/32 codes ("width") into "dictionary" (text columns)
+#   json  a UTF-8 JSON array of the values (anything else, e.g. timestamps or mixed types)
+# "nulls", when present, is the offset of a null bitmap (bit i set = row i is NULL, LSB first);
+# NULL slots in the value buffer hold 0. NaN/Infinity travel as NULL, as in the JSON format.
+MEDIA_TYPE = "application/vnd.warehouse.columnar"
+MAGIC = b"WHC1"
+ALIGN = 8
+
+EPOCH = date(1970, 1, 1).toordinal()
+INT32 = (-(2**31), 2**31 - 1)
+# ints the browser can hold exactly as a float64
+SAFE_INT = 2**53
+
+
+def accepts_columnar(accept: str | None) -> bool:
+    return bool(accept) and MEDIA_TYPE in accept
+
+
+def _int_kind(values: list) -> str | None:
+    lo, hi = min(values), max(values)
+    if INT32[0] <= lo and hi <= INT32[1]:
+        return "i32"
+    return "f64" if -SAFE_INT <= lo and hi <= SAFE_INT else None
+
+
+def _decimal_scale(values: list) -> int | None:
+    # Numerics that share one negative exponent travel as scaled int32s. The browser's
+    # n / 10**scale is correctly rounded, so it is the same double JSON.parse gives for the
+    # JSON format's float.
+    sample = values[0]
+    exponent = sample.as_tuple().exponent
+    if not isinstance(exponent, int) or not -9 <= exponent < 0:
+        return None
+    if not all(type(v) is Decimal and v.same_quantum(sample) for v in values):
+        return None
+    limit = Decimal(INT32[1]).scaleb(exponent)
+    return -exponent if all(-limit <= v <= limit for v in values) else None
+
+
+def _numeric_kind(values: list) -> tuple[str, int | None] | None:
+    if all(type(v) is int for v in values):
+        kind = _int_kind(values)
+        return (kind, None) if kind else None
+    if type(values[0]) is Decimal:
+        scale = _decimal_scale(values)
+        if scale is not None:
+            return "dec", scale
+    if all(type(v) in (int, float, Decimal) for v in values):
+        return "f64", None
+    return None
+
+
+def _kind(values: list) -> tuple[str, int | None]:
+    # values: the column's non-null values; returns (type, scale for "dec")
+    if not values:
+        return "json", None
+    first = type(values[0])
+    if first is bool:
+        return ("bool" if all(type(v) is bool for v in values) else "json"), None
+    if first is date:
+        return ("date" if all(type(v) is date for v in values) else "json"), None
+    if first is str:
+        return ("dict" if all(type(v) is str for v in values) else "json"), None
+    if first in (int, float, Decimal):
+        return _numeric_kind(values) or ("json", None)
+    return "json", None
+
+
+def _column(kind: str, scale: int | None, column: tuple, nulls: np.ndarray | None) -> tuple[dict[str, Any], bytes]:
+    fill = [0 if v is None else v for v in column] if nulls is not None else column
+    if kind == "i32":
+        return {}, np.array(fill, dtype="<i4").tobytes()
+    if kind == "dec":
+        scaled = [0 if v is None else int(v.scaleb(scale)) for v in column]
+        return {"scale": scale}, np.array(scaled, dtype="<i4").tobytes()
+    if kind == "f64":
+        return {}, np.array([float(v) for v in fill], dtype="<f8").tobytes()
+    if kind == "bool":
+        return {}, np.array(fill, dtype=np.uint8).tobytes()
+    if kind == "date":
+        days = [0 if v is None else v.toordinal() - EPOCH for v in column]
+        return {}, np.array(days, dtype="<i4").tobytes()
+    if kind == "dict":
+        index: dict[str, int] = {}
+        codes = [0 if v is None else index.setdefault(v, len(index)) for v in column]
+        width = 1 if len(index) <= 2**8 else 2 if len(index) <= 2**16 else 4
+        dtype = {1: np.uint8, 2: "<u2", 4: "<u4"}[width]
+        return {"dictionary": list(index), "width": width}, np.array(codes, dtype=dtype).tobytes()
+    return {}, dumps(list(column)).encode()
+
+
+def encode_columnar(payload: dict[str, Any]) -> bytes:
+    """A curated result payload in the column-major binary format (see module comment)."""
+    rows = payload.get("rows", [])
+    n = len(rows)
+    columns = list(zip(*rows)) if n else [() for _ in payload.get("columns", [])]
+    buffers: list[bytes] = []
+    layout: list[dict[str, Any]] = []
+    offset = 0
+
+    def add(buf: bytes) -> int:
+        nonlocal offset
+        at = offset
+        buffers.append(buf)
+        pad = -len(buf) % ALIGN
+        if pad:
+            buffers.append(b"\0" * pad)
+        offset += len(buf) + pad
+        return at
+
+    for column in columns:
+        if any(type(v) in (float, Decimal) and not math.isfinite(v) for v in column):
+            column = tuple(None if type(v) in (float, Decimal) and not math.isfinite(v) else v for v in column)
+        is_null = np.fromiter((v is None for v in column), dtype=bool, count=n)
+        kind, scale = _kind([v for v in column if v is not None])
+        nulls = is_null if kind != "json" and is_null.any() else None
+        meta, buf = _column(kind, scale, column, nulls)
+        entry: dict[str, Any] = {"type": kind, **meta, "offset": add(buf), "length": len(buf)}
+        if nulls is not None:
+            entry["nulls"] = add(np.packbits(nulls, bitorder="little").tobytes())
+        layout.append(entry)
+
+    header = {k: v for k, v in payload.items() if k != "rows"}
+    header["layout"] = layout
+    head = json.dumps(header, default=json_default, separators=(",", ":"), allow_nan=False).encode()
+    head += b" " * (-(len(MAGIC) + 4 + len(head)) % ALIGN)
+    return b"".join([MAGIC, struct.pack("<I", len(head)), head, *buffers])
@@ -0,0 +1,116 @@
+import json
+import math
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+
+def json_default(value: Any) -> Any:
+    # Mirrors FastAPI's jsonable_encoder for the types asyncpg returns, so streamed
+    # rows look exactly like the regular JSON payload. NaN/Infinity aren't JSON: null.
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            return None
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> str:
+    # allow_nan=False: a non-finite float is an error, never a NaN token the client can't parse
+    return json.dumps(value, default=json_default, separators=(",", ":"), allow_nan=False)
+
+
+# Curated results are encoded column by column: each column's type is taken from its declared
+# Postgres type when the caller knows it (app.queries.shared.column_types), else from its first
+# non-null value; values of that type are converted to JSON-native ones with one specialized
+# function for the whole column (no json_default dispatch per value), and the rows then go
+# through the C encoder in one call. The output is byte-for-byte what dumps() produces,
+# except that non-finite floats become null here, as non-finite numerics do in both.
+
+_encode = json.JSONEncoder(separators=(",", ":"), default=json_default, allow_nan=False).encode
+
+# Postgres type name -> the Python type asyncpg returns for it, for the types that need converting
+PG_TYPES: dict[str, type] = {
+    "numeric": Decimal,
+    "float4": float,
+    "float8": float,
+    "date": date,
+    "timestamp": datetime,
+    "timestamptz": datetime,
+    "time": time,
+    "timetz": time,
+    "uuid": UUID,
+}
+
+
+def _decimal_column(column: list) -> list:
+    # A numeric column's values normally share one scale, so the int/float decision is made
+    # once for a finite sample's exponent; same_quantum is much cheaper than as_tuple per value.
+    # A finite sample is never same_quantum with NaN/Infinity, so those go to json_default.
+    sample = next((v for v in column if type(v) is Decimal and v.is_finite()), None)
+    if sample is None:
+        return [json_default(v) if type(v) is Decimal else v for v in column]
+    as_int = sample.as_tuple().exponent >= 0
+    out = []
+    for v in column:
+        if type(v) is not Decimal:
+            out.append(v)
+        elif v.same_quantum(sample):
+            out.append(int(v) if as_int else float(v))
+        else:
+            out.append(json_default(v))
+    return out
+
+
+_CONVERTERS: dict[type, Any] = {
+    float: lambda v: v if math.isfinite(v) else None,
+    date: date.isoformat,
+    datetime: datetime.isoformat,
+    time: time.isoformat,
+    UUID: str,
+}
+
+
+def _json_columns(rows: list, types: list[str | None] | None) -> list[list]:
+    columns = [list(col) for col in zip(*rows)]
+    for i, column in enumerate(columns):
+        if types is not None and types[i] is not None:
+            kind = PG_TYPES.get(types[i])
+        else:
+            kind = type(next((v for v in column if v is not None), None))
+        if kind is Decimal:
+            columns[i] = _decimal_column(column)
+        elif kind in _CONVERTERS:
+            convert = _CONVERTERS[kind]
+            columns[i] = [convert(v) if type(v) is kind else v for v in column]
+    return columns
+
+
+def json_rows(rows: list, types: list[str | None] | None = None) -> list[list]:
+    """Rows (lists, tuples or asyncpg Records) as lists of JSON-native values.
+
+    `types`: the columns' Postgres type names, where known (None for a column: use its values).
+    """
+    if not rows or not len(rows[0]):
+        return [[] for _ in rows]
+    return list(map(list, zip(*_json_columns(rows, types))))
+
+
+def encode_rows(rows: list, types: list[str | None] | None = None) -> list[str]:
+    """One JSON array per row, as dumps() would write each of them."""
+    return [_encode(row) for row in json_rows(rows, types)]
+
+
+def json_result(payload: dict[str, Any], types: list[str | None] | None = None) -> dict[str, Any]:
+    """A curated result payload with its rows converted column-wise (other keys as they are)."""
+    return {**payload, "rows": json_rows(payload["rows"], types)} if "rows" in payload else payload
+
+
+def encode_payload(payload: dict[str, Any], types: list[str | None] | None = None) -> bytes:
+    """dumps(payload).encode() for a curated result, with payload["rows"] converted column-wise."""
+    return _encode(json_result(payload, types)).encode()
@@ -4,6 +4,24 @@ from typing import Any
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 SQL_DIR = BASE_DIR / "sql" / "curated"
+SHARED_SQL_DIR = BASE_DIR / "sql" / "shared"
+
+
+@dataclass(frozen=True)
+class BaseRelation:
+    """A relation several curated queries derive from, over the same parameter window.
+
+    Queries declaring it (QueryDef.base) can run together as one statement that reads the
+    base once (app/queries/shared.py): sql/shared/<id>.sql is the base, and
+    sql/shared/<query_id>.sql derives each query's result from it.
+    """
+
+    id: str
+    description: str
+    # the tables behind it, for reference
+    tables: list[str]
+    # same names and order as the params of every query deriving from it
+    params: list[str]
 
 
 @dataclass(frozen=True)
@@ -16,6 +34,28 @@ class QueryDef:
     params: list[str]
     # optional basic chart hints
     chart: dict[str, Any] | None = None
+    # unique, ascending output columns matching the query's ORDER BY; enables keyset pagination
+    page_key: list[str] | None = None
+    # admission/pool class (see COST_CLASSES in app/db/pool.py)
+    cost_class: str = "light"
+    # shared base relation (BASE_RELATIONS) the query can be derived from in a group
+    base: str | None = None
+
+
+BASE_RELATIONS: dict[str, BaseRelation] = {
+    "revenue_daily": BaseRelation(
+        id="revenue_daily",
+        description="Daily orders and revenue over a date window.",
+        tables=["rollup_revenue_daily"],
+        params=["start_date", "end_date"],
+    ),
+    "cohort_activity": BaseRelation(
+        id="cohort_activity",
+        description="Months 0-12 of activity and revenue for the cohorts in a month window, with cohort sizes.",
+        tables=["rollup_cohort_activity", "rollup_customer_cohort"],
+        params=["start_month", "end_month"],
+    ),
+}
 
 
 QUERIES: dict[str, QueryDef] = {
@@ -26,6 +66,9 @@ QUERIES: dict[str, QueryDef] = {
         sql_file="cohort_retention.sql",
         params=["start_month", "end_month"],
         chart={"type": "heatmap_like"},
+        page_key=["cohort_month", "month_n"],
+        cost_class="heavy",
+        base="cohort_activity",
     ),
     "ltv_by_cohort": QueryDef(
         id="ltv_by_cohort",
@@ -34,6 +77,9 @@ QUERIES: dict[str, QueryDef] = {
         sql_file="ltv_by_cohort.sql",
         params=["start_month", "end_month"],
         chart={"type": "line"},
+        page_key=["cohort_month", "month_n"],
+        cost_class="heavy",
+        base="cohort_activity",
     ),
     "aov_trend": QueryDef(
         id="aov_trend",
@@ -42,6 +88,8 @@ QUERIES: dict[str, QueryDef] = {
         sql_file="aov_trend.sql",
         params=["start_date", "end_date"],
         chart={"type": "line"},
+        page_key=["week"],
+        base="revenue_daily",
     ),
     "conversion_funnel": QueryDef(
         id="conversion_funnel",
@@ -50,6 +98,7 @@ QUERIES: dict[str, QueryDef] = {
         sql_file="conversion_funnel.sql",
         params=["start_date", "end_date"],
         chart={"type": "funnel"},
+        cost_class="heavy",
     ),
     "anomaly_daily_revenue": QueryDef(
         id="anomaly_daily_revenue",
@@ -58,6 +107,8 @@ QUERIES: dict[str, QueryDef] = {
         sql_file="anomaly_daily_revenue.sql",
         params=["start_date", "end_date"],
         chart={"type": "line"},
+        page_key=["day"],
+        base="revenue_daily",
     ),
     "return_rate_by_category": QueryDef(
         id="return_rate_by_category",
@@ -78,7 +129,35 @@ QUERIES: dict[str, QueryDef] = {
 }
 
 
+_SQL_TEXT: dict[str, str] = {}
+
+
+def _read_sql(q: QueryDef) -> str:
+    return (SQL_DIR / q.sql_file).read_text(encoding="utf-8")
+
+
+def preload_sql() -> dict[str, str]:
+    """Read every curated SQL file once (called at app startup)."""
+    for q in QUERIES.values():
+        if q.id not in _SQL_TEXT:
+            _SQL_TEXT[q.id] = _read_sql(q)
+    return dict(_SQL_TEXT)
+
+
 def load_sql(query_id: str) -> str:
-    q = QUERIES[query_id]
-    path = SQL_DIR / q.sql_file
-    return path.read_text(encoding="utf-8")
+    sql = _SQL_TEXT.get(query_id)
+    if sql is None:
+        sql = _SQL_TEXT[query_id] = _read_sql(QUERIES[query_id])
+    return sql
+
+
+_SHARED_SQL_TEXT: dict[str, str] = {}
+
+
+def load_shared_sql(name: str) -> str:
+    """sql/shared/<name>.sql: a base relation's SQL, or a query's derivation from its base."""
+    sql = _SHARED_SQL_TEXT.get(name)
+    if sql is None:
+        text = (SHARED_SQL_DIR / f"{name}.sql").read_text(encoding="utf-8")
+        sql = _SHARED_SQL_TEXT[name] = text.rstrip().rstrip(";")
+    return sql
@@ -1,40 +1,449 @@
+import asyncio
+import base64
+import json
+import time
+from collections.abc import AsyncIterator
+from datetime import date, datetime
+from decimal import Decimal
 from typing import Any
 import asyncpg
+from app.core.config import settings
+from app.core.metrics import QUERY_CACHE, QUERY_COALESCED, QUERY_PHASE_SECONDS, QUERY_ROWS, QUERY_SHARED, timed
+from app.db.admission import admitted_connection
+from app.db.replicas import PRIMARY
+from app.queries.approx import APPROX_QUERIES, EXACT
+from app.queries.cache import CacheKey, result_cache
+from app.queries.encoding import dumps, encode_rows
 from app.queries.registry import QUERIES, load_sql
+from app.queries.shared import column_types, fetch_shared
+from app.queries.singleflight import SingleFlight
+from app.queries.slowlog import slow_log
+from app.queries.snapshot import get_snapshot
+from app.queries.store import result_store
+from app.queries.vectorized import run_vectorized
 
+DATE_PARAMS = {"start_date", "end_date", "start_month", "end_month"}
+# Set on payloads read on a replica that hadn't caught up with the data version: not cached,
+# and callers pop it before sending (the route sends no ETag for them).
+UNVERSIONED = "_unversioned"
+# false on a node that isn't replaying the primary's WAL (no position to compare)
+REPLAYED_SQL = "select coalesce(pg_last_wal_replay_lsn() >= $1::text::pg_lsn, false)"
+STREAM_CHUNK_ROWS = 500
 
-def _coerce_param(name: str, value: str) -> Any:
+in_flight = SingleFlight(settings.single_flight)
+
+
+def _coerce_param(name: str, value: Any) -> Any:
     # Keep coercion simple and explicit.
-    # Dates/months come in as ISO strings and are cast in SQL.
+    # asyncpg binds $N::date placeholders as dates, so ISO strings are parsed here.
     if name in {"limit"}:
         return int(value)
+    if name in DATE_PARAMS and not isinstance(value, date):
+        try:
+            return date.fromisoformat(str(value))
+        except ValueError:
+            raise ValueError(f"Invalid date for param '{name}': {value!r}")
     return value
 
 
-async def run_curated_query(conn: asyncpg.Connection, query_id: str, params: dict[str, str]) -> dict[str, Any]:
+def bind_params(query_id: str, params: dict[str, Any]) -> list[Any]:
     if query_id not in QUERIES:
         raise KeyError(f"Unknown query_id: {query_id}")
-
     q = QUERIES[query_id]
-    sql = load_sql(query_id)
-
     values = []
     for pname in q.params:
         if pname not in params:
             raise ValueError(f"Missing required param '{pname}'")
         values.append(_coerce_param(pname, params[pname]))
+    return values
 
-    records = await conn.fetch(sql, *values)
-    columns = list(records[0].keys()) if records else []
-    rows = [list(r.values()) for r in records]
 
+def _cache_key(query_id: str, values: list[Any]) -> CacheKey:
+    q = QUERIES[query_id]
+    return (query_id, tuple((pname, str(v)) for pname, v in zip(q.params, values)))
+
+
+def _header(query_id: str, values: list[Any]) -> dict[str, Any]:
+    q = QUERIES[query_id]
     return {
         "query_id": q.id,
         "title": q.title,
         "description": q.description,
-        "params": {k: params[k] for k in q.params},
+        "params": {pname: str(v) for pname, v in zip(q.params, values)},
+    }
+
+
+def _payload(query_id: str, values: list[Any], columns: list[str], rows: list) -> dict[str, Any]:
+    # rows: lists, or asyncpg Records straight from the fetch
+    return {
+        **_header(query_id, values),
         "columns": columns,
         "rows": rows,
         "row_count": len(rows),
-        "chart": q.chart,
+        "chart": QUERIES[query_id].chart,
     }
+
+
+# (cache key, data version, use memory, use store): where a computed payload is remembered
+CacheSlot = tuple[CacheKey, str, bool, bool]
+
+
+async def _cache_lookup(
+    query_id: str, values: list[Any], *, use_cache: bool, refresh: bool
+) -> tuple[dict[str, Any] | None, CacheSlot | None]:
+    """A cached payload from the result cache or store, or the slot to remember one in."""
+    use_memory = use_cache and result_cache.enabled
+    use_store = use_cache and result_store.enabled
+    if not (use_memory or use_store):
+        return None, None
+    key = _cache_key(query_id, values)
+    version = await result_cache.data_version()
+    cached = None if refresh or not use_memory else result_cache.get(key, version)
+    if cached is None and use_store:
+        cached = await result_store.get(key, version)
+        if cached is not None:
+            QUERY_CACHE.inc((query_id, "store_hit"))
+            if use_memory:
+                result_cache.put(key, version, cached)
+            return cached, None
+    if not refresh:
+        QUERY_CACHE.inc((query_id, "miss" if cached is None else "hit"))
+    return cached, (key, version, use_memory, use_store)
+
+
+async def caught_up(conn: asyncpg.Connection) -> bool:
+    """Whether what a query reads on conn from now on matches the data version (cache, ETag).
+
+    The version is read on the primary; a replica (up to REPLICA_MAX_LAG_S behind) only matches
+    it once it has replayed the primary's WAL past where the version was read.
+    """
+    if getattr(conn, "node", PRIMARY) == PRIMARY:
+        return True
+    lsn = result_cache.version_lsn
+    return lsn is not None and await conn.fetchval(REPLAYED_SQL, lsn)
+
+
+async def _remember(slot: CacheSlot | None, payload: dict[str, Any]) -> None:
+    if slot is None:
+        return
+    key, version, use_memory, use_store = slot
+    if use_memory:
+        result_cache.put(key, version, payload)
+    if use_store:
+        # the store encodes plain values, not Records
+        await result_store.put(key, version, {**payload, "rows": [list(r) for r in payload["rows"]]})
+
+
+async def run_curated_query(
+    conn: asyncpg.Connection,
+    query_id: str,
+    params: dict[str, Any],
+    *,
+    use_cache: bool = True,
+    refresh: bool = False,
+) -> dict[str, Any]:
+    """Run a curated query through the result cache and the shared on-disk result store.
+
+    `refresh` skips this process's cached copy (cache warming keeps entries from expiring);
+    the store's copy is still used, since other workers may have just computed it.
+    """
+    values = bind_params(query_id, params)
+    cached, slot = await _cache_lookup(query_id, values, use_cache=use_cache, refresh=refresh)
+    if cached is not None:
+        return cached
+    behind = not await caught_up(conn)
+    if behind and slot is not None:
+        QUERY_CACHE.inc((query_id, "replica_behind"))
+        slot = None
+
+    # Pool connections already hold this statement prepared (see app.db.pool).
+    t0 = time.perf_counter()
+    records = await conn.fetch(load_sql(query_id), *values)
+    elapsed = time.perf_counter() - t0
+    QUERY_PHASE_SECONDS.observe((query_id, "execute"), elapsed)
+    slow_log.observe(query_id, values, elapsed)
+    QUERY_ROWS.observe((query_id,), len(records))
+
+    # the Records themselves are the rows: the encoder reads them column-wise
+    columns = list(records[0].keys()) if records else []
+    payload = _payload(query_id, values, columns, records)
+    if behind:
+        payload[UNVERSIONED] = True
+    await _remember(slot, payload)
+    return payload
+
+
+async def run_shared_queries(
+    conn: asyncpg.Connection,
+    query_ids: list[str],
+    params: dict[str, Any],
+    *,
+    use_cache: bool = True,
+    refresh: bool = False,
+) -> dict[str, dict[str, Any]]:
+    """Run curated queries sharing a base relation (and window) with one read of the base.
+
+    Each result is cached as if run on its own; only the ones not cached are computed, and
+    a single one left over runs as its plain curated statement.
+    """
+    values = bind_params(query_ids[0], params)
+    payloads: dict[str, dict[str, Any]] = {}
+    slots: dict[str, CacheSlot | None] = {}
+    for qid in query_ids:
+        cached, slots[qid] = await _cache_lookup(qid, values, use_cache=use_cache, refresh=refresh)
+        if cached is not None:
+            payloads[qid] = cached
+    todo = [qid for qid in query_ids if qid not in payloads]
+    behind = bool(todo) and not await caught_up(conn)
+    if behind:
+        for qid in todo:
+            if slots[qid] is not None:
+                QUERY_CACHE.inc((qid, "replica_behind"))
+                slots[qid] = None
+    if len(todo) == 1:
+        payloads[todo[0]] = await run_curated_query(conn, todo[0], params, use_cache=False)
+        await _remember(slots[todo[0]], payloads[todo[0]])
+    elif todo:
+        t0 = time.perf_counter()
+        results = await fetch_shared(conn, todo, values)
+        elapsed = time.perf_counter() - t0
+        for qid, (columns, rows) in results.items():
+            # the statement's time is each query's execute time: it waited for all of it
+            QUERY_PHASE_SECONDS.observe((qid, "execute"), elapsed)
+            QUERY_ROWS.observe((qid,), len(rows))
+            QUERY_SHARED.inc((qid,))
+            payloads[qid] = _payload(qid, values, columns if rows else [], rows)
+            await _remember(slots[qid], payloads[qid])
+    if behind:
+        for qid in todo:
+            payloads[qid][UNVERSIONED] = True
+    return payloads
+
+
+async def run_approx_query(
+    conn: asyncpg.Connection,
+    query_id: str,
+    params: dict[str, Any],
+    *,
+    use_cache: bool = True,
+) -> dict[str, Any]:
+    """approx=true: the query's approximate version (APPROX_QUERIES), or the exact result.
+
+    The payload's "approx" entry says which, with the error bound.
+    """
+    values = bind_params(query_id, params)
+    impl = APPROX_QUERIES.get(query_id)
+    if impl is None:
+        return {**await run_curated_query(conn, query_id, params, use_cache=use_cache), "approx": EXACT}
+
+    use_cache = use_cache and result_cache.enabled
+    if use_cache:
+        key = (query_id, (*_cache_key(query_id, values)[1], ("approx", "true")))
+        version = await result_cache.data_version()
+        cached = result_cache.get(key, version)
+        QUERY_CACHE.inc((query_id, "miss" if cached is None else "hit"))
+        if cached is not None:
+            return cached
+    behind = not await caught_up(conn)
+    if behind and use_cache:
+        QUERY_CACHE.inc((query_id, "replica_behind"))
+        use_cache = False
+
+    with timed(query_id, "execute"):
+        columns, rows, meta = await impl(conn, *values)
+    QUERY_ROWS.observe((query_id,), len(rows))
+
+    payload = {**_payload(query_id, values, columns, rows), "approx": meta}
+    if behind:
+        payload[UNVERSIONED] = True
+    if use_cache:
+        result_cache.put(key, version, payload)
+    return payload
+
+
+async def execute_curated_query(
+    query_id: str, params: dict[str, Any], *, approx: bool = False, refresh: bool = False
+) -> dict[str, Any]:
+    """Admit and run a curated query (run_curated_query / run_approx_query).
+
+    Concurrent identical requests (same query, normalized params and mode) share one
+    admission slot, connection and execution, and all get its result or its error.
+    `refresh` (cache warming) recomputes the cached result instead of reading it.
+    """
+    values = bind_params(query_id, params)
+    # approximate versions read small sketches, not the heavy class's raw scans
+    cost_class = "light" if approx and query_id in APPROX_QUERIES else None
+
+    async def execute() -> dict[str, Any]:
+        async with admitted_connection(query_id, cost_class) as conn:
+            if approx:
+                return await run_approx_query(conn, query_id, params)
+            return await run_curated_query(conn, query_id, params, refresh=refresh)
+
+    payload, shared = await in_flight.do((_cache_key(query_id, values), approx), execute)
+    if shared:
+        QUERY_COALESCED.inc((query_id,))
+    return dict(payload)
+
+
+async def execute_shared_queries(
+    query_ids: list[str], params: dict[str, Any], *, refresh: bool = False
+) -> dict[str, dict[str, Any]]:
+    """Admit and run a group from shared_groups (run_shared_queries) on one connection."""
+    values = bind_params(query_ids[0], params)
+    query_ids = sorted(set(query_ids))
+
+    async def execute() -> dict[str, dict[str, Any]]:
+        async with admitted_connection(query_ids[0]) as conn:
+            return await run_shared_queries(conn, query_ids, params, refresh=refresh)
+
+    payloads, shared = await in_flight.do((("shared", *query_ids), *_cache_key(query_ids[0], values)[1:]), execute)
+    if shared:
+        for qid in query_ids:
+            QUERY_COALESCED.inc((qid,))
+    return {qid: dict(p) for qid, p in payloads.items()}
+
+
+async def run_snapshot_query(query_id: str, params: dict[str, Any], *, use_cache: bool = True) -> dict[str, Any]:
+    """Same payload as run_curated_query, computed by the NumPy engine over the snapshot."""
+    values = bind_params(query_id, params)
+    snap = get_snapshot()
+
+    use_cache = use_cache and result_cache.enabled
+    if use_cache:
+        key = _cache_key(query_id, values)
+        cached = result_cache.get(key, snap.version)
+        QUERY_CACHE.inc((query_id, "miss" if cached is None else "hit"))
+        if cached is not None:
+            return cached
+
+    # NumPy releases the GIL in its kernels; keep the event loop free meanwhile
+    with timed(query_id, "execute"):
+        columns, rows = await asyncio.to_thread(run_vectorized, snap, query_id, values)
+    QUERY_ROWS.observe((query_id,), len(rows))
+
+    payload = _payload(query_id, values, columns, rows)
+    if use_cache:
+        result_cache.put(key, snap.version, payload)
+    return payload
+
+
+async def stream_curated_query(
+    conn: asyncpg.Connection,
+    query_id: str,
+    values: list[Any],
+    *,
+    chunk_rows: int = STREAM_CHUNK_ROWS,
+) -> AsyncIterator[bytes]:
+    """Yield the result as NDJSON: a header object, one JSON array per row, then a trailer.
+
+    Rows are pulled through a server-side cursor, so memory stays flat regardless of result
+    size. `values` must come from bind_params (validate before the response starts).
+    """
+    header = {**_header(query_id, values), "columns": [], "chart": QUERIES[query_id].chart}
+    row_count = 0
+    lines: list[str] = []
+    chunk: list[asyncpg.Record] = []
+    types = None
+    t0 = time.perf_counter()
+    # server-side cursors only live inside a transaction
+    async with conn.transaction():
+        async for record in conn.cursor(load_sql(query_id), *values, prefetch=chunk_rows):
+            if row_count == 0:
+                header["columns"] = list(record.keys())
+                types = column_types(query_id, header["columns"])
+                lines.append(dumps(header))
+            chunk.append(record)
+            row_count += 1
+            if len(chunk) >= chunk_rows:
+                # encoded a chunk at a time, column-wise, straight from the Records
+                lines.extend(encode_rows(chunk, types))
+                yield ("\n".join(lines) + "\n").encode()
+                lines.clear()
+                chunk.clear()
+    if row_count == 0:
+        lines.append(dumps(header))
+    lines.extend(encode_rows(chunk, types))
+    lines.append(dumps({"row_count": row_count}))
+    QUERY_PHASE_SECONDS.observe((query_id, "stream"), time.perf_counter() - t0)
+    QUERY_ROWS.observe((query_id,), row_count)
+    yield ("\n".join(lines) + "\n").encode()
+
+
+def _encode_cursor(query_id: str, values: list[Any], key: list[Any]) -> str:
+    tagged = []
+    for v in key:
+        if isinstance(v, datetime):
+            tagged.append(["t", v.isoformat()])
+        elif isinstance(v, date):
+            tagged.append(["d", v.isoformat()])
+        elif isinstance(v, Decimal):
+            tagged.append(["n", str(v)])
+        else:
+            tagged.append(["v", v])
+    raw = dumps({"q": query_id, "p": [str(v) for v in values], "k": tagged})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, query_id: str, values: list[Any]) -> list[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+        key = []
+        for tag, v in state["k"]:
+            if tag == "t":
+                key.append(datetime.fromisoformat(v))
+            elif tag == "d":
+                key.append(date.fromisoformat(v))
+            elif tag == "n":
+                key.append(Decimal(v))
+            else:
+                key.append(v)
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if state["q"] != query_id or state["p"] != [str(v) for v in values]:
+        raise ValueError("Cursor does not belong to this query/params")
+    return key
+
+
+async def page_curated_query(
+    conn: asyncpg.Connection,
+    query_id: str,
+    params: dict[str, Any],
+    page_size: int,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    """One keyset page of a curated query; `next_cursor` is None on the last page."""
+    values = bind_params(query_id, params)
+    q = QUERIES[query_id]
+    if not q.page_key:
+        raise ValueError(f"Query '{query_id}' does not support pagination")
+
+    key_cols = ", ".join(q.page_key)
+    inner = load_sql(query_id).rstrip().rstrip(";")
+    args = list(values)
+    where = ""
+    if cursor:
+        after = _decode_cursor(cursor, query_id, values)
+        placeholders = ", ".join(f"${len(args) + i + 1}" for i in range(len(after)))
+        where = f"WHERE ({key_cols}) > ({placeholders})"
+        args.extend(after)
+    args.append(page_size + 1)
+    sql = f"SELECT * FROM (\n{inner}\n) page {where} ORDER BY {key_cols} LIMIT ${len(args)}"
+
+    behind = not await caught_up(conn)
+    with timed(query_id, "execute"):
+        records = await conn.fetch(sql, *args)
+    has_more = len(records) > page_size
+    records = records[:page_size]
+    QUERY_ROWS.observe((query_id,), len(records))
+
+    columns = list(records[0].keys()) if records else []
+    payload = _payload(query_id, values, columns, records)
+    payload["page_size"] = page_size
+    payload["next_cursor"] = (
+        _encode_cursor(query_id, values, [records[-1][c] for c in q.page_key]) if has_more else None
+    )
+    if behind:
+        payload[UNVERSIONED] = True
+    return payload
@@ -0,0 +1,91 @@
+from collections import defaultdict
+from typing import Any
+
+import asyncpg
+from asyncpg.types import Type
+
+from app.queries.registry import QUERIES, load_shared_sql, load_sql
+
+# Shared-scan execution: curated queries deriving from the same base relation (QueryDef.base)
+# over the same window run as one statement. The base is a MATERIALIZED CTE, so it is read
+# once however many queries use it; each query's derivation (sql/shared/<query_id>.sql) is a
+# CTE over it, and their rows come back as one UNION ALL: a leading "_q" column says which
+# query a row belongs to, and every other query's columns are typed NULLs. Each branch
+# keeps its derivation's ORDER BY (Append returns branches in order).
+
+# query_id -> [(column, type)] of the curated statement's result
+_COLUMNS: dict[str, list[tuple[str, Type]]] = {}
+_SQL: dict[tuple[str, ...], str] = {}
+
+
+async def result_columns(conn: asyncpg.Connection, query_id: str) -> list[tuple[str, Type]]:
+    cols = _COLUMNS.get(query_id)
+    if cols is None:
+        stmt = await conn.prepare(load_sql(query_id))
+        cols = _COLUMNS[query_id] = [(a.name, a.type) for a in stmt.get_attributes()]
+    return cols
+
+
+def column_types(query_id: str, columns: list[str]) -> list[str | None] | None:
+    """Postgres type name of each result column, for app.queries.encoding.
+
+    None unless the curated statement's columns are known (result_columns) and are `columns`
+    (an approximate result has its own); a column of a non-built-in type is None.
+    """
+    cols = _COLUMNS.get(query_id)
+    if cols is None or [c for c, _ in cols] != columns:
+        return None
+    return [t.name if t.schema == "pg_catalog" else None for _, t in cols]
+
+
+def shared_sql(base: str, query_ids: list[str]) -> str:
+    """One statement returning every query's rows; result_columns must be known for each."""
+    key = (base, *query_ids)
+    sql = _SQL.get(key)
+    if sql is None:
+        ctes = [f"{base} AS MATERIALIZED (\n{load_shared_sql(base)}\n)"]
+        ctes += [f"_q{i} AS (\n{load_shared_sql(qid)}\n)" for i, qid in enumerate(query_ids)]
+        branches = []
+        for i, qid in enumerate(query_ids):
+            cells = [f"{i} AS _q"]
+            for j, other in enumerate(query_ids):
+                if j == i:
+                    cells.append(f"_q{i}.*")
+                else:
+                    cells.extend(f'NULL::"{t.schema}"."{t.name}"' for _, t in _COLUMNS[other])
+            branches.append(f"SELECT {', '.join(cells)} FROM _q{i}")
+        sql = _SQL[key] = "WITH " + ",\n".join(ctes) + "\n" + "\nUNION ALL\n".join(branches)
+    return sql
+
+
+async def fetch_shared(
+    conn: asyncpg.Connection, query_ids: list[str], values: list[Any]
+) -> dict[str, tuple[list[str], list[list[Any]]]]:
+    """(columns, rows) per query, from one statement over the queries' shared base."""
+    base = QUERIES[query_ids[0]].base
+    columns = [await result_columns(conn, qid) for qid in query_ids]
+    # each query's columns sit after "_q" and the columns of the queries before it
+    spans, start = [], 1
+    for cols in columns:
+        spans.append((start, start + len(cols)))
+        start += len(cols)
+    out = {qid: ([c for c, _ in cols], []) for qid, cols in zip(query_ids, columns)}
+    for record in await conn.fetch(shared_sql(base, query_ids), *values):
+        row = list(record.values())
+        lo, hi = spans[row[0]]
+        out[query_ids[row[0]]][1].append(row[lo:hi])
+    return out
+
+
+def shared_groups(items: list[tuple[str, list[Any] | None]]) -> list[list[int]]:
+    """Indexes of the (query_id, bound values) items that can run together, per group.
+
+    Items group when their queries share a base relation, a cost class (one admission) and
+    the window; groups need at least two distinct queries. Everything else runs on its own.
+    """
+    by_key: dict[tuple, list[int]] = defaultdict(list)
+    for i, (qid, values) in enumerate(items):
+        q = QUERIES.get(qid)
+        if q is not None and q.base is not None and values is not None:
+            by_key[(q.base, q.cost_class, *map(str, values))].append(i)
+    return [idx for idx in by_key.values() if len({items[i][0] for i in idx}) > 1]
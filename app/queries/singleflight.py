@@ -0,0 +1,54 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution of `fn` and its outcome.
+
+    The execution runs in its own task: a caller that is cancelled (client went away) only
+    stops waiting, and the execution is cancelled once no caller is left. Exceptions reach
+    every caller; nothing is remembered after the call completes.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._calls: dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Result of fn() or of the identical call already in flight, and whether it was shared."""
+        if not self.enabled:
+            return await fn(), False
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.create_task(fn()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # nobody is waiting any more: stop the query, and let the next caller start afresh
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict[str, int]:
+        return {"in_flight": len(self._calls), "executions": self.executions, "coalesced": self.coalesced}
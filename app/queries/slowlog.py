@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import re
+from collections import deque
+from datetime import date, datetime, timezone
+from typing import Any
+
+import asyncpg
+
+from app.core.config import settings
+from app.db.admission import Overloaded, admitted_connection
+from app.queries.registry import QUERIES, load_sql
+
+log = logging.getLogger(__name__)
+
+# Date windows are bucketed so "the same query over a similar range" shares one capture.
+SPAN_BUCKETS_DAYS = (7, 31, 92, 183, 366)
+TOP_NODES = 5
+
+
+def param_shape(query_id: str, values: list[Any]) -> str:
+    by_name = dict(zip(QUERIES[query_id].params, values))
+    parts = []
+    for start, end in (("start_date", "end_date"), ("start_month", "end_month")):
+        if isinstance(by_name.get(start), date) and isinstance(by_name.get(end), date):
+            days = (by_name[end] - by_name[start]).days
+            bucket = next((f"<={b}d" for b in SPAN_BUCKETS_DAYS if days <= b), f">{SPAN_BUCKETS_DAYS[-1]}d")
+            parts.append(f"{start.split('_')[1]}_span{bucket}")
+    return ",".join(parts) or "-"
+
+
+def _subplan_refs(name: str) -> list[re.Pattern]:
+    # "InitPlan 2 (returns $1,$2)" is referenced as $1/$2 (PG <= 16) or "(InitPlan 2)" (PG 17+)
+    m = re.match(r"(InitPlan|SubPlan) (\d+)(?: \(returns (.*)\))?", name)
+    if not m:
+        return []
+    refs = [re.compile(re.escape(f"({m[1]} {m[2]})"))]
+    refs += [re.compile(re.escape(p.strip()) + r"(?!\d)") for p in (m[3] or "").split(",") if p.strip()]
+    return refs
+
+
+def _top_nodes(plan: dict[str, Any], limit: int = TOP_NODES) -> list[dict[str, Any]]:
+    """Plan nodes ranked by exclusive time (own time, children subtracted, times loops).
+
+    CTEs, InitPlans and SubPlans hang off one node but their time is reported by the nodes
+    that evaluate them (a CTE Scan, an expression using $n), so they are charged there.
+    Needs a VERBOSE plan to see those references.
+    """
+    nodes = []
+    # subplan name -> ms not yet charged to a referencing node
+    unclaimed: dict[str, float] = {}
+    refs: dict[str, list[re.Pattern]] = {}
+
+    def node_ms(node: dict[str, Any]) -> float:
+        return node.get("Actual Total Time", 0.0) * node.get("Actual Loops", 1)
+
+    def collect(node: dict[str, Any]) -> None:
+        name = node.get("Subplan Name")
+        if name:
+            unclaimed[name] = node_ms(node)
+            refs[name] = _subplan_refs(name)
+        for child in node.get("Plans", []):
+            collect(child)
+
+    def charged(node: dict[str, Any], total_ms: float) -> float:
+        ms = 0.0
+        cte = node.get("CTE Name")
+        if node["Node Type"] == "CTE Scan" and f"CTE {cte}" in unclaimed:
+            # several scans may drive one CTE; each takes at most its own time
+            take = min(unclaimed[f"CTE {cte}"], total_ms)
+            unclaimed[f"CTE {cte}"] -= take
+            ms += take
+        text = json.dumps({k: v for k, v in node.items() if k not in ("Plans", "Subplan Name")})
+        for name, patterns in refs.items():
+            if unclaimed.get(name) and any(p.search(text) for p in patterns):
+                ms += unclaimed.pop(name)  # evaluated once, by the first node that needs it
+        return ms
+
+    def walk(node: dict[str, Any]) -> None:
+        # children first: the deepest node mentioning $n is the one that evaluated it,
+        # the nodes above only pass the value through
+        for child in node.get("Plans", []):
+            walk(child)
+        total_ms = node_ms(node)
+        children_ms = sum(
+            node_ms(child)
+            for child in node.get("Plans", [])
+            if child.get("Parent Relationship") not in ("InitPlan", "SubPlan")
+        )
+        children_ms += charged(node, total_ms)
+        nodes.append(
+            {
+                "node": node["Node Type"],
+                "relation": node.get("Relation Name") or node.get("CTE Name"),
+                "index": node.get("Index Name"),
+                "self_ms": round(max(total_ms - children_ms, 0.0), 3),
+                "total_ms": round(total_ms, 3),
+                "rows": node.get("Actual Rows", 0) * node.get("Actual Loops", 1),
+                "loops": node.get("Actual Loops", 1),
+                "shared_hit": node.get("Shared Hit Blocks", 0),
+                "shared_read": node.get("Shared Read Blocks", 0),
+                "temp_written": node.get("Temp Written Blocks", 0),
+            }
+        )
+
+    collect(plan)
+    walk(plan)
+    nodes.sort(key=lambda n: n["self_ms"], reverse=True)
+    return nodes[:limit]
+
+
+class SlowQueryLog:
+    """Curated queries over the threshold, with one EXPLAIN ANALYZE per (query_id, param shape).
+
+    Captures run in the background on a connection from the query's own cost class, so a
+    slow request isn't made slower and the re-run stays within that class's budget.
+    """
+
+    def __init__(self, threshold_ms: float, max_entries: int) -> None:
+        self.threshold_ms = threshold_ms
+        self.entries: deque[dict[str, Any]] = deque(maxlen=max_entries)
+        # (query_id, shape) -> slow executions seen / captured
+        self.seen: dict[tuple[str, str], int] = {}
+        self._captured: set[tuple[str, str]] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0 and self.entries.maxlen > 0
+
+    def observe(self, query_id: str, values: list[Any], duration_s: float) -> None:
+        duration_ms = duration_s * 1000
+        if not self.enabled or duration_ms < self.threshold_ms:
+            return
+        key = (query_id, param_shape(query_id, values))
+        self.seen[key] = self.seen.get(key, 0) + 1
+        if key in self._captured:
+            return
+        self._captured.add(key)
+        task = asyncio.create_task(self._capture(key, values, duration_ms))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _capture(self, key: tuple[str, str], values: list[Any], duration_ms: float) -> None:
+        query_id, shape = key
+        try:
+            self.entries.append(await self._explain(query_id, shape, values, duration_ms))
+        except (Overloaded, asyncpg.PostgresError, OSError) as e:
+            # let a later slow run of this shape try again
+            self._captured.discard(key)
+            log.warning("slow-query plan capture for %s (%s) failed: %s", query_id, shape, e)
+        except Exception:
+            # a plan this module can't read: same, but with the traceback
+            self._captured.discard(key)
+            log.exception("slow-query plan capture for %s (%s) failed", query_id, shape)
+
+    async def _explain(self, query_id: str, shape: str, values: list[Any], duration_ms: float) -> dict[str, Any]:
+        sql = "EXPLAIN (ANALYZE, BUFFERS, VERBOSE, FORMAT JSON)\n" + load_sql(query_id)
+        async with admitted_connection(query_id) as conn:
+            raw = await conn.fetchval(sql, *values)
+        explained = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+        return {
+            "query_id": query_id,
+            "param_shape": shape,
+            "params": {p: str(v) for p, v in zip(QUERIES[query_id].params, values)},
+            "duration_ms": round(duration_ms, 3),
+            "captured_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "explain_planning_ms": explained.get("Planning Time"),
+            "explain_execution_ms": explained.get("Execution Time"),
+            "top_nodes": _top_nodes(explained["Plan"]),
+            "plan": explained["Plan"],
+        }
+
+    async def close(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self, include_plans: bool = False) -> dict[str, Any]:
+        entries = list(reversed(self.entries))
+        if not include_plans:
+            entries = [{k: v for k, v in e.items() if k != "plan"} for e in entries]
+        return {
+            "threshold_ms": self.threshold_ms,
+            "max_entries": self.entries.maxlen,
+            "slow_counts": [
+                {"query_id": qid, "param_shape": shape, "count": n} for (qid, shape), n in sorted(self.seen.items())
+            ],
+            "entries": entries,
+        }
+
+
+slow_log = SlowQueryLog(threshold_ms=settings.slow_query_ms, max_entries=settings.slow_query_log_size)
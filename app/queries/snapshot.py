@@ -0,0 +1,273 @@
+import json
+import shutil
+from collections.abc import Callable
+from datetime import datetime, timezone
+from functools import cached_property
+from pathlib import Path
+from typing import Any
+
+import asyncpg
+import numpy as np
+
+from app.core.config import settings
+from app.queries.cache import fetch_data_version
+
+# Columnar snapshot of the warehouse tables the curated queries read: one .npy file per
+# column (memory-mapped on load) plus manifest.json. Encodings:
+#   int    int64 (NULL -> -1)          money  int64 cents
+#   ts     int64 epoch microseconds, UTC (NULL -> NULL_TS)
+#   small  int32                       category  int16 codes into a dictionary (NULL -> -1)
+#   uuid   int32 codes into <column>.dict.npy (16-byte values)
+FORMAT_VERSION = 1
+NULL_TS = np.iinfo(np.int64).min
+EXPORT_CHUNK_ROWS = 50_000
+
+# table -> (sort key, [(column, encoding)])
+TABLES: dict[str, tuple[str, list[tuple[str, str]]]] = {
+    "orders": (
+        "order_id",
+        [
+            ("order_id", "int"),
+            ("customer_id", "int"),
+            ("order_ts", "ts"),
+            ("status", "category"),
+            ("channel", "category"),
+            ("shipping_cost", "money"),
+        ],
+    ),
+    "order_items": (
+        "order_id, order_item_id",
+        [
+            ("order_id", "int"),
+            ("product_id", "int"),
+            ("quantity", "small"),
+            ("unit_price", "money"),
+            ("discount", "money"),
+        ],
+    ),
+    "products": (
+        "product_id",
+        [("product_id", "int"), ("category", "category"), ("unit_price", "money")],
+    ),
+    "shipments": (
+        "order_id",
+        [
+            ("order_id", "int"),
+            ("carrier", "category"),
+            ("service_level", "category"),
+            ("shipped_ts", "ts"),
+            ("delivered_ts", "ts"),
+            ("status", "category"),
+        ],
+    ),
+    "refunds": (
+        "refund_id",
+        [("order_id", "int"), ("refund_ts", "ts"), ("amount", "money"), ("reason", "category")],
+    ),
+    "web_events": (
+        "event_ts, event_id",
+        [
+            ("event_ts", "ts"),
+            ("session_id", "uuid"),
+            ("customer_id", "int"),
+            ("event_type", "category"),
+            ("product_id", "int"),
+            ("channel", "category"),
+        ],
+    ),
+}
+
+DTYPES = {"int": np.int64, "money": np.int64, "ts": np.int64, "small": np.int32, "category": np.int16, "uuid": np.int32}
+
+
+def _select_expr(column: str, encoding: str, dict_param: int | None) -> str:
+    if encoding == "int":
+        return f"coalesce({column}, -1)::bigint"
+    if encoding == "money":
+        return f"({column} * 100)::bigint"
+    if encoding == "ts":
+        return f"coalesce((extract(epoch from {column}) * 1000000)::bigint, {NULL_TS})"
+    if encoding == "small":
+        return f"{column}::int"
+    if encoding == "category":
+        return f"coalesce(array_position(${dict_param}::text[], {column}::text) - 1, -1)::smallint"
+    if encoding == "uuid":
+        return f"(dense_rank() over (order by {column}) - 1)::int"
+    raise ValueError(f"Unknown column encoding {encoding!r}")
+
+
+async def _export_table(conn: asyncpg.Connection, out_dir: Path, table: str) -> dict[str, Any]:
+    sort_key, columns = TABLES[table]
+    rows = await conn.fetchval(f"select count(*) from {table}")
+    (out_dir / table).mkdir()
+
+    meta: dict[str, Any] = {"rows": rows, "columns": {}}
+    exprs, args = [], []
+    for column, encoding in columns:
+        col_meta: dict[str, Any] = {"encoding": encoding, "file": f"{table}/{column}.npy"}
+        dict_param = None
+        if encoding == "category":
+            values = await conn.fetchval(
+                f"select coalesce(array_agg(distinct {column}::text order by {column}::text), '{{}}') "
+                f"from {table} where {column} is not null"
+            )
+            col_meta["dictionary"] = list(values)
+            args.append(values)
+            dict_param = len(args)
+        elif encoding == "uuid":
+            values = await conn.fetchval(f"select array_agg(distinct {column} order by {column}) from {table}")
+            dictionary = np.array([v.bytes for v in values or []], dtype="S16")
+            np.save(out_dir / table / f"{column}.dict.npy", dictionary)
+            col_meta["dictionary_file"] = f"{table}/{column}.dict.npy"
+            col_meta["dictionary_size"] = len(dictionary)
+        exprs.append(_select_expr(column, encoding, dict_param))
+        meta["columns"][column] = col_meta
+
+    arrays = [
+        np.lib.format.open_memmap(out_dir / table / f"{column}.npy", mode="w+", dtype=DTYPES[encoding], shape=(rows,))
+        for column, encoding in columns
+    ]
+    sql = f"select {', '.join(exprs)} from {table} order by {sort_key}"
+    offset = 0
+    cur = await conn.cursor(sql, *args)
+    while offset < rows:
+        records = await cur.fetch(EXPORT_CHUNK_ROWS)
+        if not records:
+            break
+        n = len(records)
+        for i, arr in enumerate(arrays):
+            arr[offset : offset + n] = np.fromiter((r[i] for r in records), dtype=arr.dtype, count=n)
+        offset += n
+    for arr in arrays:
+        arr.flush()
+    return meta
+
+
+async def export_snapshot(conn: asyncpg.Connection, path: Path) -> dict[str, Any]:
+    """Write a snapshot of TABLES to `path`, replacing any previous one only once complete."""
+    staging = path.with_name(path.name + ".new")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    # one MVCC snapshot for every table, so rows and counts agree across tables
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        manifest: dict[str, Any] = {
+            "format": FORMAT_VERSION,
+            "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "source_data_version": await fetch_data_version(conn),
+            # curated SQL buckets days/weeks/months in the server time zone; this engine uses UTC
+            "source_timezone": await conn.fetchval("show timezone"),
+            "tables": {},
+        }
+        for table in TABLES:
+            manifest["tables"][table] = await _export_table(conn, staging, table)
+    (staging / "manifest.json").write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+
+    old = path.with_name(path.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if path.exists():
+        path.rename(old)
+    staging.rename(path)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+class Table:
+    def __init__(self, root: Path, name: str, meta: dict[str, Any]) -> None:
+        self.name = name
+        self.rows: int = meta["rows"]
+        self.meta = meta["columns"]
+        self._root = root
+        self._columns: dict[str, np.ndarray] = {}
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        arr = self._columns.get(column)
+        if arr is None:
+            arr = self._columns[column] = np.load(self._root / self.meta[column]["file"], mmap_mode="r")
+        return arr
+
+    def dictionary(self, column: str) -> list[str]:
+        return self.meta[column]["dictionary"]
+
+    def codes(self, column: str, values: tuple[str, ...] | list[str]) -> np.ndarray:
+        """Dictionary codes of `values` (values absent from the snapshot are skipped)."""
+        lookup = {v: i for i, v in enumerate(self.dictionary(column))}
+        return np.array([lookup[v] for v in values if v in lookup], dtype=np.int16)
+
+    def isin(self, column: str, values: tuple[str, ...] | list[str]) -> np.ndarray:
+        return np.isin(self[column], self.codes(column, values))
+
+
+class Snapshot:
+    """A loaded snapshot directory; columns are memory-mapped on first access."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        manifest = json.loads((self.path / "manifest.json").read_text(encoding="utf-8"))
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"{self.path}: snapshot format {manifest.get('format')!r}, expected {FORMAT_VERSION}")
+        self.manifest = manifest
+        self.tables = {name: Table(self.path, name, meta) for name, meta in manifest["tables"].items()}
+        self._derived: dict[str, Any] = {}
+
+    def __getitem__(self, table: str) -> Table:
+        return self.tables[table]
+
+    @property
+    def version(self) -> str:
+        return f"snapshot={self.manifest['exported_at']}|{self.manifest['source_data_version']}"
+
+    def derived(self, name: str, build: Callable[[], Any]) -> Any:
+        """Parameter-independent intermediate results, built once per snapshot."""
+        if name not in self._derived:
+            self._derived[name] = build()
+        return self._derived[name]
+
+    # Join indexes and per-order totals, derived once per snapshot on first use.
+
+    @cached_property
+    def item_order_pos(self) -> np.ndarray:
+        """Row in `orders` of each order item (-1 if its order isn't in the snapshot)."""
+        return positions(self["orders"]["order_id"], self["order_items"]["order_id"])
+
+    @cached_property
+    def item_category(self) -> np.ndarray:
+        products = self["products"]
+        pos = positions(products["product_id"], self["order_items"]["product_id"])
+        return np.where(pos >= 0, products["category"][pos], -1).astype(np.int16)
+
+    @cached_property
+    def order_items_cents(self) -> tuple[np.ndarray, np.ndarray]:
+        """Per order row: sum(quantity * unit_price - discount) in cents, and its item count."""
+        items = self["order_items"]
+        line = items["quantity"].astype(np.int64) * items["unit_price"] - items["discount"]
+        pos = self.item_order_pos
+        known = pos >= 0
+        n = self["orders"].rows
+        # float64 sums are exact below 2**53 cents
+        cents = np.bincount(pos[known], weights=line[known], minlength=n)
+        return np.rint(cents).astype(np.int64), np.bincount(pos[known], minlength=n)
+
+    @cached_property
+    def items_by_order(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """order_items is sorted by order_id: (distinct order ids, first item row, item count)."""
+        order_ids, starts, counts = np.unique(self["order_items"]["order_id"], return_index=True, return_counts=True)
+        return order_ids, starts, counts
+
+
+def positions(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Index of each key in `sorted_keys`, -1 where absent."""
+    if len(sorted_keys) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return np.where(sorted_keys[pos] == keys, pos, -1)
+
+
+_snapshot: Snapshot | None = None
+
+
+def get_snapshot() -> Snapshot:
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = Snapshot(Path(settings.snapshot_dir))
+    return _snapshot
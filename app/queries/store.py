@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from app.core.config import settings
+from app.queries.cache import CacheKey
+
+log = logging.getLogger(__name__)
+
+# bumped whenever the payload encoding changes: an older file is emptied on open
+FORMAT_VERSION = 2
+
+SCHEMA = """
+create table if not exists results (
+  key          text primary key,
+  query_id     text not null,
+  data_version text not null,
+  stored_at    real not null,
+  accessed_at  real not null,
+  size         integer not null,
+  payload      blob not null
+);
+create index if not exists results_accessed_at on results (accessed_at);
+"""
+
+# Payloads are stored as JSON, rows column by column with a type tag for the columns whose
+# values JSON has no type for; a hit decodes to the same Python values the query returned, so
+# it encodes (JSON or columnar) exactly like a fresh result.
+_TAGS: dict[type, str] = {Decimal: "numeric", date: "date", datetime: "timestamp", dtime: "time", UUID: "uuid"}
+_DUMP: dict[str, Any] = {
+    "numeric": str,
+    "date": date.isoformat,
+    "timestamp": datetime.isoformat,
+    "time": dtime.isoformat,
+    "uuid": str,
+}
+_LOAD: dict[str, Any] = {
+    "numeric": Decimal,
+    "date": date.fromisoformat,
+    "timestamp": datetime.fromisoformat,
+    "time": dtime.fromisoformat,
+    "uuid": UUID,
+}
+
+
+def _tag(column: list) -> str | None:
+    kinds = {type(v) for v in column if v is not None}
+    if not kinds & _TAGS.keys():
+        return None
+    if len(kinds) > 1:
+        raise TypeError(f"column mixes {', '.join(sorted(k.__name__ for k in kinds))}")
+    return _TAGS[kinds.pop()]
+
+
+def dump_payload(payload: dict[str, Any]) -> bytes:
+    """A curated result payload as the store keeps it (TypeError for values it can't type)."""
+    columns = [list(c) for c in zip(*payload["rows"])]
+    tags = [_tag(c) for c in columns]
+    for i, t in enumerate(tags):
+        if t is not None:
+            columns[i] = [None if v is None else _DUMP[t](v) for v in columns[i]]
+    doc = {
+        # rows stay in place (None) so a decoded payload keeps its key order
+        "payload": {**payload, "rows": None},
+        "row_count": len(payload["rows"]),
+        "types": tags,
+        "columns": columns,
+    }
+    return json.dumps(doc, separators=(",", ":")).encode()
+
+
+def load_payload(blob: bytes) -> dict[str, Any]:
+    doc = json.loads(blob)
+    columns = doc["columns"]
+    for i, t in enumerate(doc["types"]):
+        if t is not None:
+            columns[i] = [None if v is None else _LOAD[t](v) for v in columns[i]]
+    rows = [list(r) for r in zip(*columns)] if columns else [[] for _ in range(doc["row_count"])]
+    return {**doc["payload"], "rows": rows}
+
+
+# A hit only rewrites accessed_at (the LRU order) when it is older than this, so
+# concurrent readers don't turn every hit into a write.
+TOUCH_EVERY_S = 30.0
+
+
+class ResultStore:
+    """Curated query payloads in a SQLite file, shared by every worker process on the host.
+
+    Sits under the in-process ResultCache: entries are keyed on query id + normalized params
+    and only served at the data version they were computed at, so a result computed by one
+    worker, or before a restart, is served by all of them. The data version is what expires
+    them; `ttl_s` (much longer than the in-process cache's) only bounds how long one is
+    trusted across a Postgres stats reset, which can bring an old version back.
+    Evicts least recently used entries beyond `max_bytes`. SQLite in WAL mode handles
+    concurrent readers and one writer at a time across processes; calls run in a thread.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl_s: float) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.enabled = bool(path) and max_bytes > 0
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per process (a forked worker must not reuse its parent's)
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.execute("begin immediate")
+            try:
+                if conn.execute("pragma user_version").fetchone()[0] != FORMAT_VERSION:
+                    conn.execute("drop table if exists results")
+                    conn.execute(f"pragma user_version = {FORMAT_VERSION}")
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _key(key: CacheKey) -> str:
+        return json.dumps(key, separators=(",", ":"))
+
+    def _get(self, key: CacheKey, version: str) -> dict[str, Any] | None:
+        with self._lock:
+            conn = self._connect()
+            skey = self._key(key)
+            row = conn.execute(
+                "select payload, accessed_at from results where key = ? and data_version = ? and stored_at >= ?",
+                (skey, version, time.time() - self.ttl_s),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            if now - row[1] > TOUCH_EVERY_S:
+                conn.execute("update results set accessed_at = ? where key = ?", (now, skey))
+            self.hits += 1
+        return load_payload(row[0])
+
+    def _put(self, key: CacheKey, version: str, payload: dict[str, Any]) -> None:
+        try:
+            blob = dump_payload(payload)
+        except TypeError as e:
+            # still served from the in-process cache, just not shared
+            log.warning("result for %s not stored: %s", key[0], e)
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("begin immediate")
+            try:
+                conn.execute(
+                    "insert or replace into results values (?, ?, ?, ?, ?, ?, ?)",
+                    (self._key(key), key[0], version, now, now, len(blob), blob),
+                )
+                conn.execute("delete from results where stored_at < ?", (now - self.ttl_s,))
+                total = conn.execute("select coalesce(sum(size), 0) from results").fetchone()[0]
+                if total > self.max_bytes:
+                    # drop least recently used entries until back under the limit
+                    evicted = conn.execute(
+                        """
+                        delete from results where key in (
+                          select key from (
+                            select key, sum(size) over (order by accessed_at desc, key) as kept
+                            from results
+                          ) where kept > ?
+                        )
+                        """,
+                        (self.max_bytes,),
+                    ).rowcount
+                    self.evictions += evicted
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+            self.writes += 1
+
+    async def get(self, key: CacheKey, version: str) -> dict[str, Any] | None:
+        return await asyncio.to_thread(self._get, key, version)
+
+    async def put(self, key: CacheKey, version: str, payload: dict[str, Any]) -> None:
+        await asyncio.to_thread(self._put, key, version, payload)
+
+    def _size(self) -> tuple[int, int]:
+        with self._lock:
+            return self._connect().execute("select count(*), coalesce(sum(size), 0) from results").fetchone()
+
+    async def stats(self) -> dict[str, Any]:
+        out: dict[str, Any] = {
+            "enabled": self.enabled,
+            "path": self.path,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+        if self.enabled:
+            entries, size = await asyncio.to_thread(self._size)
+            out.update(entries=entries, bytes=size)
+        return out
+
+
+result_store = ResultStore(
+    path=settings.result_store_path,
+    max_bytes=int(settings.result_store_max_mb * 1024 * 1024),
+    ttl_s=settings.result_store_ttl_s,
+)
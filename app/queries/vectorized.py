@@ -0,0 +1,397 @@
+from collections.abc import Callable
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from math import isqrt
+from typing import Any
+
+import numpy as np
+
+from app.queries.snapshot import NULL_TS, Snapshot, positions
+
+# NumPy implementations of the curated queries over a columnar snapshot. Each returns the
+# columns and rows the SQL version does, with the same Python types (date, int, Decimal at
+# the same scale), so payloads and their JSON encoding are interchangeable. Rounding is
+# exact where the SQL result is exact (numeric ratios) and half away from zero like
+# numeric round(). Calendar buckets are UTC.
+
+PAID = ("paid", "shipped", "delivered", "refunded")
+DAY_US = 86_400_000_000
+# (cohort, month) pairs are packed into one int64 key: a * MONTH_SPAN + b
+MONTH_SPAN = 1 << 16
+SLA_DAYS = {"standard": 5, "expedited": 3, "overnight": 1}
+FUNNEL_STAGES = [
+    ("sessions", "session_start"),
+    ("product_view", "product_view"),
+    ("add_to_cart", "add_to_cart"),
+    ("checkout_start", "checkout_start"),
+    ("purchase", "purchase"),
+]
+
+Result = tuple[list[str], list[list[Any]]]
+
+
+def _day(d: date) -> int:
+    return (d - date(1970, 1, 1)).days
+
+
+def _window(ts: np.ndarray, start: date, end: date) -> np.ndarray:
+    # ts >= $start::date AND ts < ($end::date + interval '1 day')
+    return (ts >= _day(start) * DAY_US) & (ts < (_day(end) + 1) * DAY_US)
+
+
+def _days(ts: np.ndarray) -> np.ndarray:
+    return ts // DAY_US
+
+
+def _month_first_day(ts: np.ndarray) -> np.ndarray:
+    # date_trunc('month', ts)::date as days since epoch
+    return ts.astype("datetime64[us]").astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+
+
+def _months(first_days: np.ndarray) -> np.ndarray:
+    return first_days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _dates(days: np.ndarray) -> list[date]:
+    return np.asarray(days, dtype=np.int64).astype("datetime64[D]").tolist()
+
+
+def _round_ratio(num: np.ndarray, den: np.ndarray, places: int) -> np.ndarray:
+    """round(num / den, places) * 10**places, half away from zero; den > 0."""
+    scaled = np.asarray(num, dtype=np.int64) * 10**places
+    den = np.asarray(den, dtype=np.int64)
+    return np.sign(scaled) * ((2 * np.abs(scaled) + den) // (2 * den))
+
+
+def _round_sqrt(num: int, den: int) -> int:
+    # round(sqrt(num / den)) half away from zero, exactly: floor(sqrt(x) + 1/2)
+    return (isqrt(4 * num // den) + 1) // 2
+
+
+def _dec(scaled: Any, places: int) -> Decimal:
+    return Decimal(int(scaled)).scaleb(-places)
+
+
+def _float_dec(value: float, places: int) -> Decimal:
+    # double precision -> numeric keeps 15 significant digits, then round()
+    return Decimal(f"{value:.15g}").quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+
+
+def _group_sum(inverse: np.ndarray, values: np.ndarray, n: int) -> np.ndarray:
+    # float64 sums are exact below 2**53
+    return np.rint(np.bincount(inverse, weights=values, minlength=n)).astype(np.int64)
+
+
+def _paid_orders_with_items(snap: Snapshot) -> np.ndarray:
+    _, item_count = snap.order_items_cents
+    return snap["orders"].isin("status", PAID) & (item_count > 0)
+
+
+def _order_revenue(snap: Snapshot) -> np.ndarray:
+    cents, _ = snap.order_items_cents
+    return cents + snap["orders"]["shipping_cost"]
+
+
+def aov_trend(snap: Snapshot, start_date: date, end_date: date) -> Result:
+    orders = snap["orders"]
+    mask = _paid_orders_with_items(snap) & _window(orders["order_ts"], start_date, end_date)
+    days = _days(orders["order_ts"][mask])
+    # date_trunc('week'): weeks start on Monday; 1970-01-01 was a Thursday
+    weeks, inverse = np.unique(days - (days + 3) % 7, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(weeks))
+    aov = _round_ratio(_group_sum(inverse, _order_revenue(snap)[mask], len(weeks)), counts, 0)
+
+    # avg(aov) over the current and 3 preceding weeks
+    prefix = np.concatenate([[0], np.cumsum(aov)])
+    idx = np.arange(len(weeks))
+    lo = np.maximum(idx - 3, 0)
+    ma = _round_ratio(prefix[idx + 1] - prefix[lo], idx + 1 - lo, 0)
+
+    rows = [[w, int(n), _dec(a, 2), _dec(m, 2)] for w, n, a, m in zip(_dates(weeks), counts, aov, ma)]
+    return ["week", "orders", "aov", "aov_4wk_ma"], rows
+
+
+def anomaly_daily_revenue(snap: Snapshot, start_date: date, end_date: date) -> Result:
+    orders = snap["orders"]
+    mask = _paid_orders_with_items(snap) & _window(orders["order_ts"], start_date, end_date)
+    days, inverse = np.unique(_days(orders["order_ts"][mask]), return_inverse=True)
+    revenue = _group_sum(inverse, _order_revenue(snap)[mask], len(days))
+
+    # trailing window: the 28 preceding rows (days with revenue), not calendar days
+    s1 = np.concatenate([[0], np.cumsum(revenue)])
+    s2 = np.concatenate([[0], np.cumsum(revenue * revenue)])
+    rows = []
+    for i, (day, rev) in enumerate(zip(_dates(days), revenue.tolist())):
+        lo = max(i - 28, 0)
+        n = i - lo
+        total = int(s1[i] - s1[lo])
+        mean = sd = z = None
+        if n:
+            mean = _dec(_round_ratio(total, n, 0), 2)
+        if n >= 2:
+            # sample variance (in cents^2) = var_num / var_den
+            var_num = n * int(s2[i] - s2[lo]) - total * total
+            var_den = n * (n - 1)
+            sd = _dec(_round_sqrt(var_num, var_den), 2)
+            if var_num:
+                # z = (rev - total/n) / sqrt(var): round(z, 2) from z^2 * 10^4 = p / q
+                dev = n * rev - total
+                p = 10_000 * dev * dev * var_den
+                q = n * n * var_num
+                z = _dec((1 if dev >= 0 else -1) * _round_sqrt(p, q), 2)
+        rows.append([day, _dec(rev, 2), mean, sd, z])
+    return ["day", "revenue", "trailing_mean_28d", "trailing_sd_28d", "z_score"], rows
+
+
+def _cohorts(snap: Snapshot) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Paid orders' customer index and order month, and each customer's cohort month.
+
+    Months are counted since 1970-01 (first_order/orders_by_month in the reference SQL).
+    """
+
+    def build() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        orders = snap["orders"]
+        paid = orders.isin("status", PAID)
+        customers, inverse = np.unique(orders["customer_id"][paid], return_inverse=True)
+        month = _months(_month_first_day(orders["order_ts"][paid]))
+        by_customer = np.argsort(inverse, kind="stable")
+        starts = np.flatnonzero(np.diff(inverse[by_customer], prepend=-1))
+        cohort = np.minimum.reduceat(month[by_customer], starts) if len(starts) else month[:0]
+        return inverse, month, cohort
+
+    return snap.derived("cohorts", build)
+
+
+def _month_index(d: date) -> int:
+    return (d.year - 1970) * 12 + d.month - 1
+
+
+def _in_months(months: np.ndarray, start_month: date, end_month: date) -> np.ndarray:
+    # cohort_month BETWEEN $start::date AND $end::date, cohort_month being the 1st
+    lo = _month_index(start_month) + (start_month.day > 1)
+    return (months >= lo) & (months <= _month_index(end_month))
+
+
+def _month_dates(months: np.ndarray) -> list[date]:
+    return np.asarray(months, dtype=np.int64).astype("datetime64[M]").astype("datetime64[D]").tolist()
+
+
+def cohort_retention(snap: Snapshot, start_month: date, end_month: date) -> Result:
+    inverse, month, cohort = _cohorts(snap)
+    in_window = _in_months(cohort, start_month, end_month)
+    cohort_months, cohort_sizes = np.unique(cohort[in_window], return_counts=True)
+
+    # distinct (customer, order month) among customers of the selected cohorts
+    keep = in_window[inverse]
+    customer_months = np.unique(inverse[keep] * MONTH_SPAN + month[keep])
+    cust, order_month = np.divmod(customer_months, MONTH_SPAN)
+    cohort_month = cohort[cust]
+    month_n = order_month - cohort_month
+    keep = (month_n >= 0) & (month_n <= 12)
+    cells, active = np.unique(cohort_month[keep] * MONTH_SPAN + month_n[keep], return_counts=True)
+    cell_cohort, cell_n = np.divmod(cells, MONTH_SPAN)
+
+    sizes = cohort_sizes[np.searchsorted(cohort_months, cell_cohort)]
+    rates = _round_ratio(active, sizes, 4)
+    rows = [
+        [d, int(n), int(s), int(a), _dec(r, 4)]
+        for d, n, s, a, r in zip(_month_dates(cell_cohort), cell_n, sizes, active, rates)
+    ]
+    return ["cohort_month", "month_n", "cohort_size", "active_customers", "retention_rate"], rows
+
+
+def ltv_by_cohort(snap: Snapshot, start_month: date, end_month: date) -> Result:
+    orders = snap["orders"]
+    inverse, month, cohort = _cohorts(snap)
+    # _cohorts indexes paid orders; the revenue join keeps those with items
+    paid = orders.isin("status", PAID)
+    _, item_count = snap.order_items_cents
+    has_items = item_count[paid] > 0
+    revenue = _order_revenue(snap)[paid][has_items]
+    cust = inverse[has_items]
+
+    cohort_month = cohort[cust]
+    month_n = month[has_items] - cohort_month
+    keep = _in_months(cohort_month, start_month, end_month) & (month_n >= 0) & (month_n <= 12)
+    cells, cell_inverse = np.unique(cohort_month[keep] * MONTH_SPAN + month_n[keep], return_inverse=True)
+    cell_revenue = _group_sum(cell_inverse, revenue[keep], len(cells))
+    cell_customers = np.bincount(
+        np.unique(cell_inverse * len(cohort) + cust[keep]) // len(cohort), minlength=len(cells)
+    )
+    cell_cohort, cell_n = np.divmod(cells, MONTH_SPAN)
+
+    # cells are sorted by (cohort_month, month_n): running sum and max restart per cohort
+    _, starts, per_cohort = np.unique(cell_cohort, return_index=True, return_counts=True)
+    running = np.cumsum(cell_revenue)
+    cume = running - np.repeat(running[starts] - cell_revenue[starts], per_cohort)
+    customers = np.repeat(np.maximum.reduceat(cell_customers, starts), per_cohort) if len(cells) else cell_customers
+    ltv = _round_ratio(cume, customers, 0)
+
+    rows = [[d, int(n), int(c), _dec(v, 2)] for d, n, c, v in zip(_month_dates(cell_cohort), cell_n, customers, ltv)]
+    return ["cohort_month", "month_n", "cohort_customers", "avg_cumulative_ltv"], rows
+
+
+def conversion_funnel(snap: Snapshot, start_date: date, end_date: date) -> Result:
+    events = snap["web_events"]
+    # web_events is stored in event_ts order: the window is a slice
+    ts = events["event_ts"]
+    lo, hi = np.searchsorted(ts, [_day(start_date) * DAY_US, (_day(end_date) + 1) * DAY_US])
+    sessions = events["session_id"][lo:hi]
+    types = events["event_type"][lo:hi]
+    n_types = len(events.dictionary("event_type"))
+
+    # count(distinct session_id) per event type in one pass over (session, type) flags
+    seen = np.zeros(events.meta["session_id"]["dictionary_size"] * n_types, dtype=bool)
+    seen[sessions.astype(np.int64) * n_types + types] = True
+    per_type = seen.reshape(-1, n_types).sum(axis=0)
+
+    counts = []
+    for _, event_type in FUNNEL_STAGES:
+        code = events.codes("event_type", [event_type])
+        counts.append(int(per_type[code[0]]) if len(code) else 0)
+    total = counts[0]
+    rows = [
+        [stage, n, _dec(_round_ratio(n, total, 4), 4) if total else None]
+        for (stage, _), n in zip(FUNNEL_STAGES, counts)
+    ]
+    return ["stage", "n", "pct_of_sessions"], rows
+
+
+def return_rate_by_category(snap: Snapshot, start_date: date, end_date: date) -> Result:
+    orders, items, refunds = snap["orders"], snap["order_items"], snap["refunds"]
+    categories = snap["products"].dictionary("category")
+    n_cat = len(categories)
+    order_mask = orders.isin("status", PAID) & _window(orders["order_ts"], start_date, end_date)
+
+    pos = snap.item_order_pos
+    item_cat = snap.item_category.astype(np.int64)
+    sold = (pos >= 0) & (item_cat >= 0)
+    sold[sold] = order_mask[pos[sold]]
+    orders_with = np.bincount(np.unique(pos[sold] * n_cat + item_cat[sold]) % n_cat, minlength=n_cat)
+    units = _group_sum(item_cat[sold], items["quantity"][sold], n_cat)
+
+    # every refund row joins every item of its order (amount counted once per item)
+    r_mask = _window(refunds["refund_ts"], start_date, end_date)
+    r_order = refunds["order_id"][r_mask]
+    r_amount = refunds["amount"][r_mask]
+    order_ids, starts, counts = snap.items_by_order
+    at = positions(order_ids, r_order)
+    # index -1 (no items) lands on the appended zero count
+    n_items = np.append(counts, 0)[at]
+    refund_row = np.repeat(np.arange(len(r_order)), n_items)
+    first_item = np.repeat(np.append(starts, 0)[at], n_items)
+    item_row = first_item + np.arange(len(refund_row)) - np.repeat(np.cumsum(n_items) - n_items, n_items)
+    joined_cat = item_cat[item_row]
+    valid = joined_cat >= 0
+    refund_keys = np.unique(r_order[refund_row[valid]] * n_cat + joined_cat[valid])
+    refunded_orders = np.bincount(refund_keys % n_cat, minlength=n_cat)
+    refund_amount = _group_sum(joined_cat[valid], r_amount[refund_row[valid]], n_cat)
+
+    present = np.flatnonzero(orders_with > 0)
+    rates = _round_ratio(refunded_orders[present], orders_with[present], 4)
+    rows = [
+        [
+            categories[c],
+            int(orders_with[c]),
+            int(units[c]),
+            int(refunded_orders[c]),
+            _dec(refund_amount[c], 2),
+            _dec(rate, 4),
+        ]
+        for c, rate in zip(present, rates)
+    ]
+    # ORDER BY refund_order_rate DESC, units_sold DESC (category breaks remaining ties)
+    rows.sort(key=lambda r: (-r[5], -r[2], r[0]))
+    columns = ["category", "orders_with_category", "units_sold", "refunded_orders", "refund_amount", "refund_order_rate"]
+    return columns, rows
+
+
+def _percentile_cont(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, p: float) -> np.ndarray:
+    # values sorted within each group; Postgres: lo + (hi - lo) * (pos - floor(pos))
+    pos = p * (counts - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, counts - 1)
+    a = values[starts + lo]
+    b = values[starts + hi]
+    return a + (b - a) * (pos - lo)
+
+
+def shipping_sla(snap: Snapshot, start_date: date, end_date: date) -> Result:
+    ships = snap["shipments"]
+    carriers = ships.dictionary("carrier")
+    levels = ships.dictionary("service_level")
+    shipped, delivered = ships["shipped_ts"], ships["delivered_ts"]
+    mask = (
+        _window(shipped, start_date, end_date)
+        & ships.isin("status", ("delivered", "returned"))
+        & (shipped != NULL_TS)
+        & (delivered != NULL_TS)
+        # groups without an SLA target drop out of the breaches join
+        & ships.isin("service_level", list(SLA_DAYS))
+    )
+    transit_us = (delivered - shipped)[mask]
+    group = ships["carrier"][mask].astype(np.int64) * len(levels) + ships["service_level"][mask]
+
+    order = np.lexsort((transit_us, group))
+    transit_us, group = transit_us[order], group[order]
+    groups, starts, counts = np.unique(group, return_index=True, return_counts=True)
+    days = transit_us / DAY_US
+    p50 = _percentile_cont(days, starts, counts, 0.5)
+    p90 = _percentile_cont(days, starts, counts, 0.9)
+    sums = np.add.reduceat(transit_us, starts) if len(starts) else np.array([], dtype=np.int64)
+    sla_us = np.array([SLA_DAYS[levels[g % len(levels)]] * DAY_US for g in groups.tolist()], dtype=np.int64)
+    breaches = np.add.reduceat((transit_us > np.repeat(sla_us, counts)).astype(np.int64), starts) if len(starts) else []
+    rates = _round_ratio(breaches, counts, 4)
+
+    rows = []
+    for i, g in enumerate(groups.tolist()):
+        n = int(counts[i])
+        # avg(transit_days) in hundredths of a day, exactly (Python ints: no overflow)
+        avg = (2 * int(sums[i]) * 100 + n * DAY_US) // (2 * n * DAY_US)
+        rows.append(
+            [
+                carriers[g // len(levels)],
+                levels[g % len(levels)],
+                n,
+                _float_dec(float(p50[i]), 2),
+                _float_dec(float(p90[i]), 2),
+                _dec(avg, 2),
+                int(breaches[i]),
+                _dec(rates[i], 4),
+            ]
+        )
+    # ORDER BY sla_breach_rate DESC, shipments DESC (carrier/service break remaining ties)
+    rows.sort(key=lambda r: (-r[7], -r[2], r[0], r[1]))
+    columns = [
+        "carrier",
+        "service_level",
+        "shipments",
+        "p50_transit_days",
+        "p90_transit_days",
+        "avg_transit_days",
+        "sla_breaches",
+        "sla_breach_rate",
+    ]
+    return columns, rows
+
+
+IMPLEMENTATIONS: dict[str, Callable[..., Result]] = {
+    "cohort_retention": cohort_retention,
+    "ltv_by_cohort": ltv_by_cohort,
+    "aov_trend": aov_trend,
+    "conversion_funnel": conversion_funnel,
+    "anomaly_daily_revenue": anomaly_daily_revenue,
+    "return_rate_by_category": return_rate_by_category,
+    "shipping_sla": shipping_sla,
+}
+
+
+def run_vectorized(snap: Snapshot, query_id: str, values: list[Any]) -> Result:
+    """Columns and rows of a curated query over `snap`; `values` come from bind_params."""
+    impl = IMPLEMENTATIONS.get(query_id)
+    if impl is None:
+        raise KeyError(f"No snapshot implementation for query_id: {query_id}")
+    columns, rows = impl(snap, *values)
+    # like the SQL runner, which takes column names from the first record
+    return (columns if rows else []), rows
+
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from typing import Any
+
+from app.core.config import settings
+from app.db.admission import GATES, Overloaded
+from app.db.pool import COST_CLASSES
+from app.queries.cache import result_cache
+from app.queries.registry import QUERIES
+from app.queries.runner import bind_params, execute_curated_query, execute_shared_queries
+from app.queries.shared import shared_groups
+
+log = logging.getLogger(__name__)
+
+# The dashboard's default windows (setDefaults in frontend/public/app.js): the last 90 days,
+# and the first of the month five months back through the first of this month.
+DEFAULT_DAYS = 90
+DEFAULT_MONTHS = 5
+
+# (query_id, days or None, months or None); None = the default window
+WarmPair = tuple[str, int | None, int | None]
+
+
+def _month_back(d: date, months: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 - months, 12)
+    return date(y, m + 1, 1)
+
+
+def parse_windows(spec: str) -> list[WarmPair]:
+    """'cohort_retention:12m,aov_trend:30d' -> [(query_id, days, months), ...]."""
+    pairs = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        query_id, _, window = item.partition(":")
+        if query_id not in QUERIES:
+            raise ValueError(f"CACHE_WARM_WINDOWS: unknown query_id {query_id!r}")
+        if len(window) < 2 or window[-1] not in "dm" or not window[:-1].isdigit():
+            raise ValueError(f"CACHE_WARM_WINDOWS: window for {query_id} must look like 30d or 12m, got {window!r}")
+        n = int(window[:-1])
+        pairs.append((query_id, n, None) if window[-1] == "d" else (query_id, None, n))
+    return pairs
+
+
+def warm_params(query_id: str, days: int | None, months: int | None, today: date) -> dict[str, str]:
+    first = today.replace(day=1)
+    window = {
+        "start_date": today - timedelta(days=days or DEFAULT_DAYS),
+        "end_date": today,
+        "start_month": _month_back(first, months or DEFAULT_MONTHS),
+        "end_month": first,
+    }
+    return {p: window[p].isoformat() for p in QUERIES[query_id].params}
+
+
+class CacheWarmer:
+    """Keeps the result cache holding the dashboard's common windows.
+
+    Runs at startup, every `interval_s`, and whenever the data version moves. Warming uses
+    the normal admission path (so it shares in-flight user queries), at most
+    `max_share` of each cost class's pool at a time, and skips a class while users are
+    queued for it; only the skipped pairs are retried on the next check. A class whose share rounds
+    down to no connection is warmed one query at a time, and only while it is idle.
+    """
+
+    def __init__(self, pairs: list[WarmPair], interval_s: float, max_share: float) -> None:
+        self.pairs = pairs
+        self.interval_s = interval_s
+        self.limits = {name: int(c.pool_size * max_share) for name, c in COST_CLASSES.items()}
+        self.idle_only = {name for name, n in self.limits.items() if n == 0}
+        self.slots = {name: asyncio.Semaphore(max(1, n)) for name, n in self.limits.items()}
+        self.runs = 0
+        self.warmed = 0
+        self.deferred = 0
+        self.failed = 0
+        self.last_run_at: float | None = None
+        self.last_run_s: float | None = None
+        self.last_reason: str | None = None
+
+    async def _warm_one(self, query_ids: list[str], params: dict[str, str]) -> list[str]:
+        # one query, or a shared_groups group (one connection, its base read once)
+        cost_class = QUERIES[query_ids[0]].cost_class
+        async with self.slots[cost_class]:
+            gate = GATES[cost_class]
+            if gate.waiting or (cost_class in self.idle_only and gate.running):
+                return ["deferred"] * len(query_ids)
+            try:
+                # recompute even if cached, so entries don't expire between runs
+                if len(query_ids) > 1:
+                    await execute_shared_queries(query_ids, params, refresh=True)
+                else:
+                    await execute_curated_query(query_ids[0], params, refresh=True)
+            except Overloaded:
+                return ["deferred"] * len(query_ids)
+            except Exception:
+                log.exception("cache warm of %s %s failed", query_ids, params)
+                return ["failed"] * len(query_ids)
+        return ["warmed"] * len(query_ids)
+
+    async def warm(self, reason: str, pairs: list[WarmPair] | None = None) -> tuple[dict[str, int], list[WarmPair]]:
+        """Warm `pairs` (default: all); returns the outcome counts and the pairs deferred."""
+        pairs = self.pairs if pairs is None else pairs
+        today = date.today()
+        t0 = time.monotonic()
+        items = [(qid, warm_params(qid, days, months, today)) for qid, days, months in pairs]
+        groups = shared_groups([(qid, bind_params(qid, params)) for qid, params in items])
+        grouped = {i for g in groups for i in g}
+        # item indexes per job: a group, or one query on its own
+        jobs = groups + [[i] for i in range(len(items)) if i not in grouped]
+        results = await asyncio.gather(*(self._warm_one([items[i][0] for i in job], items[job[0]][1]) for job in jobs))
+        outcomes = {i: o for job, result in zip(jobs, results) for i, o in zip(job, result)}
+        counts = {k: list(outcomes.values()).count(k) for k in ("warmed", "deferred", "failed")}
+        self.runs += 1
+        self.warmed += counts["warmed"]
+        self.deferred += counts["deferred"]
+        self.failed += counts["failed"]
+        self.last_run_at = time.time()
+        self.last_run_s = time.monotonic() - t0
+        self.last_reason = reason
+        return counts, [pairs[i] for i, o in sorted(outcomes.items()) if o == "deferred"]
+
+    async def loop(self, check_s: float) -> None:
+        warmed_version: str | None = None
+        warmed_at = 0.0
+        # pairs deferred since the last full run, retried on their own at each check
+        pending: list[WarmPair] = []
+        while True:
+            try:
+                version = await result_cache.data_version()
+                todo = None
+                if warmed_version is None:
+                    reason = "startup"
+                elif version != warmed_version:
+                    reason = "data change"
+                elif time.monotonic() - warmed_at >= self.interval_s:
+                    reason = "schedule"
+                elif pending:
+                    reason, todo = "retry", pending
+                else:
+                    reason = None
+                if reason is not None:
+                    counts, pending = await self.warm(reason, todo)
+                    log.info("cache warmed (%s): %s in %.1fs", reason, counts, self.last_run_s)
+                    if todo is None:
+                        warmed_version, warmed_at = version, time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("cache warm failed")
+            await asyncio.sleep(check_s)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pairs": len(self.pairs),
+            "interval_s": self.interval_s,
+            "max_concurrency": self.limits,
+            "idle_only": sorted(self.idle_only),
+            "runs": self.runs,
+            "warmed": self.warmed,
+            "deferred": self.deferred,
+            "failed": self.failed,
+            "last_run_at": self.last_run_at,
+            "last_run_s": round(self.last_run_s, 3) if self.last_run_s is not None else None,
+            "last_reason": self.last_reason,
+        }
+
+
+cache_warmer = CacheWarmer(
+    pairs=[(qid, None, None) for qid in QUERIES] + parse_windows(settings.cache_warm_windows),
+    interval_s=settings.cache_warm_interval_s,
+    max_share=settings.cache_warm_max_share,
+)
@@ -1,6 +1,9 @@
 const $ = (id) => document.getElementById(id);
 
 let chart;
+let lastResult;
+// the query request in flight; a new runQuery aborts it, which cancels it on the server
+let pending;
 
 function isoDate(d){
   const pad = (n)=> String(n).padStart(2,'0');
@@ -54,7 +57,7 @@ function renderCards(queries){
   }
 }
 
-function tableFrom(cols, rows){
+function tableFrom(cols, data, rowCount){
   const t = $("resultTable");
   t.innerHTML = '';
   if(cols.length === 0){
@@ -69,9 +72,10 @@ function tableFrom(cols, rows){
   thead.appendChild(trh);
   t.appendChild(thead);
   const tb = document.createElement('tbody');
-  for(const r of rows.slice(0, 400)){
+  for(let i = 0; i < Math.min(rowCount, 400); i++){
     const tr = document.createElement('tr');
-    for(const v of r){
+    for(const col of data){
+      const v = col[i];
       const td = document.createElement('td');
       td.textContent = (v === null || v === undefined) ? '' : String(v);
       tr.appendChild(td);
@@ -88,17 +92,20 @@ function destroyChart(){
 function plotIfPossible(result){
   destroyChart();
   const canvas = $("chart");
-  const {columns, rows, query_id} = result;
-  if(rows.length === 0) return;
+  const {columns, data, row_count, query_id} = result;
+  if(row_count === 0) return;
 
   // Lightweight heuristics: plot first column as x, second as y when numeric-ish.
   const xIdx = 0;
   const yIdx = Math.min(2, columns.length-1);
   if(yIdx <= 0) return;
 
-  const pts = rows
-    .map(r => ({x: r[xIdx], y: Number(r[yIdx])}))
-    .filter(p => Number.isFinite(p.y));
+  const xs = data[xIdx], ys = data[yIdx];
+  const pts = [];
+  for(let i = 0; i < row_count; i++){
+    const y = ys[i] === null ? NaN : Number(ys[i]);
+    if(Number.isFinite(y)) pts.push({x: xs[i], y});
+  }
   if(pts.length < 3) return;
 
   chart = new Chart(canvas, {
@@ -144,16 +151,41 @@ async function runQuery(q){
   $("resultTitle").textContent = q.title;
   $("resultMeta").textContent = 'Running…';
 
+  if(pending) pending.abort();
+  const request = pending = new AbortController();
   const url = `/api/query/${q.id}?${params.toString()}`;
-  const r = await fetch(url);
-  const j = await r.json();
+  let j;
+  try {
+    // column-major binary when the API offers it (see columnar.js), JSON otherwise
+    const r = await fetch(url, {headers: {Accept: `${COLUMNAR_TYPE}, application/json;q=0.9`}, signal: request.signal});
+    if((r.headers.get('content-type') || '').startsWith(COLUMNAR_TYPE)){
+      j = decodeColumnar(await r.arrayBuffer());
+    } else {
+      j = await r.json();
+      if(j.rows) j.data = j.columns.map((_, c) => j.rows.map(row => row[c]));
+    }
+  } catch(e) {
+    if(e.name === 'AbortError') return;  // superseded by a newer runQuery
+    throw e;
+  }
+  if(pending === request) pending = undefined;
+  lastResult = j;
 
   $("resultMeta").textContent = `${j.row_count} rows · ${Object.entries(j.params).map(([k,v])=>`${k}=${v}`).join(' · ')}`;
-  $("rawJson").textContent = JSON.stringify(j, null, 2);
-  tableFrom(j.columns, j.rows);
+  $("rawJson").textContent = '';
+  if($("rawJson").parentElement.open) showRawJson();
+  tableFrom(j.columns, j.data || [], j.row_count || 0);
   plotIfPossible(j);
 }
 
+// The raw view is JSON-shaped (rows) and only built when it is opened.
+function showRawJson(){
+  if(!lastResult || $("rawJson").textContent) return;
+  const {data, ...rest} = lastResult;
+  const raw = data && !rest.rows ? {...rest, rows: columnarRows(lastResult)} : rest;
+  $("rawJson").textContent = JSON.stringify(raw, null, 2);
+}
+
 async function refresh(){
   const r = await fetch('/api/queries');
   const j = await r.json();
@@ -161,6 +193,7 @@ async function refresh(){
 }
 
 $("refresh").onclick = refresh;
+$("rawJson").parentElement.addEventListener('toggle', e => { if(e.target.open) showRawJson(); });
 
 setDefaults();
 apiHealth();
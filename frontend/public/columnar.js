@@ -0,0 +1,68 @@
+// Decoder for the column-major binary result format (application/vnd.warehouse.columnar,
+// layout documented in app/queries/columnar.py). Returns the result's JSON fields plus
+// `data`: one array per column. Numeric columns without NULLs stay typed-array views over
+// the response buffer (no copy); dates come back as 'YYYY-MM-DD' strings and NULLs as null,
+// the same values JSON.parse gives for the JSON format.
+const COLUMNAR_TYPE = 'application/vnd.warehouse.columnar';
+
+const COLUMNAR_ARRAYS = {i32: Int32Array, f64: Float64Array};
+const COLUMNAR_CODES = {1: Uint8Array, 2: Uint16Array, 4: Uint32Array};
+const DAY_MS = 86400000;
+
+function decodeColumnar(buf){
+  const bytes = new Uint8Array(buf);
+  if(String.fromCharCode(...bytes.subarray(0, 4)) !== 'WHC1') throw new Error('not a columnar result');
+  const headLen = new DataView(buf).getUint32(4, true);
+  const result = JSON.parse(new TextDecoder().decode(bytes.subarray(8, 8 + headLen)));
+  const base = 8 + headLen;
+  const n = result.row_count;
+
+  result.data = result.layout.map(col => {
+    const at = base + col.offset;
+    let values;
+    if(col.type === 'json'){
+      return JSON.parse(new TextDecoder().decode(bytes.subarray(at, at + col.length)));
+    } else if(col.type === 'dict'){
+      const codes = new COLUMNAR_CODES[col.width](buf, at, n), dict = col.dictionary;
+      values = new Array(n);
+      for(let i = 0; i < n; i++) values[i] = dict[codes[i]];
+    } else if(col.type === 'date'){
+      // many rows share a day (cohort months, weeks): format each distinct day once
+      const days = new Int32Array(buf, at, n), seen = new Map();
+      values = new Array(n);
+      for(let i = 0; i < n; i++){
+        let s = seen.get(days[i]);
+        if(s === undefined){ s = new Date(days[i] * DAY_MS).toISOString().slice(0, 10); seen.set(days[i], s); }
+        values[i] = s;
+      }
+    } else if(col.type === 'dec'){
+      // n / 10**scale: correctly rounded, so the same double JSON.parse gives for the decimal
+      const scaled = new Int32Array(buf, at, n), div = 10 ** col.scale;
+      values = new Float64Array(n);
+      for(let i = 0; i < n; i++) values[i] = scaled[i] / div;
+    } else if(col.type === 'bool'){
+      values = Array.from(new Uint8Array(buf, at, n), b => b === 1);
+    } else {
+      values = new COLUMNAR_ARRAYS[col.type](buf, at, n);
+    }
+    if(col.nulls === undefined) return values;
+    const bits = bytes.subarray(base + col.nulls);
+    const out = new Array(n);
+    for(let i = 0; i < n; i++){
+      out[i] = (bits[i >> 3] & (1 << (i & 7))) ? null : values[i];
+    }
+    return out;
+  });
+  delete result.layout;
+  return result;
+}
+
+// Row-major rows (the JSON format's `rows`) from decoded columns, e.g. for display.
+function columnarRows(result, limit = result.row_count){
+  const n = Math.min(limit, result.row_count);
+  const rows = new Array(n);
+  for(let i = 0; i < n; i++) rows[i] = result.data.map(col => col[i]);
+  return rows;
+}
+
+if(typeof module === 'object') module.exports = {COLUMNAR_TYPE, decodeColumnar, columnarRows};
@@ -1,22 +1,13 @@
 -- Params:
 --   $1 start_date (YYYY-MM-DD)
 --   $2 end_date   (YYYY-MM-DD)
+-- Reads the daily revenue rollup (sql/schema/002_rollups.sql).
+-- Raw-table equivalent: sql/reference/anomaly_daily_revenue.sql
 
-WITH order_revenue AS (
-  SELECT o.order_id,
-         date_trunc('day', o.order_ts)::date AS day,
-         (sum(oi.quantity*oi.unit_price - oi.discount) + o.shipping_cost)::numeric(12,2) AS revenue
-  FROM orders o
-  JOIN order_items oi ON oi.order_id=o.order_id
-  WHERE o.status IN ('paid','shipped','delivered','refunded')
-    AND o.order_ts >= $1::date
-    AND o.order_ts < ($2::date + interval '1 day')
-  GROUP BY 1,2, o.shipping_cost
-),
-daily AS (
-  SELECT day, sum(revenue)::numeric(12,2) AS revenue
-  FROM order_revenue
-  GROUP BY 1
+WITH daily AS (
+  SELECT day, revenue::numeric(12,2) AS revenue
+  FROM rollup_revenue_daily
+  WHERE day BETWEEN $1::date AND $2::date
 ),
 stats AS (
   SELECT day,
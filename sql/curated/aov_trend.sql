@@ -1,23 +1,15 @@
 -- Params:
 --   $1 start_date (YYYY-MM-DD)
 --   $2 end_date   (YYYY-MM-DD)
+-- Reads the daily revenue rollup (sql/schema/002_rollups.sql).
+-- Raw-table equivalent: sql/reference/aov_trend.sql
 
-WITH order_revenue AS (
-  SELECT o.order_id,
-         date_trunc('week', o.order_ts)::date AS week,
-         (sum(oi.quantity*oi.unit_price - oi.discount) + o.shipping_cost)::numeric(12,2) AS revenue
-  FROM orders o
-  JOIN order_items oi ON oi.order_id = o.order_id
-  WHERE o.status IN ('paid','shipped','delivered','refunded')
-    AND o.order_ts >= $1::date
-    AND o.order_ts < ($2::date + interval '1 day')
-  GROUP BY 1,2, o.shipping_cost
-),
-weekly AS (
-  SELECT week,
-         count(*) AS orders,
-         round(avg(revenue), 2) AS aov
-  FROM order_revenue
+WITH weekly AS (
+  SELECT date_trunc('week', day)::date AS week,
+         sum(orders)::bigint AS orders,
+         round(sum(revenue) / sum(orders), 2) AS aov
+  FROM rollup_revenue_daily
+  WHERE day BETWEEN $1::date AND $2::date
   GROUP BY 1
 )
 SELECT week,
@@ -1,43 +1,18 @@
 -- Params:
 --   $1 start_month (YYYY-MM-01)
 --   $2 end_month   (YYYY-MM-01)
+-- Cohorts and per-month revenue come from the cohort rollups (sql/schema/004_cohort_rollups.sql).
+-- Raw-table equivalent: sql/reference/ltv_by_cohort.sql
 
-WITH first_order AS (
-  SELECT customer_id,
-         date_trunc('month', min(order_ts))::date AS cohort_month
-  FROM orders
-  WHERE status IN ('paid','shipped','delivered','refunded')
-  GROUP BY 1
-),
-order_revenue AS (
-  SELECT o.order_id,
-         o.customer_id,
-         date_trunc('month', o.order_ts)::date AS order_month,
-         (sum(oi.quantity*oi.unit_price - oi.discount) + o.shipping_cost)::numeric(12,2) AS revenue
-  FROM orders o
-  JOIN order_items oi ON oi.order_id = o.order_id
-  WHERE o.status IN ('paid','shipped','delivered','refunded')
-  GROUP BY 1,2,3, o.shipping_cost
-),
-cohort_orders AS (
-  SELECT f.cohort_month,
-         r.customer_id,
-         r.order_month,
-         (extract(year from age(r.order_month, f.cohort_month)) * 12
-          + extract(month from age(r.order_month, f.cohort_month)))::int AS month_n,
-         r.revenue
-  FROM first_order f
-  JOIN order_revenue r ON r.customer_id = f.customer_id
-  WHERE f.cohort_month BETWEEN $1::date AND $2::date
-    AND r.order_month >= f.cohort_month
-),
-cohort_monthly AS (
+WITH cohort_monthly AS (
+  -- cells with at least one item-bearing order, as in the per-order revenue join
   SELECT cohort_month, month_n,
-         sum(revenue) AS cohort_revenue,
-         count(distinct customer_id) AS customers
-  FROM cohort_orders
-  WHERE month_n BETWEEN 0 AND 12
-  GROUP BY 1,2
+         revenue AS cohort_revenue,
+         revenue_customers AS customers
+  FROM rollup_cohort_activity
+  WHERE cohort_month BETWEEN $1::date AND $2::date
+    AND month_n BETWEEN 0 AND 12
+    AND revenue_customers > 0
 ),
 cohort_cume AS (
   SELECT cohort_month, month_n,
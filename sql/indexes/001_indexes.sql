@@ -0,0 +1,12 @@
+-- Secondary indexes for the warehouse tables.
+-- Applied after the bulk load (scripts/init_db.py) so COPY doesn't maintain them row by row.
+
+CREATE INDEX idx_orders_customer_ts ON orders(customer_id, order_ts);
+CREATE INDEX idx_orders_ts ON orders(order_ts);
+CREATE INDEX idx_order_items_order ON order_items(order_id);
+CREATE INDEX idx_order_items_product ON order_items(product_id);
+CREATE INDEX idx_payments_paid_ts ON payments(paid_ts);
+CREATE INDEX idx_refunds_ts ON refunds(refund_ts);
+CREATE INDEX idx_shipments_shipped_ts ON shipments(shipped_ts);
+CREATE INDEX idx_web_events_ts ON web_events(event_ts);
+CREATE INDEX idx_web_events_type_ts ON web_events(event_type, event_ts);
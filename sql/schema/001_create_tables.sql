@@ -1,5 +1,6 @@
 -- E-Commerce Ops Warehouse (Postgres)
 -- Drop/recreate for demo purposes
+-- Secondary indexes live in sql/indexes/ and are created after the data load
 
 CREATE EXTENSION IF NOT EXISTS pgcrypto;
 
@@ -31,61 +32,62 @@ CREATE TABLE products (
   active       BOOLEAN NOT NULL DEFAULT TRUE
 );
 
+-- orders and web_events are range-partitioned by month (partitions: 003_partitions.sql).
+-- A partitioned table's unique keys must include the partition key, so their primary keys
+-- carry the timestamp and child tables can't hold foreign keys to orders(order_id). A
+-- composite (order_id, order_ts) key wouldn't do either: detaching a month (retention) fails
+-- while any row references it. order_id stays unique because only seed_data (then setval)
+-- and ingest (nextval) assign ids, and orders_delete_children below stands in for ON DELETE
+-- CASCADE.
 CREATE TABLE orders (
-  order_id     BIGSERIAL PRIMARY KEY,
+  order_id     BIGSERIAL,
   customer_id  BIGINT NOT NULL REFERENCES customers(customer_id),
   order_ts     TIMESTAMPTZ NOT NULL,
   status       TEXT NOT NULL CHECK (status IN ('placed','paid','shipped','delivered','cancelled','refunded')),
   channel      TEXT NOT NULL CHECK (channel IN ('web','mobile','marketplace')),
   currency     TEXT NOT NULL DEFAULT 'USD',
-  shipping_cost NUMERIC(12,2) NOT NULL DEFAULT 0
-);
-CREATE INDEX idx_orders_customer_ts ON orders(customer_id, order_ts);
-CREATE INDEX idx_orders_ts ON orders(order_ts);
+  shipping_cost NUMERIC(12,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (order_id, order_ts)
+) PARTITION BY RANGE (order_ts);
 
 CREATE TABLE order_items (
   order_item_id BIGSERIAL PRIMARY KEY,
-  order_id      BIGINT NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
+  order_id      BIGINT NOT NULL,
   product_id    BIGINT NOT NULL REFERENCES products(product_id),
   quantity      INT NOT NULL CHECK (quantity > 0),
   unit_price    NUMERIC(12,2) NOT NULL,
   discount      NUMERIC(12,2) NOT NULL DEFAULT 0
 );
-CREATE INDEX idx_order_items_order ON order_items(order_id);
-CREATE INDEX idx_order_items_product ON order_items(product_id);
 
 CREATE TABLE payments (
   payment_id   BIGSERIAL PRIMARY KEY,
-  order_id     BIGINT NOT NULL UNIQUE REFERENCES orders(order_id) ON DELETE CASCADE,
+  order_id     BIGINT NOT NULL UNIQUE,
   paid_ts      TIMESTAMPTZ NOT NULL,
   method       TEXT NOT NULL CHECK (method IN ('card','paypal','apple_pay','klarna')),
   amount       NUMERIC(12,2) NOT NULL,
   status       TEXT NOT NULL CHECK (status IN ('paid','failed','refunded','partial_refund'))
 );
-CREATE INDEX idx_payments_paid_ts ON payments(paid_ts);
 
 CREATE TABLE refunds (
   refund_id    BIGSERIAL PRIMARY KEY,
-  order_id     BIGINT NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
+  order_id     BIGINT NOT NULL,
   refund_ts    TIMESTAMPTZ NOT NULL,
   amount       NUMERIC(12,2) NOT NULL,
   reason       TEXT NOT NULL CHECK (reason IN ('damaged','late_delivery','wrong_item','changed_mind','other'))
 );
-CREATE INDEX idx_refunds_ts ON refunds(refund_ts);
 
 CREATE TABLE shipments (
   shipment_id   BIGSERIAL PRIMARY KEY,
-  order_id      BIGINT NOT NULL UNIQUE REFERENCES orders(order_id) ON DELETE CASCADE,
+  order_id      BIGINT NOT NULL UNIQUE,
   carrier       TEXT NOT NULL,
   service_level TEXT NOT NULL CHECK (service_level IN ('standard','expedited','overnight')),
   shipped_ts    TIMESTAMPTZ,
   delivered_ts  TIMESTAMPTZ,
   status        TEXT NOT NULL CHECK (status IN ('pending','shipped','delivered','lost','returned'))
 );
-CREATE INDEX idx_shipments_shipped_ts ON shipments(shipped_ts);
 
 CREATE TABLE web_events (
-  event_id     BIGSERIAL PRIMARY KEY,
+  event_id     BIGSERIAL,
   event_ts     TIMESTAMPTZ NOT NULL,
   session_id   UUID NOT NULL,
   customer_id  BIGINT REFERENCES customers(customer_id),
@@ -93,7 +95,22 @@ CREATE TABLE web_events (
   product_id   BIGINT REFERENCES products(product_id),
   channel      TEXT NOT NULL CHECK (channel IN ('web','mobile')),
   utm_source   TEXT,
-  utm_campaign TEXT
-);
-CREATE INDEX idx_web_events_ts ON web_events(event_ts);
-CREATE INDEX idx_web_events_type_ts ON web_events(event_type, event_ts);
+  utm_campaign TEXT,
+  PRIMARY KEY (event_id, event_ts)
+) PARTITION BY RANGE (event_ts);
+
+-- ON DELETE CASCADE from orders to its child tables
+CREATE OR REPLACE FUNCTION delete_order_children() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM order_items WHERE order_id IN (SELECT order_id FROM old_rows);
+  DELETE FROM payments WHERE order_id IN (SELECT order_id FROM old_rows);
+  DELETE FROM refunds WHERE order_id IN (SELECT order_id FROM old_rows);
+  DELETE FROM shipments WHERE order_id IN (SELECT order_id FROM old_rows);
+  RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER orders_delete_children AFTER DELETE ON orders
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION delete_order_children();
@@ -0,0 +1,186 @@
+-- Revenue rollups (Postgres)
+-- Back aov_trend and anomaly_daily_revenue so they don't rebuild the
+-- per-order revenue CTE (orders JOIN order_items GROUP BY order) on every request.
+--
+-- Maintenance is incremental: statement triggers on orders/order_items append the touched
+-- order ids to order_changes, and refresh_revenue_rollups() recomputes only those orders
+-- (and the days they were/are on) past the rollup's high-water mark in rollup_state.
+--
+-- Day buckets use the session TimeZone of the refresher, same as the curated SQL.
+
+DROP TABLE IF EXISTS rollup_revenue_daily CASCADE;
+DROP TABLE IF EXISTS rollup_order_revenue CASCADE;
+DROP TABLE IF EXISTS rollup_state CASCADE;
+DROP TABLE IF EXISTS order_changes CASCADE;
+
+CREATE TABLE order_changes (
+  change_id   BIGSERIAL PRIMARY KEY,
+  order_id    BIGINT NOT NULL,
+  -- set for changes to orders rows (old and new owner); NULL for order_items changes
+  customer_id BIGINT,
+  changed_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE rollup_state (
+  rollup          TEXT PRIMARY KEY,
+  last_change_id  BIGINT NOT NULL DEFAULT 0,
+  refreshed_at    TIMESTAMPTZ
+);
+INSERT INTO rollup_state(rollup) VALUES ('revenue');
+
+-- One row per order that has items (same inner join as the curated CTE)
+CREATE TABLE rollup_order_revenue (
+  order_id     BIGINT PRIMARY KEY,
+  customer_id  BIGINT NOT NULL,
+  order_ts     TIMESTAMPTZ NOT NULL,
+  day          DATE NOT NULL,
+  status       TEXT NOT NULL,
+  revenue      NUMERIC(12,2) NOT NULL
+);
+CREATE INDEX idx_rollup_order_revenue_day ON rollup_order_revenue(day);
+CREATE INDEX idx_rollup_order_revenue_customer ON rollup_order_revenue(customer_id, order_ts);
+
+-- Revenue-bearing orders only (paid/shipped/delivered/refunded)
+CREATE TABLE rollup_revenue_daily (
+  day      DATE PRIMARY KEY,
+  orders   BIGINT NOT NULL,
+  revenue  NUMERIC(14,2) NOT NULL
+);
+
+-- Week/month views over the daily table (a year is ~365 rows, so these stay cheap).
+-- Date-window queries should read rollup_revenue_daily so partial edge weeks/months are exact.
+CREATE VIEW rollup_revenue_weekly AS
+SELECT date_trunc('week', day)::date AS week,
+       sum(orders)::bigint AS orders,
+       sum(revenue) AS revenue
+FROM rollup_revenue_daily
+GROUP BY 1;
+
+CREATE VIEW rollup_revenue_monthly AS
+SELECT date_trunc('month', day)::date AS month,
+       sum(orders)::bigint AS orders,
+       sum(revenue) AS revenue
+FROM rollup_revenue_daily
+GROUP BY 1;
+
+-- Change capture -------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION log_order_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_TABLE_NAME = 'orders' THEN
+    -- orders rows also record the customer, so cohort rollups can follow deletes and moves
+    IF TG_OP = 'INSERT' THEN
+      INSERT INTO order_changes(order_id, customer_id) SELECT order_id, customer_id FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+      INSERT INTO order_changes(order_id, customer_id) SELECT order_id, customer_id FROM old_rows;
+    ELSE
+      INSERT INTO order_changes(order_id, customer_id)
+      SELECT order_id, customer_id FROM old_rows UNION SELECT order_id, customer_id FROM new_rows;
+    END IF;
+  ELSIF TG_OP = 'INSERT' THEN
+    INSERT INTO order_changes(order_id) SELECT DISTINCT order_id FROM new_rows;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO order_changes(order_id) SELECT DISTINCT order_id FROM old_rows;
+  ELSE
+    INSERT INTO order_changes(order_id)
+    SELECT order_id FROM old_rows UNION SELECT order_id FROM new_rows;
+  END IF;
+  RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER orders_changes_ins AFTER INSERT ON orders
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_order_changes();
+CREATE TRIGGER orders_changes_upd AFTER UPDATE ON orders
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_order_changes();
+CREATE TRIGGER orders_changes_del AFTER DELETE ON orders
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_order_changes();
+
+CREATE TRIGGER order_items_changes_ins AFTER INSERT ON order_items
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_order_changes();
+CREATE TRIGGER order_items_changes_upd AFTER UPDATE ON order_items
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_order_changes();
+CREATE TRIGGER order_items_changes_del AFTER DELETE ON order_items
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_order_changes();
+
+-- Incremental refresh --------------------------------------------------------
+-- Returns the number of orders recomputed (0 when already up to date).
+
+CREATE OR REPLACE FUNCTION refresh_revenue_rollups() RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  from_id  BIGINT;
+  to_id    BIGINT;
+  changed  BIGINT[];
+  touched  DATE[];
+BEGIN
+  -- EXCLUSIVE waits for in-flight writers (their triggers hold ROW EXCLUSIVE), so no change id
+  -- at or below the new high-water mark can commit after we read it.
+  LOCK TABLE order_changes IN EXCLUSIVE MODE;
+
+  SELECT last_change_id INTO from_id FROM rollup_state WHERE rollup = 'revenue' FOR UPDATE;
+  SELECT coalesce(max(change_id), from_id) INTO to_id FROM order_changes;
+  IF to_id = from_id THEN
+    RETURN 0;
+  END IF;
+
+  SELECT array_agg(DISTINCT order_id) INTO changed
+  FROM order_changes
+  WHERE change_id > from_id AND change_id <= to_id;
+
+  -- days the changed orders used to be on ...
+  SELECT array_agg(DISTINCT r.day) INTO touched
+  FROM rollup_order_revenue r
+  JOIN unnest(changed) AS c(order_id) USING (order_id);
+
+  DELETE FROM rollup_order_revenue r
+  USING unnest(changed) AS c(order_id)
+  WHERE r.order_id = c.order_id;
+
+  INSERT INTO rollup_order_revenue(order_id, customer_id, order_ts, day, status, revenue)
+  SELECT o.order_id,
+         o.customer_id,
+         o.order_ts,
+         date_trunc('day', o.order_ts)::date,
+         o.status,
+         (sum(oi.quantity*oi.unit_price - oi.discount) + o.shipping_cost)::numeric(12,2)
+  FROM orders o
+  JOIN unnest(changed) AS c(order_id) ON c.order_id = o.order_id
+  JOIN order_items oi ON oi.order_id = o.order_id
+  GROUP BY o.order_id, o.customer_id, o.order_ts, o.status, o.shipping_cost;
+
+  -- ... and the days they are on now
+  SELECT array_agg(DISTINCT d) INTO touched
+  FROM (
+    SELECT unnest(coalesce(touched, '{}'::date[])) AS d
+    UNION
+    SELECT r.day FROM rollup_order_revenue r JOIN unnest(changed) AS c(order_id) USING (order_id)
+  ) t;
+
+  DELETE FROM rollup_revenue_daily WHERE day = ANY(touched);
+
+  INSERT INTO rollup_revenue_daily(day, orders, revenue)
+  SELECT day, count(*), sum(revenue)
+  FROM rollup_order_revenue
+  WHERE day = ANY(touched)
+    AND status IN ('paid','shipped','delivered','refunded')
+  GROUP BY day;
+
+  UPDATE rollup_state
+  SET last_change_id = to_id, refreshed_at = now()
+  WHERE rollup = 'revenue';
+
+  -- drop log entries every order_changes rollup has consumed
+  DELETE FROM order_changes
+  WHERE change_id <= (SELECT min(last_change_id) FROM rollup_state WHERE rollup IN ('revenue', 'cohort'));
+
+  RETURN coalesce(array_length(changed, 1), 0);
+END
+$$;
@@ -0,0 +1,52 @@
+-- Monthly range partitions for orders (order_ts) and web_events (event_ts)
+-- Partitions are named <parent>_pYYYY_MM and cover calendar months in UTC.
+--
+-- seed_data creates the months its data spans; the app creates upcoming months and, if
+-- PARTITION_RETAIN_MONTHS is set, detaches old ones (app/db/partitions.py). There is no
+-- default partition: rows outside every partition fail loudly instead of piling up in one
+-- unpruneable table (and DETACH ... CONCURRENTLY needs there to be none).
+
+CREATE OR REPLACE FUNCTION create_month_partitions(parent TEXT, from_month DATE, to_month DATE)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  m        DATE := date_trunc('month', from_month)::date;
+  part     TEXT;
+  existing REGCLASS;
+  created  INTEGER := 0;
+BEGIN
+  WHILE m <= to_month LOOP
+    part := format('%s_p%s', parent, to_char(m, 'YYYY_MM'));
+    existing := to_regclass(part);
+    IF existing IS NULL THEN
+      EXECUTE format(
+        'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        part, parent,
+        m::timestamp AT TIME ZONE 'UTC',
+        (m + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+      );
+      created := created + 1;
+    ELSIF NOT EXISTS (
+      SELECT 1 FROM pg_inherits WHERE inhrelid = existing AND inhparent = parent::regclass
+    ) THEN
+      -- e.g. a detached (archived) partition: don't silently leave the month uncovered
+      RAISE EXCEPTION '% exists but is not a partition of %', part, parent;
+    END IF;
+    m := (m + interval '1 month')::date;
+  END LOOP;
+  RETURN created;
+END
+$$;
+
+-- Attached monthly partitions of a parent, oldest first
+CREATE OR REPLACE FUNCTION month_partitions(parent TEXT)
+RETURNS TABLE (partition_name TEXT, month DATE)
+LANGUAGE sql STABLE AS $$
+  SELECT c.relname::text,
+         to_date(right(c.relname, 7), 'YYYY_MM')
+  FROM pg_inherits i
+  JOIN pg_class c ON c.oid = i.inhrelid
+  WHERE i.inhparent = parent::regclass
+    AND c.relname ~ '_p[0-9]{4}_[0-9]{2}$'
+  ORDER BY 2
+$$;
@@ -0,0 +1,204 @@
+-- Customer cohort rollups (Postgres)
+-- Back cohort_retention and ltv_by_cohort so they don't rebuild first_order (min(order_ts)
+-- over every customer's orders) on every request, and only read the requested cohorts.
+--
+--   rollup_customer_month   per customer and month: revenue-status orders, how many of those
+--                           have items, and their revenue (items + shipping)
+--   rollup_customer_cohort  per customer: month of the first revenue-status order
+--   rollup_cohort_activity  per cohort and order month: active customers, customers with
+--                           item-bearing orders, revenue
+--
+-- Maintenance is incremental off the same order_changes log as the revenue rollups (its own
+-- high-water mark, 'cohort' in rollup_state): refresh_cohort_rollups() recomputes the
+-- customers touched since then from orders/order_items, then only the matrix cells those
+-- customers were or are in. Month buckets use the session TimeZone of the refresher.
+
+DROP TABLE IF EXISTS rollup_cohort_activity CASCADE;
+DROP TABLE IF EXISTS rollup_customer_cohort CASCADE;
+DROP TABLE IF EXISTS rollup_customer_month CASCADE;
+
+INSERT INTO rollup_state(rollup) VALUES ('cohort');
+
+CREATE TABLE rollup_customer_month (
+  customer_id  BIGINT NOT NULL,
+  order_month  DATE NOT NULL,
+  orders       BIGINT NOT NULL,
+  item_orders  BIGINT NOT NULL,
+  revenue      NUMERIC(14,2) NOT NULL,
+  PRIMARY KEY (customer_id, order_month)
+);
+
+CREATE TABLE rollup_customer_cohort (
+  customer_id   BIGINT PRIMARY KEY,
+  cohort_month  DATE NOT NULL
+);
+CREATE INDEX idx_rollup_customer_cohort_month ON rollup_customer_cohort(cohort_month);
+
+CREATE TABLE rollup_cohort_activity (
+  cohort_month       DATE NOT NULL,
+  order_month        DATE NOT NULL,
+  month_n            INT NOT NULL,
+  active_customers   BIGINT NOT NULL,
+  revenue_customers  BIGINT NOT NULL,
+  revenue            NUMERIC(14,2) NOT NULL,
+  PRIMARY KEY (cohort_month, order_month)
+);
+
+-- Matrix cells listed in the cohort_touched temp table are recomputed from the per-customer
+-- rollups, then the list is cleared.
+
+CREATE OR REPLACE FUNCTION rebuild_cohort_cells() RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+  DELETE FROM rollup_cohort_activity a
+  USING (SELECT DISTINCT cohort_month, order_month FROM cohort_touched) t
+  WHERE a.cohort_month = t.cohort_month AND a.order_month = t.order_month;
+
+  INSERT INTO rollup_cohort_activity(
+    cohort_month, order_month, month_n, active_customers, revenue_customers, revenue
+  )
+  SELECT c.cohort_month,
+         m.order_month,
+         (extract(year from age(m.order_month, c.cohort_month)) * 12
+          + extract(month from age(m.order_month, c.cohort_month)))::int,
+         count(*),
+         count(*) FILTER (WHERE m.item_orders > 0),
+         sum(m.revenue)
+  FROM (SELECT DISTINCT cohort_month, order_month FROM cohort_touched) t
+  JOIN rollup_customer_cohort c ON c.cohort_month = t.cohort_month
+  JOIN rollup_customer_month m ON m.customer_id = c.customer_id AND m.order_month = t.order_month
+  GROUP BY 1, 2;
+
+  TRUNCATE cohort_touched;
+END
+$$;
+
+-- Incremental refresh --------------------------------------------------------
+-- Returns the number of customers recomputed (0 when already up to date).
+
+CREATE OR REPLACE FUNCTION refresh_cohort_rollups() RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  from_id  BIGINT;
+  to_id    BIGINT;
+  custs    BIGINT[];
+BEGIN
+  -- same high-water-mark protocol as refresh_revenue_rollups()
+  LOCK TABLE order_changes IN EXCLUSIVE MODE;
+
+  SELECT last_change_id INTO from_id FROM rollup_state WHERE rollup = 'cohort' FOR UPDATE;
+  SELECT coalesce(max(change_id), from_id) INTO to_id FROM order_changes;
+  IF to_id = from_id THEN
+    RETURN 0;
+  END IF;
+
+  -- orders changes carry the customer; order_items changes belong to the order's customer
+  SELECT array_agg(DISTINCT c) INTO custs
+  FROM (
+    SELECT customer_id AS c
+    FROM order_changes
+    WHERE change_id > from_id AND change_id <= to_id AND customer_id IS NOT NULL
+    UNION
+    SELECT o.customer_id
+    FROM orders o
+    WHERE o.order_id IN (
+      SELECT order_id FROM order_changes
+      WHERE change_id > from_id AND change_id <= to_id AND customer_id IS NULL
+    )
+  ) t;
+
+  -- matrix cells these customers are in now ...
+  CREATE TEMP TABLE IF NOT EXISTS cohort_touched (cohort_month DATE, order_month DATE) ON COMMIT DELETE ROWS;
+  INSERT INTO cohort_touched
+  SELECT DISTINCT c.cohort_month, m.order_month
+  FROM rollup_customer_cohort c
+  JOIN rollup_customer_month m USING (customer_id)
+  WHERE c.customer_id = ANY(custs);
+
+  DELETE FROM rollup_customer_month WHERE customer_id = ANY(custs);
+  DELETE FROM rollup_customer_cohort WHERE customer_id = ANY(custs);
+
+  INSERT INTO rollup_customer_month(customer_id, order_month, orders, item_orders, revenue)
+  SELECT customer_id,
+         order_month,
+         count(*),
+         count(items_total),
+         coalesce(sum((items_total + shipping_cost)::numeric(12,2)), 0)
+  FROM (
+    SELECT o.customer_id,
+           date_trunc('month', o.order_ts)::date AS order_month,
+           o.shipping_cost,
+           (SELECT sum(oi.quantity*oi.unit_price - oi.discount)
+            FROM order_items oi WHERE oi.order_id = o.order_id) AS items_total
+    FROM orders o
+    WHERE o.customer_id = ANY(custs)
+      AND o.status IN ('paid','shipped','delivered','refunded')
+  ) o
+  GROUP BY 1, 2;
+
+  INSERT INTO rollup_customer_cohort(customer_id, cohort_month)
+  SELECT customer_id, min(order_month)
+  FROM rollup_customer_month
+  WHERE customer_id = ANY(custs)
+  GROUP BY 1;
+
+  -- ... and the ones they are in after the recompute
+  INSERT INTO cohort_touched
+  SELECT DISTINCT c.cohort_month, m.order_month
+  FROM rollup_customer_cohort c
+  JOIN rollup_customer_month m USING (customer_id)
+  WHERE c.customer_id = ANY(custs);
+
+  PERFORM rebuild_cohort_cells();
+
+  UPDATE rollup_state
+  SET last_change_id = to_id, refreshed_at = now()
+  WHERE rollup = 'cohort';
+
+  DELETE FROM order_changes
+  WHERE change_id <= (SELECT min(last_change_id) FROM rollup_state WHERE rollup IN ('revenue', 'cohort'));
+
+  RETURN coalesce(array_length(custs, 1), 0);
+END
+$$;
+
+-- Detached months ------------------------------------------------------------
+-- Drops months before `before` (detached partitions, app.db.partitions) so the rollups cover
+-- the same orders as the tables. Customers whose cohort month goes with them move to the
+-- cohort of their first remaining month. Returns the number of such customers.
+
+CREATE OR REPLACE FUNCTION purge_cohort_rollups(before DATE) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  custs  BIGINT[];
+BEGIN
+  -- waits for a running refresh_cohort_rollups(), and keeps the next one out until commit
+  PERFORM 1 FROM rollup_state WHERE rollup = 'cohort' FOR UPDATE;
+
+  SELECT coalesce(array_agg(customer_id), '{}') INTO custs
+  FROM rollup_customer_cohort
+  WHERE cohort_month < before;
+
+  DELETE FROM rollup_customer_month WHERE order_month < before;
+  -- every customer of these cells is in custs or gone
+  DELETE FROM rollup_cohort_activity WHERE cohort_month < before OR order_month < before;
+  DELETE FROM rollup_customer_cohort WHERE customer_id = ANY(custs);
+
+  INSERT INTO rollup_customer_cohort(customer_id, cohort_month)
+  SELECT customer_id, min(order_month)
+  FROM rollup_customer_month
+  WHERE customer_id = ANY(custs)
+  GROUP BY 1;
+
+  CREATE TEMP TABLE IF NOT EXISTS cohort_touched (cohort_month DATE, order_month DATE) ON COMMIT DELETE ROWS;
+  INSERT INTO cohort_touched
+  SELECT DISTINCT c.cohort_month, m.order_month
+  FROM rollup_customer_cohort c
+  JOIN rollup_customer_month m USING (customer_id)
+  WHERE c.customer_id = ANY(custs);
+
+  PERFORM rebuild_cohort_cells();
+
+  RETURN cardinality(custs);
+END
+$$;
@@ -0,0 +1,115 @@
+-- Funnel distinct-count sketches (Postgres)
+-- Back conversion_funnel's approx=true mode: per day and event type, a HyperLogLog sketch
+-- of the session ids seen, so a window's count(distinct session_id) per stage is a merge
+-- of a few hundred small sketches instead of five distinct scans over web_events.
+--
+--   rollup_funnel_sketch.sessions_hll  sparse HLL registers, precision 14 (16384 registers,
+--                                      ~0.8% standard error): 3 bytes per non-empty
+--                                      register, big-endian int2 register index + int1 rank,
+--                                      ordered by index. Merged and estimated in
+--                                      app/queries/approx.py (register-wise max).
+--
+-- hash: hashtextextended(session_id::text, 0); register = low 14 bits; rank = position of
+-- the first 1 bit in the next 50 bits (51 when they are all 0).
+--
+-- Maintenance is incremental: a statement trigger on web_events appends each insert's
+-- registers (max rank per day, event type and register) to funnel_changes, and
+-- refresh_funnel_sketches() merges the committed ones into the existing sketches. Neither
+-- locks web_events, so ingestion keeps going during a refresh. web_events is an append-only
+-- log; updates and deletes are not tracked. Day buckets use the session TimeZone of the
+-- inserter.
+
+DROP TABLE IF EXISTS rollup_funnel_sketch CASCADE;
+DROP TABLE IF EXISTS funnel_changes CASCADE;
+
+-- last_change_id: the last funnel_changes row merged
+INSERT INTO rollup_state(rollup) VALUES ('funnel');
+
+CREATE TABLE rollup_funnel_sketch (
+  day           DATE NOT NULL,
+  event_type    TEXT NOT NULL,
+  sessions_hll  BYTEA NOT NULL,
+  PRIMARY KEY (day, event_type)
+);
+
+CREATE TABLE funnel_changes (
+  change_id   BIGSERIAL PRIMARY KEY,
+  day         DATE NOT NULL,
+  event_type  TEXT NOT NULL,
+  register    SMALLINT NOT NULL,
+  rank        SMALLINT NOT NULL
+);
+
+-- Change capture -------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION log_funnel_changes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO funnel_changes(day, event_type, register, rank)
+  SELECT date_trunc('day', e.event_ts)::date,
+         e.event_type,
+         (h.v & 16383)::smallint,
+         max(coalesce(nullif(position(B'1' IN ((h.v >> 14) & 1125899906842623)::bit(50)), 0), 51))
+  FROM new_rows e
+  CROSS JOIN LATERAL (SELECT hashtextextended(e.session_id::text, 0) AS v) h
+  GROUP BY 1, 2, 3;
+  RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER web_events_funnel_ins AFTER INSERT ON web_events
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_funnel_changes();
+
+-- Incremental refresh --------------------------------------------------------
+-- Returns the number of days merged into (0 when already up to date).
+
+CREATE OR REPLACE FUNCTION refresh_funnel_sketches() RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  to_id  BIGINT;
+  days   INTEGER;
+BEGIN
+  -- serializes refreshers only; writers never wait on this
+  PERFORM 1 FROM rollup_state WHERE rollup = 'funnel' FOR UPDATE;
+
+  -- the DELETE takes exactly the changes committed before it started: rows of in-flight
+  -- inserts aren't visible to it and stay for the next refresh, so nothing needs pinning
+  WITH taken AS (
+    DELETE FROM funnel_changes
+    RETURNING change_id, day, event_type, register, rank
+  ), registers AS (
+    SELECT day, event_type, register, max(rank) AS rank
+    FROM (
+      SELECT day, event_type, register, rank FROM taken
+      UNION ALL
+      -- unpack the current sketches of the touched days
+      SELECT s.day,
+             s.event_type,
+             (get_byte(s.sessions_hll, i) << 8 | get_byte(s.sessions_hll, i + 1))::smallint,
+             get_byte(s.sessions_hll, i + 2)::smallint
+      FROM rollup_funnel_sketch s
+      JOIN (SELECT DISTINCT day, event_type FROM taken) t USING (day, event_type)
+      CROSS JOIN LATERAL generate_series(0, length(s.sessions_hll) - 3, 3) i
+    ) r
+    GROUP BY 1, 2, 3
+  ), merged AS (
+    INSERT INTO rollup_funnel_sketch(day, event_type, sessions_hll)
+    SELECT day,
+           event_type,
+           string_agg(int2send(register) || set_byte('\x00'::bytea, 0, rank), ''::bytea ORDER BY register)
+    FROM registers
+    GROUP BY 1, 2
+    ON CONFLICT (day, event_type) DO UPDATE SET sessions_hll = excluded.sessions_hll
+    RETURNING day
+  )
+  SELECT (SELECT max(change_id) FROM taken), (SELECT count(DISTINCT day) FROM merged) INTO to_id, days;
+
+  IF to_id IS NULL THEN
+    RETURN 0;
+  END IF;
+
+  UPDATE rollup_state SET last_change_id = to_id, refreshed_at = now() WHERE rollup = 'funnel';
+  RETURN days;
+END
+$$;
@@ -0,0 +1,25 @@
+-- sql/curated/anomaly_daily_revenue.sql over the shared base revenue_daily
+-- (sql/shared/revenue_daily.sql). Keep the two in step; tests/test_shared.py checks
+-- they return the same rows.
+
+WITH daily AS (
+  SELECT day, revenue::numeric(12,2) AS revenue
+  FROM revenue_daily
+),
+stats AS (
+  SELECT day,
+         revenue,
+         avg(revenue) OVER (ORDER BY day ROWS BETWEEN 28 PRECEDING AND 1 PRECEDING) AS mean_28d,
+         stddev_samp(revenue) OVER (ORDER BY day ROWS BETWEEN 28 PRECEDING AND 1 PRECEDING) AS sd_28d
+  FROM daily
+)
+SELECT day,
+       revenue,
+       round(mean_28d, 2) AS trailing_mean_28d,
+       round(sd_28d, 2) AS trailing_sd_28d,
+       CASE
+         WHEN sd_28d IS NULL OR sd_28d = 0 THEN NULL
+         ELSE round((revenue - mean_28d) / sd_28d, 2)
+       END AS z_score
+FROM stats
+ORDER BY day
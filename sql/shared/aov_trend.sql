@@ -0,0 +1,16 @@
+-- sql/curated/aov_trend.sql over the shared base revenue_daily (sql/shared/revenue_daily.sql).
+-- Keep the two in step; tests/test_shared.py checks they return the same rows.
+
+WITH weekly AS (
+  SELECT date_trunc('week', day)::date AS week,
+         sum(orders)::bigint AS orders,
+         round(sum(revenue) / sum(orders), 2) AS aov
+  FROM revenue_daily
+  GROUP BY 1
+)
+SELECT week,
+       orders,
+       aov,
+       round(avg(aov) OVER (ORDER BY week ROWS BETWEEN 3 PRECEDING AND CURRENT ROW), 2) AS aov_4wk_ma
+FROM weekly
+ORDER BY week
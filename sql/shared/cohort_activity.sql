@@ -0,0 +1,24 @@
+-- Shared base: cohort activity for months 0-12 of the cohorts in a month window, with each
+-- cohort's size (base "cohort_activity" in app/queries/registry.py).
+-- Params:
+--   $1 start_month (YYYY-MM-01)
+--   $2 end_month   (YYYY-MM-01)
+
+-- cohort_sizes is MATERIALIZED so a generic plan (prepared statement, 6th execution on)
+-- aggregates it once rather than once per activity row on the inside of a nested loop.
+WITH cohort_sizes AS MATERIALIZED (
+  SELECT cohort_month, count(*) AS cohort_size
+  FROM rollup_customer_cohort
+  WHERE cohort_month BETWEEN $1::date AND $2::date
+  GROUP BY 1
+)
+SELECT a.cohort_month,
+       a.month_n,
+       s.cohort_size,
+       a.active_customers,
+       a.revenue_customers,
+       a.revenue
+FROM rollup_cohort_activity a
+LEFT JOIN cohort_sizes s USING (cohort_month)
+WHERE a.cohort_month BETWEEN $1::date AND $2::date
+  AND a.month_n BETWEEN 0 AND 12
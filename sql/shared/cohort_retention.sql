@@ -0,0 +1,12 @@
+-- sql/curated/cohort_retention.sql over the shared base cohort_activity
+-- (sql/shared/cohort_activity.sql). Keep the two in step; tests/test_shared.py checks
+-- they return the same rows.
+
+SELECT cohort_month,
+       month_n,
+       cohort_size,
+       active_customers,
+       round(active_customers::numeric / nullif(cohort_size,0), 4) AS retention_rate
+FROM cohort_activity
+WHERE cohort_size IS NOT NULL
+ORDER BY cohort_month, month_n
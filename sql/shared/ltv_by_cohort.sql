@@ -0,0 +1,18 @@
+-- sql/curated/ltv_by_cohort.sql over the shared base cohort_activity
+-- (sql/shared/cohort_activity.sql). Keep the two in step; tests/test_shared.py checks
+-- they return the same rows.
+
+WITH cohort_cume AS (
+  -- cells with at least one item-bearing order, as in the per-order revenue join
+  SELECT cohort_month, month_n,
+         sum(revenue) OVER (PARTITION BY cohort_month ORDER BY month_n) AS cume_revenue,
+         max(revenue_customers) OVER (PARTITION BY cohort_month) AS cohort_customers
+  FROM cohort_activity
+  WHERE revenue_customers > 0
+)
+SELECT cohort_month,
+       month_n,
+       cohort_customers,
+       round(cume_revenue / nullif(cohort_customers,0), 2) AS avg_cumulative_ltv
+FROM cohort_cume
+ORDER BY cohort_month, month_n
@@ -0,0 +1,9 @@
+-- Shared base: the daily revenue rollup over a date window, read once for every query
+-- that derives from it (base "revenue_daily" in app/queries/registry.py).
+-- Params:
+--   $1 start_date (YYYY-MM-DD)
+--   $2 end_date   (YYYY-MM-DD)
+
+SELECT day, orders, revenue
+FROM rollup_revenue_daily
+WHERE day BETWEEN $1::date AND $2::date
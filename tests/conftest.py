@@ -0,0 +1,41 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+from app.core.config import settings
+from app.db.pool import close_pools
+
+
+async def _reachable() -> bool:
+    try:
+        conn = await asyncpg.connect(settings.database_url, timeout=5)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+        return False
+    await conn.close()
+    return True
+
+
+@pytest.fixture(scope="session")
+def database() -> str:
+    """DATABASE_URL of a seeded database (python -m scripts.init_db); skips the test without one."""
+    if not asyncio.run(_reachable()):
+        pytest.skip(f"no database at {settings.database_url}")
+    return settings.database_url
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop, closing the app's pools afterwards."""
+
+    def _run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                # bounded: a connection that was never released would keep close() waiting
+                await asyncio.wait_for(close_pools(), timeout=10)
+
+        return asyncio.run(main())
+
+    return _run
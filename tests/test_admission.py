@@ -0,0 +1,111 @@
+import asyncio
+import math
+from collections.abc import Callable
+
+import httpx
+import pytest
+
+from app.api import routes
+from app.core.config import settings
+from app.db import admission
+from app.db.admission import ClassGate, Overloaded
+from app.db.pool import CostClass
+from app.db.replicas import PRIMARY, Node
+from app.main import app
+
+# streamed: the route takes a connection straight from the gate, with no cache in front
+PARAMS = {"start_date": "2026-01-01", "end_date": "2026-03-31", "stream": "true"}
+
+
+class FakePool:
+    """Hands out `size` placeholder connections; acquire waits for one like asyncpg's pool."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.free: asyncio.Semaphore | None = None
+
+    async def acquire(self, timeout: float | None = None) -> object:
+        if self.free is None:
+            self.free = asyncio.Semaphore(self.size)
+        await asyncio.wait_for(self.free.acquire(), timeout)
+        return object()
+
+    async def release(self, conn: object) -> None:
+        self.free.release()
+
+
+async def _until(condition: Callable[[], bool]) -> None:
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError("condition never held")
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    """Every gate acquires from one FakePool(1) on a fresh primary node."""
+    pool = FakePool(1)
+    node = Node(PRIMARY, "")
+
+    async def get_pool(cost_class: str, node_name: str = PRIMARY) -> FakePool:
+        return pool
+
+    monkeypatch.setattr(admission, "get_pool", get_pool)
+    monkeypatch.setattr(admission, "route", lambda cost_class: node)
+    return pool
+
+
+def test_gate_sheds_once_queue_max_callers_wait(run, fake_pool):
+    gate = ClassGate(CostClass("test", pool_size=1, queue_max=2, statement_timeout_ms=0))
+
+    async def scenario() -> None:
+        release = asyncio.Event()
+
+        async def hold() -> None:
+            async with gate.connection():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await _until(lambda: gate.running == 1)
+        assert gate.waiting == 0
+
+        waiters = [asyncio.create_task(hold()) for _ in range(2)]
+        await _until(lambda: gate.waiting == 2)
+
+        with pytest.raises(Overloaded):
+            async with gate.connection():
+                pass
+        assert (gate.shed, gate.waiting) == (1, 2)
+
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        assert (gate.waiting, gate.running, gate.admitted, gate.shed) == (0, 0, 3, 1)
+
+    run(scenario())
+
+
+def test_acquire_timeout_is_a_429_with_retry_after(run, fake_pool, monkeypatch):
+    monkeypatch.setattr(settings, "admission_wait_timeout_s", 0.05)
+    gate = admission.GATES["light"]
+    monkeypatch.setattr(gate, "hold_s_ewma", 2.5)
+
+    async def routes_data_version() -> str:
+        return "v1"
+
+    monkeypatch.setattr(routes, "_data_version", routes_data_version)
+
+    async def scenario() -> httpx.Response:
+        shed = gate.shed
+        # the pool's only connection is taken, so the request's acquire times out
+        async with gate.connection():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                r = await client.get("/api/query/aov_trend", params=PARAMS)
+            assert gate.shed == shed + 1
+            assert gate.waiting == 0
+        return r
+
+    r = run(scenario())
+    assert r.status_code == 429
+    # smoothed hold time x (the request itself waiting + 1) / the light pool's size
+    assert int(r.headers["Retry-After"]) == max(1, math.ceil(2.5 * 2 / settings.light_pool_size))
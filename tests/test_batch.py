@@ -0,0 +1,55 @@
+import json
+
+import asyncpg
+import httpx
+
+from app.main import app
+from app.queries import batch
+
+PARAMS = {"start_date": "2026-01-01", "end_date": "2026-03-31", "start_month": "2026-01-01", "end_month": "2026-03-01"}
+
+
+def _payload(query_id: str, value: object = 1) -> dict:
+    return {"query_id": query_id, "columns": ["v"], "rows": [[value]], "row_count": 1}
+
+
+async def _execute_curated_query(query_id: str, params: dict) -> dict:
+    if query_id == "conversion_funnel":
+        raise ConnectionResetError("connection reset by peer")
+    if query_id == "return_rate_by_category":
+        raise asyncpg.InterfaceError("connection is closed")
+    return _payload(query_id)
+
+
+async def _execute_shared_queries(query_ids: list[str], params: dict) -> dict:
+    if "cohort_retention" in query_ids:
+        raise OSError("network unreachable")
+    # not JSON-encodable: fails in the route, after run_batch
+    return {"aov_trend": _payload("aov_trend"), "anomaly_daily_revenue": _payload("anomaly_daily_revenue", object())}
+
+
+def test_batch_reports_unexpected_failures_per_item(run, monkeypatch):
+    monkeypatch.setattr(batch, "execute_curated_query", _execute_curated_query)
+    monkeypatch.setattr(batch, "execute_shared_queries", _execute_shared_queries)
+    query_ids = [
+        "cohort_retention",
+        "ltv_by_cohort",
+        "conversion_funnel",
+        "return_rate_by_category",
+        "shipping_sla",
+        "no_such_query",
+        "aov_trend",
+        "anomaly_daily_revenue",
+    ]
+
+    async def post() -> tuple[int, list[dict]]:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            body = {"queries": [{"query_id": qid, "params": PARAMS} for qid in query_ids]}
+            r = await client.post("/api/query/batch", json=body)
+            return r.status_code, [json.loads(line) for line in r.text.splitlines()]
+
+    status, lines = run(post())
+    assert status == 200
+    outcomes = {line["index"]: line.get("status", 200) if not line["ok"] else "ok" for line in lines}
+    assert outcomes == {0: 500, 1: 500, 2: 500, 3: 500, 4: "ok", 5: 404, 6: "ok", 7: 500}
+    assert next(line for line in lines if line["index"] == 4)["result"]["rows"] == [[1]]
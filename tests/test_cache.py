@@ -0,0 +1,85 @@
+import asyncio
+
+import asyncpg
+
+from app.db.pool import CuratedConnection
+from app.db.replicas import PRIMARY
+from app.queries.cache import fetch_data_version, result_cache
+from app.queries.runner import UNVERSIONED, _cache_key, bind_params, run_curated_query
+from app.queries.store import result_store
+
+INSERTS_SQL = "select coalesce(sum(n_tup_ins), 0) from pg_stat_user_tables where relname = any($1::text[])"
+
+
+async def _version_after(database: str, statements: list[str], tables: list[str]) -> tuple[str, str]:
+    """Data version before and after running statements in a rolled-back transaction.
+
+    Aborted inserts still count in pg_stat_user_tables, so this waits for the writer's
+    table stats to show up before reading the second version.
+    """
+    reader = await asyncpg.connect(database)
+    try:
+        before = await fetch_data_version(reader)
+        inserts = await reader.fetchval(INSERTS_SQL, tables)
+        writer = await asyncpg.connect(database)
+        try:
+            tr = writer.transaction()
+            await tr.start()
+            for sql in statements:
+                await writer.execute(sql)
+            await tr.rollback()
+        finally:
+            # a backend flushes its table stats when it exits
+            await writer.close()
+        for _ in range(100):
+            await reader.execute("select pg_stat_clear_snapshot()")
+            if await reader.fetchval(INSERTS_SQL, tables) > inserts:
+                break
+            await asyncio.sleep(0.05)
+        else:
+            raise AssertionError(f"no insert counted on {tables}")
+        return before, await fetch_data_version(reader)
+    finally:
+        await reader.close()
+
+
+def test_data_version_ignores_change_logs(database, run):
+    statements = [
+        "insert into order_changes(order_id) values (0)",
+        "insert into funnel_changes(day, event_type, register, rank) values (current_date, 'session_start', 0, 1)",
+    ]
+    before, after = run(_version_after(database, statements, ["order_changes", "funnel_changes"]))
+    assert before == after
+
+
+def test_data_version_follows_source_tables(database, run):
+    statements = [
+        "insert into web_events(event_ts, session_id, event_type, channel) "
+        "values (now(), gen_random_uuid(), 'session_start', 'web')"
+    ]
+    before, after = run(_version_after(database, statements, ["funnel_changes"]))
+    assert before != after
+
+
+def test_replica_results_are_not_cached_until_it_caught_up(database, run, monkeypatch):
+    # the primary stands in for a replica that never replayed the version's WAL position
+    monkeypatch.setattr(result_store, "enabled", False)
+    async def check() -> list[tuple[bool, bool]]:
+        conn = await asyncpg.connect(database, connection_class=CuratedConnection)
+        try:
+            params = {"start_date": "2025-01-01", "end_date": "2025-03-31"}
+            key = _cache_key("aov_trend", bind_params("aov_trend", params))
+            outcomes = []
+            for node in ("replica1", PRIMARY):
+                conn.node = node
+                result_cache.clear()
+                payload = await run_curated_query(conn, "aov_trend", params)
+                cached = result_cache.get(key, await result_cache.data_version()) is not None
+                outcomes.append((cached, UNVERSIONED in payload))
+            return outcomes
+        finally:
+            result_cache.clear()
+            await conn.close()
+
+    # (cached, served without an ETag)
+    assert run(check()) == [(False, True), (True, False)]
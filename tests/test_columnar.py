@@ -0,0 +1,105 @@
+import json
+import struct
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import asyncpg
+import numpy as np
+
+from app.queries.columnar import MAGIC, encode_columnar
+from app.queries.encoding import encode_payload
+from app.queries.registry import QUERIES, load_sql
+from app.queries.shared import column_types, result_columns
+
+ARRAYS = {"i32": "<i4", "f64": "<f8", "bool": np.uint8}
+CODES = {1: np.uint8, 2: "<u2", 4: "<u4"}
+EPOCH = date(1970, 1, 1)
+
+
+def decode_columnar(body: bytes) -> dict:
+    """frontend/public/columnar.js's decodeColumnar, with `rows` rebuilt from the columns."""
+    assert body[:4] == MAGIC
+    (length,) = struct.unpack_from("<I", body, 4)
+    result = json.loads(body[8 : 8 + length])
+    base, n = 8 + length, result["row_count"]
+    columns = []
+    for col in result.pop("layout"):
+        at = base + col["offset"]
+        kind = col["type"]
+        if kind == "json":
+            columns.append(json.loads(body[at : at + col["length"]]))
+            continue
+        if kind == "dict":
+            codes = np.frombuffer(body, dtype=CODES[col["width"]], count=n, offset=at)
+            values = [col["dictionary"][c] for c in codes]
+        elif kind == "date":
+            days = np.frombuffer(body, dtype="<i4", count=n, offset=at)
+            values = [(EPOCH + timedelta(days=int(d))).isoformat() for d in days]
+        elif kind == "dec":
+            scaled = np.frombuffer(body, dtype="<i4", count=n, offset=at)
+            values = [int(v) / 10 ** col["scale"] for v in scaled]
+        elif kind == "bool":
+            values = [bool(b == 1) for b in np.frombuffer(body, dtype=np.uint8, count=n, offset=at)]
+        else:
+            values = np.frombuffer(body, dtype=ARRAYS[kind], count=n, offset=at).tolist()
+        if "nulls" in col:
+            bits = np.frombuffer(body, dtype=np.uint8, count=(n + 7) // 8, offset=base + col["nulls"])
+            is_null = np.unpackbits(bits, bitorder="little")[:n].astype(bool)
+            values = [None if null else v for v, null in zip(values, is_null)]
+        columns.append(values)
+    result["rows"] = [list(r) for r in zip(*columns)]
+    return result
+
+
+def _js_type(value: object) -> str:
+    # what a JavaScript client tells apart; True == 1 in Python, so == alone doesn't
+    return "number" if type(value) in (int, float) else type(value).__name__
+
+
+def _assert_round_trip(payload: dict, types: list | None = None) -> list[str]:
+    """Check the columnar body decodes to the JSON body; returns the column types it used."""
+    body = encode_columnar(payload)
+    expected = json.loads(encode_payload(payload, types))
+    decoded = decode_columnar(body)
+    assert decoded == expected
+    assert [list(map(_js_type, r)) for r in decoded["rows"]] == [list(map(_js_type, r)) for r in expected["rows"]]
+    (length,) = struct.unpack_from("<I", body, 4)
+    return [c["type"] for c in json.loads(body[8 : 8 + length])["layout"]]
+
+
+COLUMNS = ["day", "n", "big", "huge", "amount", "mixed", "ratio", "label", "flag", "at", "empty"]
+ROWS = [
+    [date(2026, 1, 1), 1, 2**40, 2**60, Decimal("1.25"), Decimal("1.5"), 0.5, "a", True, datetime(2026, 1, 1, 8), None],
+    [None, None, None, None, None, None, None, None, None, None, None],
+    [date(1969, 12, 31), -7, -(2**40), 3, Decimal("-0.10"), Decimal("2"), float("nan"), "b", False, None, None],
+    [date(2026, 3, 1), 2**31 - 1, 0, 4, Decimal("NaN"), Decimal("0.125"), float("-inf"), "a", None, None, None],
+]
+
+
+def test_columnar_decodes_to_the_json_rows():
+    payload = {"query_id": "q", "columns": COLUMNS, "rows": ROWS, "row_count": len(ROWS), "chart": None}
+    kinds = _assert_round_trip(payload)
+    assert kinds == ["date", "i32", "f64", "json", "dec", "f64", "f64", "dict", "bool", "json", "json"]
+
+
+def test_columnar_empty_result_decodes_to_no_rows():
+    payload = {"query_id": "q", "columns": ["day", "n"], "rows": [], "row_count": 0}
+    assert _assert_round_trip(payload) == ["json", "json"]
+
+
+def test_curated_results_round_trip(database, run):
+    async def check() -> None:
+        conn = await asyncpg.connect(database)
+        try:
+            first, last = await conn.fetchrow("select min(order_ts)::date, max(order_ts)::date from orders")
+            window = {"start_date": first, "end_date": last, "start_month": first, "end_month": last.replace(day=1)}
+            for qid, query in QUERIES.items():
+                records = await conn.fetch(load_sql(qid), *(window[p] for p in query.params))
+                assert records, qid
+                columns = [name for name, _ in await result_columns(conn, qid)]
+                payload = {"query_id": qid, "columns": columns, "rows": records, "row_count": len(records)}
+                _assert_round_trip(payload, column_types(qid, columns))
+        finally:
+            await conn.close()
+
+    run(check())
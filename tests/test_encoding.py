@@ -0,0 +1,78 @@
+import json
+import struct
+from datetime import date
+from decimal import Decimal
+
+import asyncpg
+import numpy as np
+
+from app.queries.columnar import MAGIC, encode_columnar
+from app.queries.encoding import dumps, encode_payload, encode_rows
+from app.queries.registry import QUERIES, load_sql
+from app.queries.shared import column_types, result_columns
+
+
+def _strict_loads(text: str | bytes):
+    def reject(token: str):
+        raise AssertionError(f"{token} in JSON output")
+
+    return json.loads(text, parse_constant=reject)
+
+
+ROWS = [
+    [date(2026, 1, 1), Decimal("1.50"), 1.5, Decimal("NaN")],
+    [date(2026, 1, 2), Decimal("NaN"), float("nan"), Decimal("NaN")],
+    [date(2026, 1, 3), Decimal("-Infinity"), float("inf"), None],
+]
+EXPECTED = [["2026-01-01", 1.5, 1.5, None], ["2026-01-02", None, None, None], ["2026-01-03", None, None, None]]
+
+
+def test_non_finite_values_encode_as_null():
+    payload = {"columns": ["day", "a", "b", "c"], "rows": ROWS}
+    assert _strict_loads(encode_payload(payload))["rows"] == EXPECTED
+    assert [_strict_loads(line) for line in encode_rows(ROWS)] == EXPECTED
+    assert _strict_loads(dumps({"v": Decimal("NaN")})) == {"v": None}
+
+
+def test_columnar_non_finite_values_are_null():
+    body = encode_columnar({"columns": ["day", "a", "b", "c"], "rows": ROWS})
+    assert body[:4] == MAGIC
+    (length,) = struct.unpack_from("<I", body, 4)
+    header = _strict_loads(body[8 : 8 + length])
+    buffers = body[8 + length :]
+    for entry, expected in zip(header["layout"][1:], ([False, True, True], [False, True, True], [True, True, True])):
+        if entry["type"] == "json":
+            values = _strict_loads(buffers[entry["offset"] : entry["offset"] + entry["length"]])
+            assert [v is None for v in values] == expected
+            continue
+        bits = np.frombuffer(buffers, dtype=np.uint8, count=1, offset=entry["nulls"])
+        assert np.unpackbits(bits, bitorder="little")[:3].astype(bool).tolist() == expected
+
+
+def test_declared_types_convert_columns_with_no_sample():
+    rows = [[None, None, 7], [Decimal("2.50"), date(2026, 1, 2), 8], [Decimal("NaN"), None, None]]
+    types = ["numeric", "date", "int8"]
+    expected = [[None, None, 7], [2.5, "2026-01-02", 8], [None, None, None]]
+    assert _strict_loads(encode_payload({"rows": rows}, types))["rows"] == expected
+    assert [_strict_loads(line) for line in encode_rows(rows, types)] == expected
+
+
+def test_records_encode_like_the_rows_they_hold(database, run):
+    async def check() -> list[str]:
+        conn = await asyncpg.connect(database)
+        try:
+            first, last = await conn.fetchrow("select min(order_ts)::date, max(order_ts)::date from orders")
+            window = {"start_date": first, "end_date": last, "start_month": first, "end_month": last.replace(day=1)}
+            differ = []
+            for qid, query in QUERIES.items():
+                records = await conn.fetch(load_sql(qid), *(window[p] for p in query.params))
+                columns = [name for name, _ in await result_columns(conn, qid)]
+                payload = {"query_id": qid, "columns": columns, "rows": records}
+                expected = dumps({**payload, "rows": [list(r.values()) for r in records]}).encode()
+                if encode_payload(payload, column_types(qid, columns)) != expected:
+                    differ.append(qid)
+            return differ
+        finally:
+            await conn.close()
+
+    assert run(check()) == []
@@ -0,0 +1,72 @@
+import httpx
+import pytest
+
+from app.api import routes
+from app.main import app
+from app.queries.runner import UNVERSIONED
+
+PATH = "/api/query/aov_trend"
+PARAMS = {"start_date": "2026-01-01", "end_date": "2026-03-31"}
+
+
+@pytest.fixture
+def stub_query(monkeypatch):
+    """The route's data version and query stubbed; returns the state the stubs read and count."""
+    state = {"version": "v1", "executions": 0, "unversioned": False}
+
+    async def data_version() -> str:
+        return state["version"]
+
+    async def execute_curated_query(query_id: str, params: dict, *, approx: bool = False) -> dict:
+        state["executions"] += 1
+        payload = {"query_id": query_id, "columns": ["day"], "rows": [["2026-01-01"]], "row_count": 1}
+        return {**payload, UNVERSIONED: True} if state["unversioned"] else payload
+
+    monkeypatch.setattr(routes, "_data_version", data_version)
+    monkeypatch.setattr(routes, "execute_curated_query", execute_curated_query)
+    return state
+
+
+def _get(run, params: dict = PARAMS, **headers: str) -> httpx.Response:
+    async def get() -> httpx.Response:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(PATH, params=params, headers=headers)
+
+    return run(get())
+
+
+def test_matching_if_none_match_is_not_modified(run, stub_query):
+    r = _get(run)
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert stub_query["executions"] == 1
+
+    for if_none_match in (etag, etag.removeprefix("W/"), f'W/"other", {etag}', "*"):
+        r = _get(run, **{"If-None-Match": if_none_match})
+        assert r.status_code == 304, if_none_match
+        assert r.headers["ETag"] == etag
+        assert r.content == b""
+    # answered before any SQL
+    assert stub_query["executions"] == 1
+
+    # another window, another representation
+    other = _get(run, {**PARAMS, "end_date": "2026-02-28"}, **{"If-None-Match": etag})
+    assert other.status_code == 200
+    assert other.headers["ETag"] != etag
+
+
+def test_data_version_change_gives_a_new_etag(run, stub_query):
+    etag = _get(run).headers["ETag"]
+    stub_query["version"] = "v2"
+    r = _get(run, **{"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert _get(run, **{"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+
+def test_unversioned_result_has_no_etag(run, stub_query):
+    stub_query["unversioned"] = True
+    r = _get(run)
+    assert r.status_code == 200
+    assert "ETag" not in r.headers
+    assert UNVERSIONED not in r.json()
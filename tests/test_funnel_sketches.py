@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import asyncpg
+
+# the day's sketch rebuilt from web_events, as the trigger + refresh should have it
+RECOMPUTE_SQL = r"""
+select event_type,
+       string_agg(int2send(register) || set_byte('\x00'::bytea, 0, rank), ''::bytea order by register)
+from (
+  select e.event_type,
+         (h.v & 16383)::smallint as register,
+         max(coalesce(nullif(position(B'1' in ((h.v >> 14) & 1125899906842623)::bit(50)), 0), 51)) as rank
+  from web_events e
+  cross join lateral (select hashtextextended(e.session_id::text, 0) as v) h
+  where e.event_ts >= $1::timestamptz and e.event_ts < $1::timestamptz + interval '1 day'
+  group by 1, 2
+) r
+group by 1
+"""
+
+INSERT_SQL = """
+insert into web_events(event_ts, session_id, event_type, channel)
+select $1::timestamptz + n * interval '1 second', gen_random_uuid(), $2, 'web' from generate_series(1, $3) n
+"""
+
+
+def test_refresh_merges_new_events_into_existing_days(database, run):
+    async def check() -> None:
+        conn = await asyncpg.connect(database)
+        try:
+            tr = conn.transaction()
+            await tr.start()
+            try:
+                # midnight in the session TimeZone, which the day buckets use
+                day, start = await conn.fetchrow("select max(day), max(day)::timestamptz from rollup_funnel_sketch")
+                await conn.execute(INSERT_SQL, start, "session_start", 500)
+                await conn.execute(INSERT_SQL, start + timedelta(hours=1), "purchase", 20)
+                assert await conn.fetchval("select refresh_funnel_sketches()") >= 1
+                assert await conn.fetchval("select count(*) from funnel_changes") == 0
+
+                sketches = dict(
+                    await conn.fetch("select event_type, sessions_hll from rollup_funnel_sketch where day = $1", day)
+                )
+                assert sketches == dict(await conn.fetch(RECOMPUTE_SQL, start))
+            finally:
+                await tr.rollback()
+        finally:
+            await conn.close()
+
+    run(check())
+
+
+def test_refresh_does_not_wait_for_in_flight_inserts(database, run):
+    async def check() -> None:
+        writer = await asyncpg.connect(database)
+        refresher = await asyncpg.connect(database)
+        try:
+            tr = writer.transaction()
+            await tr.start()
+            try:
+                await writer.execute(INSERT_SQL, datetime.now().astimezone(), "session_start", 10)
+                pending = await writer.fetchval("select max(change_id) from funnel_changes")
+
+                # an uncommitted insert neither blocks the refresh nor gets consumed by it
+                await asyncio.wait_for(refresher.fetchval("select refresh_funnel_sketches()"), timeout=5)
+                assert await writer.fetchval("select count(*) from funnel_changes where change_id = $1", pending) == 1
+            finally:
+                await tr.rollback()
+        finally:
+            await writer.close()
+            await refresher.close()
+
+    run(check())
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+import asyncpg
+import httpx
+
+from app.api.ingest import INT4_MAX, INT8_MAX
+from app.core.config import settings
+from app.db.ingest import BUFFERS, IngestBuffer
+from app.main import app
+
+
+def _buffer(table: str) -> IngestBuffer:
+    return IngestBuffer(table, max_rows=100, flush_rows=100, flush_interval_s=60, wait_s=0)
+
+
+def _event(ts: datetime) -> tuple:
+    return (ts, uuid4(), None, "session_start", None, "web", None, None)
+
+
+async def _load_rolled_back(database: str, buf: IngestBuffer, rows: list[tuple], *setup: str) -> int:
+    # a flush's partition check + _load inside a transaction that is rolled back, so nothing is
+    # left in the tables
+    conn = await asyncpg.connect(database)
+    try:
+        tr = conn.transaction()
+        await tr.start()
+        try:
+            for sql in setup:
+                await conn.execute(sql)
+            return await buf._load(conn, await buf._ensure_partitions(conn, rows))
+        finally:
+            await tr.rollback()
+    finally:
+        await conn.close()
+
+
+def test_out_of_range_web_event_is_rejected_alone(database, run):
+    buf = _buffer("web_events")
+    now = datetime.now(timezone.utc)
+    rows = [_event(now) for _ in range(4)]
+    # bigint column: asyncpg fails to encode it client-side (OverflowError)
+    rows[2] = (now, uuid4(), None, "product_view", INT8_MAX + 1, "web", None, None)
+
+    assert run(_load_rolled_back(database, buf, rows)) == 3
+    assert buf.rejected == 1
+
+
+def test_out_of_range_order_item_rejects_only_its_order(database, run):
+    async def ids(conn_url: str) -> tuple[int, int]:
+        conn = await asyncpg.connect(conn_url)
+        try:
+            return await conn.fetchval("select min(customer_id) from customers"), await conn.fetchval(
+                "select min(product_id) from products"
+            )
+        finally:
+            await conn.close()
+
+    customer_id, product_id = run(ids(database))
+    buf = _buffer("orders")
+    now = datetime.now(timezone.utc)
+    order = (customer_id, now, "paid", "web", "USD", Decimal("0"))
+    rows = [(order, [(product_id, 1, Decimal("9.99"), Decimal("0"))]) for _ in range(3)]
+    # int4 column
+    rows[1] = (order, [(product_id, INT4_MAX + 1, Decimal("9.99"), Decimal("0"))])
+
+    assert run(_load_rolled_back(database, buf, rows)) == 2
+    assert buf.rejected == 1
+
+
+def test_out_of_range_timestamps_are_rejected_alone(database, run):
+    buf = _buffer("web_events")
+    now = datetime.now(timezone.utc)
+    year_1, year_9999 = datetime.min.replace(tzinfo=timezone.utc), datetime.max.replace(tzinfo=timezone.utc)
+    rows = [_event(now), _event(year_1), _event(now), _event(year_9999)]
+
+    assert run(_load_rolled_back(database, buf, rows)) == 2
+    assert buf.rejected == 2
+
+    async def partitions(conn_url: str) -> int:
+        conn = await asyncpg.connect(conn_url)
+        try:
+            return await conn.fetchval("select count(*) from month_partitions('web_events')")
+        finally:
+            await conn.close()
+
+    before = run(partitions(database))
+    run(_load_rolled_back(database, _buffer("web_events"), [_event(now + timedelta(days=3650))]))
+    assert run(partitions(database)) == before
+
+
+def test_rows_in_a_detached_month_are_rejected_alone(database, run):
+    buf = _buffer("web_events")
+    now = datetime.now(timezone.utc)
+    # within INGEST_MAX_AGE_DAYS, but always in an earlier month than now
+    old = now - timedelta(days=32)
+    partition = f"web_events_p{old:%Y_%m}"
+    rows = [_event(now), _event(old), _event(now)]
+
+    loaded = run(_load_rolled_back(database, buf, rows, f"alter table web_events detach partition {partition}"))
+    assert loaded == 2
+    assert buf.rejected == 1
+    # the next flush doesn't retry the month either
+    assert run(_load_rolled_back(database, buf, rows[1:2], f"alter table web_events detach partition {partition}")) == 0
+    assert buf.rejected == 2
+
+
+def test_out_of_range_values_fail_validation(run):
+    async def post(path: str, body: dict) -> int:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return (await client.post(path, json=body)).status_code
+
+    now = datetime.now(timezone.utc).isoformat()
+    item = {"product_id": 1, "quantity": INT4_MAX + 1, "unit_price": "9.99"}
+    order = {"customer_id": 1, "order_ts": now, "status": "paid", "channel": "web", "items": [item]}
+    assert run(post("/api/ingest/orders", {"orders": [order]})) == 422
+
+    event = {
+        "event_ts": now,
+        "session_id": str(uuid4()),
+        "event_type": "product_view",
+        "product_id": INT8_MAX + 1,
+        "channel": "web",
+    }
+    assert run(post("/api/ingest/web_events", {"events": [event]})) == 422
+
+    for ts in ("0001-01-01T00:00:00Z", "9999-12-31T00:00:00Z"):
+        event = {"event_ts": ts, "session_id": str(uuid4()), "event_type": "session_start", "channel": "web"}
+        assert run(post("/api/ingest/web_events", {"events": [event]})) == 422
+        item = {"product_id": 1, "quantity": 1, "unit_price": "9.99"}
+        order = {"customer_id": 1, "order_ts": ts, "status": "paid", "channel": "web", "items": [item]}
+        assert run(post("/api/ingest/orders", {"orders": [order]})) == 422
+
+
+def test_snapshot_backend_refuses_ingestion(run, monkeypatch):
+    monkeypatch.setattr(settings, "query_backend", "snapshot")
+
+    async def post() -> httpx.Response:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            event = {
+                "event_ts": datetime.now(timezone.utc).isoformat(),
+                "session_id": str(uuid4()),
+                "event_type": "session_start",
+                "channel": "web",
+            }
+            return await client.post("/api/ingest/web_events", json={"events": [event]})
+
+    pending = BUFFERS["web_events"].pending
+    r = run(post())
+    assert r.status_code == 503
+    assert BUFFERS["web_events"].pending == pending
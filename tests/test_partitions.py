@@ -0,0 +1,68 @@
+import asyncpg
+
+from app.db.partitions import purge_rollups
+
+COHORT_TABLES = ("rollup_customer_month", "rollup_customer_cohort", "rollup_cohort_activity")
+# no foreign keys to the partitioned orders table; a trigger deletes their rows instead
+CHILD_TABLES = ("order_items", "payments", "refunds", "shipments")
+
+
+async def _rows(conn: asyncpg.Connection, table: str) -> set[tuple]:
+    return {tuple(r) for r in await conn.fetch(f"select * from {table}")}
+
+
+def test_purge_matches_rollups_rebuilt_without_the_detached_months(database, run):
+    async def check() -> None:
+        conn = await asyncpg.connect(database)
+        try:
+            tr = conn.transaction()
+            await tr.start()
+            try:
+                cutoff = await conn.fetchval(
+                    "select (date_trunc('month', min(order_ts)) + interval '3 months')::date from orders"
+                )
+                daily = await conn.fetch("select * from rollup_revenue_daily where day >= $1 order by day", cutoff)
+                await purge_rollups(conn, cutoff)
+
+                assert await conn.fetch("select * from rollup_revenue_daily order by day") == daily
+                assert await conn.fetchval("select count(*) from rollup_order_revenue where day < $1", cutoff) == 0
+                assert await conn.fetchval("select min(day) from rollup_funnel_sketch") >= cutoff
+                purged = {t: await _rows(conn, t) for t in COHORT_TABLES}
+                assert min(r[1] for r in purged["rollup_customer_cohort"]) >= cutoff
+
+                # the same months detached, and the cohort rollups rebuilt from scratch
+                for (name,) in await conn.fetch(
+                    "select partition_name from month_partitions('orders') where month < $1", cutoff
+                ):
+                    await conn.execute(f"alter table orders detach partition {name}")
+                await conn.execute(f"truncate {', '.join(COHORT_TABLES)}")
+                await conn.execute("insert into order_changes(order_id, customer_id) select 0, customer_id from customers")
+                await conn.fetchval("select refresh_cohort_rollups()")
+                assert {t: await _rows(conn, t) for t in COHORT_TABLES} == purged
+            finally:
+                await tr.rollback()
+        finally:
+            await conn.close()
+
+    run(check())
+
+
+def test_deleting_orders_deletes_their_child_rows(database, run):
+    async def check() -> None:
+        conn = await asyncpg.connect(database)
+        try:
+            tr = conn.transaction()
+            await tr.start()
+            try:
+                # orders with a refund have items, a payment and a shipment too
+                order_ids = [r[0] for r in await conn.fetch("select distinct order_id from refunds limit 5")]
+                await conn.execute("delete from orders where order_id = any($1)", order_ids)
+                for table in CHILD_TABLES:
+                    count = await conn.fetchval(f"select count(*) from {table} where order_id = any($1)", order_ids)
+                    assert count == 0, table
+            finally:
+                await tr.rollback()
+        finally:
+            await conn.close()
+
+    run(check())
@@ -0,0 +1,35 @@
+import asyncpg
+
+from app.db.pool import get_pool
+from app.queries.registry import QUERIES
+from app.queries.runner import run_curated_query
+
+PREPARED_SQL = "select count(*) from pg_prepared_statements"
+
+
+async def _check(database: str) -> None:
+    pool = await get_pool("light")
+    async with pool.acquire() as conn:
+        assert await conn.fetchval(PREPARED_SQL) >= len(QUERIES)
+        pid = conn.get_server_pid()
+
+    # an idle pool connection holds no locks (they would block DDL such as new partitions)
+    other = await asyncpg.connect(database)
+    try:
+        assert await other.fetchval("select count(*) from pg_locks where pid = $1", pid) == 0
+    finally:
+        await other.close()
+
+    # across the pool's reset on release, a curated query runs without preparing anything new
+    async with pool.acquire() as conn:
+        assert conn.get_server_pid() == pid
+        prepared = await conn.fetchval(PREPARED_SQL)
+        payload = await run_curated_query(
+            conn, "aov_trend", {"start_date": "2025-01-01", "end_date": "2026-12-31"}, use_cache=False
+        )
+        assert payload["rows"]
+        assert await conn.fetchval(PREPARED_SQL) == prepared
+
+
+def test_pool_connections_keep_curated_statements_prepared(database, run):
+    run(_check(database))
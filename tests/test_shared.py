@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+import asyncpg
+
+from app.queries.registry import BASE_RELATIONS, QUERIES, load_sql
+from app.queries.shared import fetch_shared
+
+
+def test_shared_derivations_match_curated_sql(database, run):
+    # sql/shared/<query_id>.sql are hand-kept copies of the curated SQL over a base; this
+    # fails as soon as one drifts from its curated statement
+    async def check() -> list[str]:
+        conn = await asyncpg.connect(database)
+        try:
+            first, last = await conn.fetchrow("select min(order_ts)::date, max(order_ts)::date from orders")
+            drifted = []
+            for base in BASE_RELATIONS.values():
+                qids = [q.id for q in QUERIES.values() if q.base == base.id]
+                assert len(qids) > 1, f"base {base.id} has fewer than two queries"
+                for days in (90, 365, (last - first).days):
+                    start = max(first, last - timedelta(days=days))
+                    window = {
+                        "start_date": start,
+                        "end_date": last,
+                        "start_month": start.replace(day=1),
+                        "end_month": last.replace(day=1),
+                    }
+                    values = [window[p] for p in base.params]
+                    shared = await fetch_shared(conn, qids, values)
+                    for qid in qids:
+                        curated = [list(r.values()) for r in await conn.fetch(load_sql(qid), *values)]
+                        assert curated, f"{qid} over {days}d: no rows to compare"
+                        if shared[qid][1] != curated:
+                            drifted.append(f"{qid} over {days}d")
+            return drifted
+        finally:
+            await conn.close()
+
+    assert run(check()) == []
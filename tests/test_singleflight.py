@@ -0,0 +1,83 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.queries import runner
+from app.queries.singleflight import SingleFlight
+
+PARAMS = {"start_date": "2026-01-01", "end_date": "2026-03-31"}
+CALLERS = 5
+
+
+@pytest.fixture
+def stub_fetch(monkeypatch):
+    """run_curated_query stubbed to wait for `release`, then return or raise `outcome`."""
+    state = {"executions": 0, "outcome": {"query_id": "aov_trend", "rows": [[1]]}, "release": None}
+
+    @asynccontextmanager
+    async def admitted_connection(query_id: str, cost_class: str | None = None):
+        yield object()
+
+    async def run_curated_query(conn, query_id: str, params: dict, refresh: bool = False) -> dict:
+        state["executions"] += 1
+        await state["release"].wait()
+        if isinstance(state["outcome"], Exception):
+            raise state["outcome"]
+        return state["outcome"]
+
+    monkeypatch.setattr(runner, "admitted_connection", admitted_connection)
+    monkeypatch.setattr(runner, "run_curated_query", run_curated_query)
+    monkeypatch.setattr(runner, "in_flight", SingleFlight())
+    return state
+
+
+async def _concurrent(state: dict) -> list:
+    state["release"] = asyncio.Event()
+    calls = [asyncio.create_task(runner.execute_curated_query("aov_trend", dict(PARAMS))) for _ in range(CALLERS)]
+    while runner.in_flight.coalesced < CALLERS - 1:
+        await asyncio.sleep(0.001)
+    state["release"].set()
+    return await asyncio.gather(*calls, return_exceptions=True)
+
+
+def test_identical_requests_share_one_execution(run, stub_fetch):
+    results = run(_concurrent(stub_fetch))
+    assert stub_fetch["executions"] == 1
+    assert results == [stub_fetch["outcome"]] * CALLERS
+    # each caller gets its own copy of the payload
+    assert len({id(r) for r in results}) == CALLERS
+    assert runner.in_flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": CALLERS - 1}
+
+
+def test_leader_failure_reaches_every_follower(run, stub_fetch):
+    stub_fetch["outcome"] = error = RuntimeError("connection reset")
+    results = run(_concurrent(stub_fetch))
+    assert stub_fetch["executions"] == 1
+    assert all(r is error for r in results)
+    # nothing is remembered: the next call runs again
+    stub_fetch["outcome"] = {"query_id": "aov_trend", "rows": []}
+    assert run(_concurrent(stub_fetch)) == [stub_fetch["outcome"]] * CALLERS
+    assert stub_fetch["executions"] == 2
+
+
+def test_execution_outlives_a_cancelled_caller(run):
+    flight = SingleFlight()
+
+    async def scenario() -> tuple:
+        release = asyncio.Event()
+
+        async def fn() -> str:
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do("k", fn))
+        second = asyncio.create_task(flight.do("k", fn))
+        while flight.coalesced < 1:
+            await asyncio.sleep(0.001)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await second, first.cancelled()
+
+    assert run(scenario()) == (("done", True), True)
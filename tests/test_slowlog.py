@@ -0,0 +1,38 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import date
+
+from app.queries import slowlog
+from app.queries.slowlog import SlowQueryLog
+
+VALUES = [date(2026, 1, 1), date(2026, 3, 31)]
+PLAN = {"Node Type": "Seq Scan", "Relation Name": "orders", "Actual Total Time": 2.0, "Actual Loops": 1}
+
+
+def test_failed_capture_is_logged_and_retried(run, monkeypatch, caplog):
+    # the first plan is missing what _top_nodes reads (a KeyError), the second one is fine
+    plans = [[{"Plan": {}}], [{"Plan": PLAN, "Planning Time": 0.1, "Execution Time": 2.0}]]
+
+    class Conn:
+        async def fetchval(self, sql: str, *args):
+            return json.dumps(plans.pop(0))
+
+    @asynccontextmanager
+    async def admitted_connection(query_id: str):
+        yield Conn()
+
+    monkeypatch.setattr(slowlog, "admitted_connection", admitted_connection)
+    log = SlowQueryLog(threshold_ms=1, max_entries=5)
+
+    async def observe_twice() -> None:
+        for _ in range(2):
+            log.observe("aov_trend", VALUES, 1.0)
+            await asyncio.gather(*log._tasks)
+
+    with caplog.at_level(logging.ERROR, logger=slowlog.__name__):
+        run(observe_twice())
+    assert "slow-query plan capture for aov_trend" in caplog.text
+    assert [e["top_nodes"][0]["relation"] for e in log.entries] == ["orders"]
+    assert log.snapshot()["slow_counts"] == [{"query_id": "aov_trend", "param_shape": "date_span<=92d", "count": 2}]
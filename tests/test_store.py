@@ -0,0 +1,98 @@
+import sqlite3
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from uuid import UUID
+
+from app.queries.columnar import encode_columnar
+from app.queries.encoding import encode_payload
+from app.queries.store import ResultStore
+
+KEY = ("aov_trend", (("end_date", "2026-03-31"), ("start_date", "2026-01-01")))
+PAYLOAD = {
+    "query_id": "aov_trend",
+    "params": {"start_date": "2026-01-01", "end_date": "2026-03-31"},
+    "columns": ["day", "at", "revenue", "share", "n", "label", "id", "since"],
+    "rows": [
+        [
+            date(2026, 1, 1),
+            datetime(2026, 1, 1, 12, 30, tzinfo=timezone.utc),
+            Decimal("10.50"),
+            0.25,
+            3,
+            "a",
+            UUID(int=1),
+            time(9, 15),
+        ],
+        [date(2026, 1, 2), datetime(2026, 1, 2, 8), Decimal("NaN"), float("nan"), None, None, None, None],
+        [None, None, Decimal("7"), float("inf"), 5, "b", UUID(int=2), time(23, 59, 59, 500)],
+    ],
+    "row_count": 3,
+    "chart": {"type": "line"},
+}
+
+
+def _store(tmp_path, max_bytes: int = 1 << 20, ttl_s: float = 3600) -> ResultStore:
+    return ResultStore(str(tmp_path / "store.sqlite"), max_bytes, ttl_s)
+
+
+def _same(a: object, b: object) -> bool:
+    # NaN != NaN: compare the values' reprs
+    return repr(a) == repr(b)
+
+
+def test_store_round_trips_payload_values(tmp_path, run):
+    store = _store(tmp_path)
+    run(store.put(KEY, "v1", PAYLOAD))
+    # a fresh instance, as another worker or a restarted one
+    stored = run(_store(tmp_path).get(KEY, "v1"))
+    assert list(stored) == list(PAYLOAD)
+    assert _same(stored, PAYLOAD)
+    assert [type(v) for v in stored["rows"][0]] == [type(v) for v in PAYLOAD["rows"][0]]
+    assert encode_payload(stored) == encode_payload(PAYLOAD)
+    assert encode_columnar(stored) == encode_columnar(PAYLOAD)
+
+    empty = {**PAYLOAD, "rows": [], "row_count": 0}
+    run(store.put(KEY, "v2", empty))
+    assert run(store.get(KEY, "v2")) == empty
+
+
+def test_store_serves_only_the_data_version_within_ttl(tmp_path, run):
+    store = _store(tmp_path)
+    run(store.put(KEY, "v1", PAYLOAD))
+    assert run(store.get(KEY, "v2")) is None
+    assert run(store.get(KEY, "v1")) is not None
+    assert run(_store(tmp_path, ttl_s=0).get(KEY, "v1")) is None
+
+
+def test_store_evicts_least_recently_used(tmp_path, run):
+    store = _store(tmp_path)
+    keys = [("aov_trend", (("n", str(i)),)) for i in range(3)]
+    for key in keys:
+        run(store.put(key, "v1", PAYLOAD))
+    stats = run(store.stats())
+    assert stats["entries"] == 3
+    # room for two entries: the third put drops the oldest
+    store.max_bytes = stats["bytes"] * 2 // 3
+    run(store.put(keys[2], "v1", PAYLOAD))
+    assert [run(store.get(key, "v1")) is not None for key in keys] == [False, True, True]
+    assert run(store.stats())["evictions"] == 1
+
+
+def test_store_skips_values_it_cannot_type(tmp_path, run):
+    store = _store(tmp_path)
+    run(store.put(KEY, "v1", {**PAYLOAD, "rows": [[object()]]}))
+    run(store.put(KEY, "v2", {**PAYLOAD, "rows": [[Decimal("1")], [1.5]]}))
+    assert run(store.stats())["entries"] == 0
+
+
+def test_store_empties_a_file_in_an_older_format(tmp_path, run):
+    path = tmp_path / "store.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("create table results (key text primary key, payload blob)")
+    conn.execute("insert into results values ('k', x'80049500')")
+    conn.commit()
+    conn.close()
+    store = _store(tmp_path)
+    assert run(store.stats())["entries"] == 0
+    run(store.put(KEY, "v1", PAYLOAD))
+    assert run(store.get(KEY, "v1")) is not None
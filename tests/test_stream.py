@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from app.db.admission import GATES
+from app.db.pool import get_pool
+from app.db.replicas import NODES
+from app.main import app
+from app.queries.registry import QUERIES
+
+QUERY_ID = "aov_trend"
+
+
+async def _stream_disconnected_before_first_chunk(spec_version: str) -> None:
+    """Ask for QUERY_ID as a stream from a client that is gone once the connection is admitted.
+
+    2.4: the server's send raises OSError, so Starlette stops at the response start.
+    2.0: Starlette's disconnect listener cancels the body before it starts.
+    Either way the body never runs.
+    """
+    path = f"/api/query/{QUERY_ID}"
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"start_date=2025-01-01&end_date=2025-12-31&stream=true",
+        "headers": [(b"host", b"test")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("test", 80),
+    }
+    gate = GATES[QUERIES[QUERY_ID].cost_class]
+    requested = False
+
+    async def receive() -> dict:
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        while not gate.running:
+            await asyncio.sleep(0.001)
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        if spec_version >= "2.4":
+            raise OSError("client disconnected")
+
+    try:
+        await app(scope, receive, send)
+    except ClientDisconnect:
+        pass
+
+    pool = await get_pool(gate.cost_class.name)
+    assert gate.running == 0
+    assert all(not n.busy.get(gate.cost_class.name) for n in NODES.values())
+    assert pool.get_idle_size() == pool.get_size()
+
+
+@pytest.mark.parametrize("spec_version", ["2.4", "2.0"])
+def test_stream_admission_released_when_client_leaves_before_first_chunk(database, run, spec_version):
+    run(_stream_disconnected_before_first_chunk(spec_version))
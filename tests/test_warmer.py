@@ -0,0 +1,61 @@
+import asyncio
+
+from app.db.admission import GATES
+from app.db.pool import COST_CLASSES
+from app.queries.cache import result_cache
+from app.queries.registry import QUERIES
+from app.queries.warmer import CacheWarmer
+
+
+def test_warming_never_takes_more_than_its_share():
+    warmer = CacheWarmer([], interval_s=60, max_share=0.25)
+    for name, c in COST_CLASSES.items():
+        assert warmer.limits[name] <= c.pool_size * 0.25
+        assert (name in warmer.idle_only) == (warmer.limits[name] == 0)
+
+
+def test_idle_only_class_defers_while_queries_run(run):
+    cost_class = "heavy"
+    warmer = CacheWarmer([], interval_s=60, max_share=0.5 / COST_CLASSES[cost_class].pool_size)
+    assert cost_class in warmer.idle_only
+    query_id = next(q.id for q in QUERIES.values() if q.cost_class == cost_class)
+
+    gate = GATES[cost_class]
+    gate.running += 1
+    try:
+        # deferred before admission, so no database is needed
+        assert run(warmer._warm_one([query_id], {})) == ["deferred"]
+    finally:
+        gate.running -= 1
+
+
+def test_loop_retries_only_deferred_pairs(run, monkeypatch):
+    warmer = CacheWarmer([(qid, None, None) for qid in QUERIES], interval_s=3600, max_share=0.25)
+    deferred_query, deferrals = "shipping_sla", 2
+    calls: list[tuple[int, tuple[str, ...]]] = []
+
+    async def warm_one(query_ids: list[str], params: dict[str, str]) -> list[str]:
+        nonlocal deferrals
+        calls.append((warmer.runs, tuple(query_ids)))
+        if deferred_query in query_ids and deferrals:
+            deferrals -= 1
+            return ["deferred"] * len(query_ids)
+        return ["warmed"] * len(query_ids)
+
+    async def data_version() -> str:
+        return "v1"
+
+    monkeypatch.setattr(warmer, "_warm_one", warm_one)
+    monkeypatch.setattr(result_cache, "data_version", data_version)
+
+    async def loop_briefly() -> None:
+        try:
+            await asyncio.wait_for(warmer.loop(0.001), timeout=0.3)
+        except asyncio.TimeoutError:
+            pass
+
+    run(loop_briefly())
+    assert sorted(q for r, job in calls if r == 0 for q in job) == sorted(QUERIES)
+    # the startup run's deferral is retried alone until it's warmed, then nothing runs
+    assert [job for r, job in calls if r > 0] == [(deferred_query,), (deferred_query,)]
+    assert warmer.runs == 3